@@ -0,0 +1,246 @@
+"""
+Analisis asincrono de varios ficheros, para cuando el linaje lo responde un servicio de
+metadatos remoto y cada consulta es una espera de red. La extraccion se hace en un pool de
+procesos (jobs, uno por defecto) mientras el bucle de eventos consulta el
+linaje: como mucho max_concurrency consultas a la vez, una sola por objeto aunque lo pidan
+varios ficheros, y cada fichero se devuelve en cuanto tiene el riesgo de todos sus hallazgos.
+
+    async for sql_file, hallazgos, error in analyze_many_async(paths, lineage=HTTPLineageProvider(url)):
+        ...
+
+El servicio de metadatos responde GET /lineage?objeto=DB.SCHEMA.OBJETO con
+{"objeto": "...", "linaje": true|false}. benchmarks/async_lineage.py trae uno falso con
+latencia configurable para medir sin red.
+"""
+import asyncio
+import dataclasses
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlencode, urlsplit
+
+from catalog import CatalogSnapshot, get_catalog
+from ci_silver_gold import (Finding, ResultCache, StubLineageProvider, _analizar_archivo_aislado,
+                            _grafos_de_linaje, _lineage_key, _riesgo_fijo, _riesgo_por_linaje,
+                            _template_context)
+from lineage import LineageProvider
+from names import SYMBOLS
+from profiling import get_profiler
+
+# consultas de linaje en curso a la vez, por defecto
+_MAX_CONCURRENCY_DEFAULT = 32
+
+
+class AsyncLineageProvider:
+    """Interfaz asincrona de un proveedor de linaje; recibe nombres completos normalizados."""
+
+    async def lookup(self, obj_name: str) -> bool:
+        raise NotImplementedError
+
+    async def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        objects = list(dict.fromkeys(objects))
+        found = await asyncio.gather(*(self.lookup(obj_name) for obj_name in objects))
+        return dict(zip(objects, found))
+
+
+class ThreadedLineageProvider(AsyncLineageProvider):
+    """Adapta un LineageProvider sincrono: cada consulta se hace en un hilo aparte."""
+
+    def __init__(self, provider: LineageProvider):
+        self.provider = provider
+
+    async def lookup(self, obj_name: str) -> bool:
+        return (await self.lookup_many([obj_name])).get(obj_name, False)
+
+    async def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        return await asyncio.to_thread(self.provider.lookup_many, list(objects))
+
+
+class HTTPLineageProvider(AsyncLineageProvider):
+    """Cliente del servicio de metadatos por HTTP, con una conexion por consulta."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        parts = urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"URL del servicio de metadatos no valida: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+
+    async def lookup(self, obj_name: str) -> bool:
+        return await asyncio.wait_for(self._get(f"{self.prefix}/lineage?{urlencode({'objeto': obj_name})}"),
+                                      self.timeout)
+
+    async def _get(self, path: str) -> bool:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: close\r\n\r\n".encode("ascii"))
+            await writer.drain()
+            status_line = await reader.readline()
+            headers = await _read_headers(reader)
+            status = status_line.split()
+            if len(status) < 2 or status[1] != b"200":
+                raise OSError(f"el servicio de metadatos respondio {status_line.strip()[:80]!r}")
+            body = await _read_body(reader, headers)
+        finally:
+            writer.close()
+        return bool(json.loads(body)["linaje"])
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    """Cabeceras de una respuesta HTTP, con los nombres en minusculas."""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    """Cuerpo de una respuesta HTTP/1.1: por trozos (chunked), con Content-Length o hasta el cierre."""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = bytearray()
+        while True:
+            # tamaño en hexadecimal, quizas con extensiones tras ';'
+            size = int((await reader.readline()).split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # trailers opcionales hasta la linea vacia
+                await _read_headers(reader)
+                return bytes(body)
+            body += await reader.readexactly(size)
+            await reader.readline()
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+    return await reader.read()
+
+
+class CoalescingLineage:
+    """
+    Delante de un proveedor asincrono: limita las consultas en curso a max_concurrency y
+    agrupa las de un mismo objeto (id de names.SYMBOLS), que esperan la misma respuesta.
+    Las respuestas se recuerdan durante el analisis; si una consulta falla se olvida para
+    que pueda repetirse.
+    """
+
+    def __init__(self, provider: AsyncLineageProvider, max_concurrency: int = _MAX_CONCURRENCY_DEFAULT):
+        self.provider = provider
+        self.peticiones = 0
+        self.agrupadas = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._consultas: Dict[int, "asyncio.Future[bool]"] = {}
+
+    async def lookup(self, symbol: int) -> bool:
+        if not SYMBOLS.name(symbol):
+            # hallazgo sin objeto (p. ej. un nombre dinamico sin resolver): no hay nada que consultar
+            return False
+        consulta = self._consultas.get(symbol)
+        if consulta is None:
+            consulta = self._consultas[symbol] = asyncio.ensure_future(self._fetch(symbol))
+        else:
+            self.agrupadas += 1
+        return await consulta
+
+    async def _fetch(self, symbol: int) -> bool:
+        async with self._semaphore:
+            self.peticiones += 1
+            try:
+                return await self.provider.lookup(SYMBOLS.name(symbol))
+            except BaseException:
+                del self._consultas[symbol]
+                raise
+
+
+async def _puntuar(hallazgos: List[Finding], lineage: CoalescingLineage,
+                   catalog: Optional[CatalogSnapshot] = None) -> None:
+    """Asigna el riesgo a los hallazgos de un fichero, con las consultas de linaje en paralelo."""
+    pendientes = []
+    for i, hallazgo in enumerate(hallazgos):
+        riesgo = _riesgo_fijo(hallazgo, catalog)
+        if riesgo is None:
+            pendientes.append((i, _lineage_key(hallazgo)))
+        else:
+            hallazgos[i] = dataclasses.replace(hallazgo, riesgo=riesgo)
+    if not pendientes:
+        return
+
+    objetos = list(dict.fromkeys(objeto for _, objeto in pendientes))
+    linaje = dict(zip(objetos, await asyncio.gather(*(lineage.lookup(objeto) for objeto in objetos))))
+    for i, objeto in pendientes:
+        hallazgos[i] = dataclasses.replace(hallazgos[i], riesgo=_riesgo_por_linaje(hallazgos[i], linaje[objeto]))
+
+
+async def analyze_many_async(paths: Iterable[str], template_vars: Dict[str, str] = None,
+                             lineage: Union[AsyncLineageProvider, LineageProvider, None] = None,
+                             max_concurrency: int = _MAX_CONCURRENCY_DEFAULT, jobs: int = 1,
+                             cache: Optional[ResultCache] = None, streaming: bool = False,
+                             graph_root: Optional[str] = None
+                             ) -> AsyncIterator[Tuple[str, Optional[List[Finding]], Optional[str]]]:
+    """
+    Analiza los ficheros y devuelve (fichero, hallazgos con riesgo, error) en el orden en que
+    terminan. lineage puede ser un proveedor asincrono o uno sincrono (se consulta en hilos);
+    por defecto, el mismo que la linea de comandos (catalogo y grafo de dependencias de los
+    ficheros analizados y de graph_root), que solo se consulta cuando se han extraido todos.
+    """
+    paths = list(paths)
+    template_ctx = _template_context(template_vars)
+    loop = asyncio.get_running_loop()
+    prof = get_profiler()
+    # la extraccion va siempre a otro proceso, tambien con jobs=1: captura lo que imprime
+    # cambiando sys.stdout, y en un hilo de este proceso se llevaria tambien lo que imprime
+    # el bucle de eventos mientras tanto
+    executor = ProcessPoolExecutor(max_workers=max(jobs, 1))
+
+    async def extraer(sql_file: str) -> Tuple[str, Optional[List[Finding]], Optional[str]]:
+        try:
+            salida, hallazgos, error, medidas = await loop.run_in_executor(
+                executor, _analizar_archivo_aislado, sql_file, template_ctx, streaming, cache)
+        except Exception as e:
+            return sql_file, None, str(e)
+        print(salida, end="")
+        if medidas is not None:
+            prof.merge(medidas)
+        return sql_file, hallazgos, error
+
+    async def puntuar(extraccion: "asyncio.Future") -> Tuple[str, Optional[List[Finding]], Optional[str]]:
+        sql_file, hallazgos, error = await extraccion
+        if error is not None:
+            return sql_file, None, error
+        try:
+            await _puntuar(hallazgos, coalescer, catalog)
+        except Exception as e:
+            return sql_file, None, str(e)
+        return sql_file, hallazgos, None
+
+    extracciones = [asyncio.ensure_future(extraer(sql_file)) for sql_file in paths]
+    tareas: List["asyncio.Future"] = []
+    coalescer = None
+    try:
+        if lineage is None:
+            # el grafo necesita las dependencias de todos los ficheros antes de la primera consulta
+            extraidos = {os.path.abspath(sql_file): hallazgos
+                         for sql_file, hallazgos, error in await asyncio.gather(*extracciones) if error is None}
+        # el snapshot del catalogo se toma una vez: de el sale el tamaño de los warehouses. Se
+        # toma antes que el del proveedor por defecto para que este sea el mas reciente
+        catalog = get_catalog()
+        if lineage is None:
+            lineage = StubLineageProvider(_grafos_de_linaje(extraidos, template_ctx, graph_root))
+        if isinstance(lineage, LineageProvider):
+            lineage = ThreadedLineageProvider(lineage)
+        coalescer = CoalescingLineage(lineage, max_concurrency)
+
+        tareas = [asyncio.ensure_future(puntuar(extraccion)) for extraccion in extracciones]
+        for tarea in asyncio.as_completed(tareas):
+            yield await tarea
+    finally:
+        for tarea in extracciones + tareas:
+            tarea.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        if coalescer is not None:
+            prof.count("linaje.peticiones", coalescer.peticiones)
+            prof.count("linaje.agrupadas", coalescer.agrupadas)
+        if cache is not None:
+            cache.evict()
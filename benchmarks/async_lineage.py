@@ -0,0 +1,205 @@
+"""
+Rendimiento del analisis con el linaje en un servicio de metadatos remoto, sin red.
+
+Levanta un servicio de metadatos falso en localhost (GET /lineage?objeto=..., con una
+latencia fija por consulta) y analiza los mismos ficheros de dos formas:
+
+    - sincrona: analizar_multiples_archivos con un proveedor que hace una consulta HTTP por
+      objeto, una detras de otra (lo que pasaria con la cola de RiskScorer);
+    - asincrona: async_analysis.analyze_many_async con consultas en paralelo y agrupadas.
+
+    python benchmarks/async_lineage.py [--latency-ms 50] [--files 40] [--concurrency 32] [--chunked]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+import ci_silver_gold  # noqa: E402
+from async_analysis import HTTPLineageProvider, analyze_many_async  # noqa: E402
+from generate import generar_script  # noqa: E402
+from lineage import LineageProvider  # noqa: E402
+
+
+class FakeMetadataServer:
+    """
+    Servicio de metadatos falso en un hilo con su propio bucle de eventos. Responde cada
+    consulta tras latency segundos; un objeto tiene linaje segun un hash de su nombre, de
+    modo que las respuestas son las mismas en todas las ejecuciones. Con chunked responde
+    con Transfer-Encoding: chunked en lugar de Content-Length.
+    """
+
+    def __init__(self, latency: float = 0.05, chunked: bool = False):
+        self.latency = latency
+        self.chunked = chunked
+        self.peticiones = 0
+        self.max_en_curso = 0
+        self.url: Optional[str] = None
+        self._en_curso = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @staticmethod
+    def tiene_linaje(obj_name: str) -> bool:
+        return zlib.crc32(obj_name.encode("utf-8")) % 2 == 0
+
+    def start(self) -> str:
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop).result()
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    def stop(self) -> None:
+        async def cerrar() -> None:
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(cerrar(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.peticiones += 1
+        self._en_curso += 1
+        self.max_en_curso = max(self.max_en_curso, self._en_curso)
+        try:
+            request_line = (await reader.readline()).decode("ascii").split()
+            while (await reader.readline()).strip():
+                pass
+            await asyncio.sleep(self.latency)
+            objeto = parse_qs(urlsplit(request_line[1]).query).get("objeto", [""])[0] if len(request_line) > 1 else ""
+            if objeto:
+                status, body = "200 OK", json.dumps({"objeto": objeto, "linaje": self.tiene_linaje(objeto)})
+            else:
+                status, body = "400 Bad Request", json.dumps({"error": "falta el parametro objeto"})
+            if self.chunked:
+                # el cuerpo en dos trozos, como lo enviaria un servidor que no conoce su longitud
+                mitad = len(body) // 2
+                framing = "Transfer-Encoding: chunked"
+                body = "".join(f"{len(trozo):x}\r\n{trozo}\r\n" for trozo in (body[:mitad], body[mitad:])) + "0\r\n\r\n"
+            else:
+                framing = f"Content-Length: {len(body)}"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                         f"{framing}\r\nConnection: close\r\n\r\n{body}".encode("utf-8"))
+            await writer.drain()
+        finally:
+            self._en_curso -= 1
+            writer.close()
+
+
+class BlockingHTTPLineageProvider(LineageProvider):
+    """Proveedor sincrono del mismo servicio: una consulta HTTP por objeto, en serie."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        result = {}
+        for obj_name in objects:
+            if not obj_name:
+                result[obj_name] = False
+                continue
+            with urllib.request.urlopen(f"{self.url}/lineage?{urlencode({'objeto': obj_name})}") as response:
+                result[obj_name] = bool(json.load(response)["linaje"])
+        return result
+
+
+def _preparar_ficheros(work_dir: Path, files: int, size: int, seed: int) -> List[str]:
+    paths = []
+    for i in range(files):
+        path = work_dir / f"part_{i:03d}.sql"
+        if not path.exists():
+            generar_script(str(path), size, seed + i)
+        paths.append(str(path))
+    return paths
+
+
+def medir_sincrono(paths: List[str], url: str) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ci_silver_gold.analizar_multiples_archivos(paths, {"environment": "DEV"}, jobs=1,
+                                                   lineage_provider=BlockingHTTPLineageProvider(url))
+    return time.perf_counter() - start
+
+
+async def _analizar_async(paths: List[str], url: str, concurrency: int) -> int:
+    hallazgos = 0
+    async for _, resultado, error in analyze_many_async(paths, {"environment": "DEV"},
+                                                        lineage=HTTPLineageProvider(url),
+                                                        max_concurrency=concurrency):
+        if error is not None:
+            raise RuntimeError(error)
+        hallazgos += len(resultado)
+    return hallazgos
+
+
+def medir_asincrono(paths: List[str], url: str, concurrency: int) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(_analizar_async(paths, url, concurrency))
+    return time.perf_counter() - start
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analisis con linaje remoto: sincrono frente a asincrono")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="latencia de cada consulta al servicio")
+    parser.add_argument("--files", type=int, default=40, help="numero de ficheros a analizar")
+    parser.add_argument("--size-kb", type=int, default=8, help="tamaño de cada fichero, en KB")
+    parser.add_argument("--concurrency", type=int, default=32, help="consultas en paralelo en el modo asincrono")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-sync", action="store_true", help="no mide el modo sincrono (es el lento)")
+    parser.add_argument("--chunked", action="store_true",
+                        help="el servicio responde con Transfer-Encoding: chunked")
+    parser.add_argument("--work-dir", default=None, help="directorio para los ficheros generados")
+    return parser.parse_args(argv)
+
+
+def _ejecutar(args: argparse.Namespace, work_dir: Path) -> None:
+    paths = _preparar_ficheros(work_dir, args.files, args.size_kb * 1024, args.seed)
+    server = FakeMetadataServer(args.latency_ms / 1000, args.chunked)
+    url = server.start()
+    try:
+        print(f"{len(paths)} ficheros, latencia {args.latency_ms:.0f} ms por consulta")
+        if not args.skip_sync:
+            segundos = medir_sincrono(paths, url)
+            print(f"   sincrono:  {segundos:7.2f} s  {len(paths) / segundos:7.1f} ficheros/s"
+                  f"  {server.peticiones} consultas")
+        server.peticiones = server.max_en_curso = 0
+        segundos = medir_asincrono(paths, url, args.concurrency)
+        print(f"   asincrono: {segundos:7.2f} s  {len(paths) / segundos:7.1f} ficheros/s"
+              f"  {server.peticiones} consultas, hasta {server.max_en_curso} a la vez")
+    finally:
+        server.stop()
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    if args.work_dir:
+        Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+        _ejecutar(args, Path(args.work_dir))
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _ejecutar(args, Path(tmp_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
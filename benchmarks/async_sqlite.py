@@ -0,0 +1,123 @@
+"""
+Comprobacion del analisis asincrono con un proveedor de linaje sincrono real.
+
+Crea una base de linaje sqlite (SQLiteLineageProvider) con los objetos de los scripts
+indicados (por defecto sql_scripts/ y un script sintetico) y analiza los ficheros con
+async_analysis.analyze_many_async, que consulta el proveedor desde hilos del bucle de
+eventos, y con analizar_sql. Termina con codigo 1 si algun fichero falla o si el riesgo de
+algun hallazgo no coincide.
+
+    python benchmarks/async_sqlite.py [RUTA ...] [--generate 64KB] [--jobs 2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import sys
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+import ci_silver_gold  # noqa: E402
+from async_analysis import analyze_many_async  # noqa: E402
+from generate import generar_script, parse_size  # noqa: E402
+from lineage import LineageProvider, SQLiteLineageProvider  # noqa: E402
+
+TEMPLATE_VARS = {"environment": "DEV"}
+
+
+class _ObjetosConsultados(LineageProvider):
+    """
+    Anota los objetos por los que se pregunta; la mitad tienen linaje, segun un hash del
+    nombre. Un hallazgo sin objeto ("") no tiene linaje, como en CoalescingLineage.
+    """
+
+    def __init__(self):
+        self.linaje: Dict[str, bool] = {}
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        for obj_name in objects:
+            self.linaje[obj_name] = bool(obj_name) and zlib.crc32(obj_name.encode("utf-8")) % 2 == 0
+        return {obj_name: self.linaje[obj_name] for obj_name in objects}
+
+
+def _riesgos(hallazgos: List[ci_silver_gold.Finding]) -> List[Tuple[str, str, Optional[str]]]:
+    return [(h.accion, h.objeto, h.riesgo) for h in hallazgos]
+
+
+async def _analizar_async(paths: List[str], provider: LineageProvider, jobs: int) -> Dict[str, object]:
+    resultados: Dict[str, object] = {}
+    async for sql_file, hallazgos, error in analyze_many_async(paths, TEMPLATE_VARS, lineage=provider, jobs=jobs):
+        resultados[sql_file] = error if error is not None else _riesgos(hallazgos)
+    return resultados
+
+
+def comprobar(paths: List[str], db_path: str, jobs: int) -> List[str]:
+    """Diferencias entre el analisis asincrono y el sincrono con la misma base de linaje."""
+    consultados = _ObjetosConsultados()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in paths:
+            ci_silver_gold.analizar_sql(path, TEMPLATE_VARS, lineage_provider=consultados)
+    with contextlib.closing(SQLiteLineageProvider.create(db_path)) as base:
+        base.store(consultados.linaje)
+
+    provider = SQLiteLineageProvider(db_path)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            esperados = {path: _riesgos(ci_silver_gold.analizar_sql(path, TEMPLATE_VARS, lineage_provider=provider)[1])
+                         for path in paths}
+            obtenidos = asyncio.run(_analizar_async(paths, provider, jobs))
+    finally:
+        provider.close()
+
+    print(f"{len(paths)} ficheros, {len(consultados.linaje)} objetos en la base de linaje")
+    diferencias = []
+    for path in paths:
+        obtenido = obtenidos.get(path)
+        if isinstance(obtenido, str):
+            diferencias.append(f"{path}: error {obtenido}")
+        elif obtenido != esperados[path]:
+            diferencias.append(f"{path}: riesgos distintos de analizar_sql")
+    return diferencias
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analisis asincrono con una base de linaje sqlite")
+    parser.add_argument("rutas", nargs="*", default=[str(BENCH_DIR.parent / "sql_scripts")],
+                        help="scripts o directorios a analizar (por defecto sql_scripts/)")
+    parser.add_argument("--generate", default="64KB", metavar="TAMAÑO",
+                        help="añade un script sintetico de ese tamaño (0 para ninguno)")
+    parser.add_argument("--jobs", type=int, default=2, help="procesos de extraccion del analisis asincrono")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for ruta in args.rutas:
+            path = Path(ruta)
+            paths.extend(sorted(str(p) for p in path.rglob("*.sql")) if path.is_dir() else [str(path)])
+        if parse_size(args.generate):
+            sintetico = str(Path(tmp_dir) / "sintetico.sql")
+            generar_script(sintetico, parse_size(args.generate), args.seed)
+            paths.append(sintetico)
+        diferencias = comprobar(paths, str(Path(tmp_dir) / "linaje.db"), args.jobs)
+
+    if diferencias:
+        print(f"   {len(diferencias)} ficheros con diferencias")
+        for diferencia in diferencias[:10]:
+            print(f"      {diferencia}")
+        return 1
+    print("   sin diferencias")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
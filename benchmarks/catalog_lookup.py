@@ -0,0 +1,88 @@
+"""
+Latencia de las consultas al snapshot del catalogo (catalog.py).
+
+Genera un export sintetico con N objetos (la mitad con una vista que depende de ellos) y
+algunos warehouses, lo importa y mide el tiempo medio por consulta de linaje, la primera
+vez (busqueda en sqlite) y las siguientes (en memoria), y por consulta de warehouse.
+
+    python benchmarks/catalog_lookup.py [--objects 100000] [--work-dir DIR]
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from catalog import CatalogSnapshot, importar_catalogo  # noqa: E402
+
+
+def _generar_export(path: Path, objects: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    nombres = [f"DB_{i % 7}.SCH_{i % 31}.T_{i}" for i in range(objects)]
+    dependencias = [[n, n.replace(".T_", ".V_")] for n in nombres if rng.random() < 0.5]
+    warehouses = {f"WH_{i}": rng.choice(["X-Small", "Small", "Medium", "Large"]) for i in range(50)}
+    path.write_text(json.dumps({"objetos": nombres, "dependencias": dependencias, "warehouses": warehouses}))
+    return nombres
+
+
+def _us_por_consulta(fn: Callable[[str], object], claves: List[str]) -> float:
+    start = time.perf_counter()
+    for clave in claves:
+        fn(clave)
+    return (time.perf_counter() - start) / len(claves) * 1e6
+
+
+def medir(objects: int, work_dir: Path, seed: int = 0) -> Dict[str, float]:
+    export = work_dir / "catalogo.json"
+    db_path = work_dir / "catalogo.db"
+    nombres = _generar_export(export, objects, seed)
+
+    start = time.perf_counter()
+    importar_catalogo([export], db_path)
+    import_s = time.perf_counter() - start
+
+    claves = random.Random(seed).sample(nombres, min(len(nombres), 20_000))
+    snapshot = CatalogSnapshot(db_path)
+    try:
+        return {
+            "importacion_s": import_s,
+            "linaje_primera_us": _us_por_consulta(snapshot.has_lineage, claves),
+            "linaje_repetida_us": _us_por_consulta(snapshot.has_lineage, claves),
+            "warehouse_us": _us_por_consulta(snapshot.is_warehouse_xs, [f"WH_{i % 60}" for i in range(20_000)]),
+        }
+    finally:
+        snapshot.close()
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Latencia de las consultas al snapshot del catalogo")
+    parser.add_argument("--objects", type=int, default=100_000, help="objetos del catalogo sintetico")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="directorio para el export y la base generados")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    if args.work_dir:
+        Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+        resultados = medir(args.objects, Path(args.work_dir), args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            resultados = medir(args.objects, Path(tmp_dir), args.seed)
+
+    print(f"Catalogo de {args.objects} objetos importado en {resultados['importacion_s']:.2f} s")
+    print(f"   linaje, primera consulta: {resultados['linaje_primera_us']:8.2f} us")
+    print(f"   linaje, repetida:         {resultados['linaje_repetida_us']:8.2f} us")
+    print(f"   tamaño de warehouse:      {resultados['warehouse_us']:8.2f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,191 @@
+"""
+Comprobacion diferencial de las reescrituras del analizador frente a sus versiones anteriores.
+
+Recorre las sentencias de los scripts indicados (por defecto sql_scripts/), incluidas las de
+los cuerpos de procedimientos y bloques y los literales SQL de sus variables, y compara:
+
+    - normalize_dynamic_sql (una pasada de tokens) con el bucle de regex original;
+    - clasificar_sentencia (trie de palabras clave) con el recorrido lineal original de
+      STATEMENT_HANDLERS con re.match sobre la sentencia en mayusculas.
+
+Termina con codigo 1 si alguna sentencia da un resultado distinto. Las unicas diferencias
+esperadas son las intencionadas de la reescritura: el bucle anterior paraba a las 30
+sustituciones y podia volver a leer como variable un VAR_X ya sustituido (VAR_VAR_X).
+
+    python benchmarks/differential.py [RUTA ...] [--generate 1MB]
+"""
+import argparse
+import re
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+import ci_silver_gold  # noqa: E402
+from generate import generar_script, parse_size  # noqa: E402
+
+# variables con las que se normaliza; incluyen nombres que aparecen en los scripts de ejemplo
+TEMPLATE_VARS = {"environment": "DEV", "env": "PRO", "region": "EU", "project": "ECI"}
+
+
+def normalize_anterior(sql_string: str, template_vars: Dict[str, str]) -> str:
+    """normalize_dynamic_sql tal como estaba antes de la reescritura en una pasada."""
+    vars_lower = {k.lower(): v for k, v in template_vars.items()}
+
+    result = sql_string
+    max_iterations = 30
+    changed = True
+    iteration = 0
+
+    patterns = [
+        # texto.|| var ||.texto  --> texto.valor.texto
+        (r"([A-Za-z0-9_]+)\.\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\.([A-Za-z0-9_]+)",
+         lambda m, v: f"{m.group(1)}.{v(m.group(2))}.{m.group(3)}"),
+        # texto.|| valor --> texto.valor
+        (r"([A-Za-z0-9_]+)\.\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\b",
+         lambda m, v: f"{m.group(1)}.{v(m.group(2))}"),
+        # valor ||.texto --> valor.texto
+        (r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\.([A-Za-z0-9_]+)",
+         lambda m, v: f"{v(m.group(1))}.{m.group(2)}"),
+        # 'texto' || var || 'texto' --> textovalortexto
+        (r"'([^']*)'\s*\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\s*'([^']*)'",
+         lambda m, v: f"'{m.group(1)}{v(m.group(2))}{m.group(3)}'"),
+        # texto' || var || 'texto --> textovalortexto
+        (r"([A-Za-z0-9_]+)'(\s*\|\|\s*)([A-Za-z_][A-Za-z0-9_]*)(\s*\|\|\s*)'([^']*)'",
+         lambda m, v: f"{m.group(1)}{v(m.group(3))}{m.group(5)}"),
+        # 'texto' || var --> textovalor
+        (r"'([^']*)'\s*\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\b",
+         lambda m, v: f"'{m.group(1)}{v(m.group(2))}'"),
+        # var || 'texto' --> valortexto
+        (r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\s*'([^']*)'",
+         lambda m, v: f"'{v(m.group(1))}{m.group(2)}'"),
+    ]
+
+    def valor(var_name: str) -> str:
+        return vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
+
+    while changed and iteration < max_iterations:
+        changed = False
+        iteration += 1
+        for pattern, combine in patterns:
+            match = re.search(pattern, result, re.IGNORECASE)
+            if match:
+                result = result[:match.start()] + combine(match, valor) + result[match.end():]
+                changed = True
+                break
+
+    return result
+
+
+# recorrido lineal original: la primera regex que encaja con la sentencia en mayusculas
+_HANDLERS_ANTERIORES: List[Tuple[str, Callable]] = [
+    (r"^USE\s+", ci_silver_gold._handle_use),
+    (r"^CREATE", ci_silver_gold._handle_create),
+    (r"^ALTER", ci_silver_gold._handle_alter),
+    (r"^DROP", ci_silver_gold._handle_drop),
+    (r"^UNDROP", ci_silver_gold._handle_undrop),
+    (r"^TRUNCATE\s+TABLE", ci_silver_gold._handle_truncate),
+    (r"^INSERT\s+INTO", ci_silver_gold._handle_insert),
+    (r"^MERGE\s+INTO", ci_silver_gold._handle_merge),
+    (r"^DELETE\s+FROM", ci_silver_gold._handle_delete),
+    (r"^GRANT\s+", ci_silver_gold._handle_grant),
+    (r"^REVOKE\s+", ci_silver_gold._handle_revoke),
+    (r"^EXECUTE\s+", ci_silver_gold._handle_execute),
+    (r"^CALL\s+", ci_silver_gold._handle_call),
+]
+
+
+def clasificar_anterior(stmt_clean: str) -> Optional[Callable]:
+    stmt_upper = stmt_clean.upper()
+    for pattern, handler in _HANDLERS_ANTERIORES:
+        if re.match(pattern, stmt_upper):
+            return handler
+    return None
+
+
+def _iter_sentencias(path: str, template_ctx: "ci_silver_gold.TemplateContext") -> Iterator[Tuple[str, str]]:
+    """(origen, sentencia) de un script, sin normalizar: las del fichero y las de sus bloques."""
+    for stmt in ci_silver_gold.iter_statements(path):
+        stmt, _ = template_ctx.resolve(stmt.strip(), warn=False)
+        yield "sentencia", stmt
+        stmt_clean = ci_silver_gold.normalize_dynamic_sql(stmt, template_ctx)
+        if ci_silver_gold._CREATE_PROCEDURE_PREFIX.match(stmt_clean):
+            body = ci_silver_gold.extract_procedure_body(stmt_clean)
+        elif ci_silver_gold._ANONYMOUS_BLOCK_PREFIX.match(stmt_clean):
+            body = stmt_clean
+        else:
+            continue
+        if body:
+            for origen, block_stmt in ci_silver_gold.scan_procedure_body(body):
+                yield origen, block_stmt
+
+
+def _iter_scripts(rutas: List[str]) -> Iterator[str]:
+    for ruta in rutas:
+        path = Path(ruta)
+        if path.is_dir():
+            yield from sorted(str(p) for p in path.rglob("*.sql"))
+        else:
+            yield str(path)
+
+
+def comparar(rutas: List[str]) -> Dict[str, List[str]]:
+    """Compara ambas parejas de implementaciones y devuelve las diferencias por comprobacion."""
+    template_ctx = ci_silver_gold.TemplateContext(TEMPLATE_VARS)
+    diferencias: Dict[str, List[str]] = {"normalize_dynamic_sql": [], "clasificar_sentencia": []}
+    total = 0
+    for script in _iter_scripts(rutas):
+        for origen, stmt in _iter_sentencias(script, template_ctx):
+            total += 1
+            antes = normalize_anterior(stmt, TEMPLATE_VARS)
+            ahora = ci_silver_gold.normalize_dynamic_sql(stmt, template_ctx)
+            if antes != ahora:
+                diferencias["normalize_dynamic_sql"].append(f"{script} ({origen}): {antes[:80]!r} != {ahora[:80]!r}")
+            handler_antes = clasificar_anterior(ahora)
+            handler_ahora = ci_silver_gold.clasificar_sentencia(ahora)
+            if handler_antes is not handler_ahora:
+                nombre = lambda h: h.__name__ if h else None  # noqa: E731
+                diferencias["clasificar_sentencia"].append(
+                    f"{script} ({origen}): {nombre(handler_antes)} != {nombre(handler_ahora)} en {ahora[:60]!r}")
+    print(f"{total} sentencias comparadas")
+    return diferencias
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Comparacion con las implementaciones anteriores")
+    parser.add_argument("rutas", nargs="*", default=[str(BENCH_DIR.parent / "sql_scripts")],
+                        help="scripts o directorios a recorrer (por defecto sql_scripts/)")
+    parser.add_argument("--generate", default=None, metavar="TAMAÑO",
+                        help="añade un script sintetico de ese tamaño (ver generate.py)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rutas = list(args.rutas)
+        if args.generate:
+            sintetico = str(Path(tmp_dir) / "sintetico.sql")
+            generar_script(sintetico, parse_size(args.generate), args.seed)
+            rutas.append(sintetico)
+        diferencias = comparar(rutas)
+
+    codigo = 0
+    for comprobacion, lista in diferencias.items():
+        if not lista:
+            print(f"   {comprobacion}: sin diferencias")
+            continue
+        codigo = 1
+        print(f"   {comprobacion}: {len(lista)} diferencias")
+        for diferencia in lista[:10]:
+            print(f"      {diferencia}")
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
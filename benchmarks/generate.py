@@ -0,0 +1,166 @@
+"""
+Generador determinista de scripts Snowflake sinteticos para los benchmarks.
+
+Cada bloque del script cambia de contexto con USE, incluye una sentencia por cada accion
+de RIESGO (en orden aleatorio segun la semilla), procedimientos $$ con SQL dinamico
+concatenado con || y placeholders {{ environment }}.
+
+    python benchmarks/generate.py salida.sql --size 100MB --seed 1
+"""
+import argparse
+import random
+import re
+from typing import Dict, List, Tuple
+
+
+# sentencia de ejemplo por cada accion de RIESGO. @N es un contador, @DB y @SC la
+# database y el schema del bloque
+PLANTILLAS: Dict[str, str] = {
+    "CREATE_TABLE": "CREATE TABLE T_@N (ID NUMBER, NAME VARCHAR, TS TIMESTAMP_NTZ);",
+    "DROP_TABLE": "DROP TABLE IF EXISTS T_@N;",
+    "CREATE_OR_REPLACE_TABLE": "CREATE OR REPLACE TABLE @DB.@SC.T_@N AS\nSELECT ID, NAME FROM DB_BRO_{{ environment }}.RAW.SRC_@N;",
+    "CREATE_OR_ALTER_TABLE": "CREATE OR ALTER TABLE @SC.T_@N (ID NUMBER, NAME VARCHAR);",
+    "UNDROP_TABLE": "UNDROP TABLE T_@N;",
+    "TRUNCATE_TABLE": "TRUNCATE TABLE IF EXISTS @SC.T_@N;",
+    "ALTER_TABLE_NOT_COLUMNS": "ALTER TABLE T_@N RENAME TO T_@N_OLD;",
+    "INSERT_VALUES": "INSERT INTO T_@N (ID, NAME) VALUES (@N, 'fila @N');",
+    "DELETE_VALUES": "DELETE FROM @DB.@SC.T_@N WHERE ID < @N;",
+    "MERGE_VALUES": "MERGE INTO T_@N T USING S_@N S ON T.ID = S.ID\nWHEN MATCHED THEN UPDATE SET T.NAME = S.NAME\nWHEN NOT MATCHED THEN INSERT (ID, NAME) VALUES (S.ID, S.NAME);",
+    "CREATE_DATABASE": "CREATE DATABASE DB_@N;",
+    "CREATE_OR_REPLACE_DATABASE": "CREATE OR REPLACE DATABASE DB_@N;",
+    "CREATE_OR_ALTER_DATABASE": "CREATE OR ALTER DATABASE DB_@N;",
+    "ALTER_DATABASE": "ALTER DATABASE DB_@N SET DATA_RETENTION_TIME_IN_DAYS = 7;",
+    "DROP_DATABASE": "DROP DATABASE IF EXISTS DB_@N;",
+    "UNDROP_DATABASE": "UNDROP DATABASE DB_@N;",
+    "CREATE_SCHEMA": "CREATE SCHEMA SC_@N;",
+    "CREATE_OR_REPLACE_SCHEMA": "CREATE OR REPLACE SCHEMA @DB.SC_@N;",
+    "CREATE_OR_ALTER_SCHEMA": "CREATE OR ALTER SCHEMA SC_@N;",
+    "ALTER_SCHEMA": "ALTER SCHEMA SC_@N RENAME TO SC_@N_OLD;",
+    "DROP_SCHEMA": "DROP SCHEMA IF EXISTS SC_@N;",
+    "UNDROP_SCHEMA": "UNDROP SCHEMA SC_@N;",
+    "CREATE_WAREHOUSE": "CREATE WAREHOUSE WH_@N WITH WAREHOUSE_SIZE = 'XSMALL';",
+    "CREATE_OR_REPLACE_WAREHOUSE": "CREATE OR REPLACE WAREHOUSE WH_@N WITH WAREHOUSE_SIZE = 'XSMALL';",
+    "ALTER_WAREHOUSE": "ALTER WAREHOUSE WH_@N SET WAREHOUSE_SIZE = 'SMALL';",
+    "CREATE_OR_ALTER_WAREHOUSE": "CREATE OR ALTER WAREHOUSE WH_@N;",
+    "DROP_WAREHOUSE": "DROP WAREHOUSE IF EXISTS WH_@N;",
+    "USE_WAREHOUSE": "USE WAREHOUSE WH_@N;",
+    "CREATE_SHARE": "CREATE SHARE SH_@N;",
+    "ALTER_SHARE": "ALTER SHARE SH_@N ADD ACCOUNTS = ORG.ACC_@N;",
+    "DROP_SHARE": "DROP SHARE SH_@N;",
+    "CREATE_VIEW": "CREATE VIEW V_@N AS\nSELECT ID, NAME FROM T_@N WHERE ID > 0;",
+    "CREATE_OR_ALTER_VIEW": "CREATE OR ALTER VIEW V_@N AS SELECT ID FROM T_@N;",
+    "ALTER_VIEW": "ALTER VIEW V_@N SET COMMENT = 'vista @N';",
+    "CREATE_OR_REPLACE_VIEW": "CREATE OR REPLACE VIEW @DB.@SC.V_@N AS\nSELECT T.ID, S.NAME\nFROM T_@N T\nJOIN S_@N S ON T.ID = S.ID;",
+    "DROP_VIEW": "DROP VIEW IF EXISTS V_@N;",
+    "CREATE_TAG": "CREATE TAG TG_@N;",
+    "DROP_TAG": "DROP TAG TG_@N;",
+    "CREATE_OR_REPLACE_TAG": "CREATE OR REPLACE TAG TG_@N;",
+    "CREATE_OR_ALTER_TAG": "CREATE OR ALTER TAG TG_@N;",
+    "UNDROP_TAG": "UNDROP TAG TG_@N;",
+    "ALTER_TAG": "ALTER TAG TG_@N SET COMMENT = 'tag @N';",
+    "ALTER_TABLE_ADD_COLUMN": "ALTER TABLE T_@N ADD COLUMN C_@N VARCHAR;",
+    "ALTER_TABLE_DROP_COLUMN": "ALTER TABLE @SC.T_@N DROP COLUMN C_@N;",
+    "ALTER_TABLE_MODIFY_COLUMN_TYPE": "ALTER TABLE T_@N ALTER COLUMN C_@N SET DATA TYPE NUMBER(38, 0);",
+    "GRANT_PRIVILEGE": "GRANT SELECT ON TABLE T_@N TO ROLE R_@N;",
+    "REVOKE_PRIVILEGE": "REVOKE SELECT ON TABLE T_@N FROM ROLE R_@N;",
+    "CREATE_ACCESS_POLICY": "CREATE ACCESS_POLICY AP_@N AS (V VARCHAR) RETURNS BOOLEAN -> TRUE;",
+    "ALTER_ACCESS_POLICY": "ALTER ACCESS_POLICY AP_@N SET COMMENT = 'politica @N';",
+    "DROP_ACCESS_POLICY": "DROP ACCESS_POLICY AP_@N;",
+    "USE_DATABASE": "USE DATABASE DB_SIL_{{ environment }};",
+    "USE_SCHEMA": "USE SCHEMA SC_@N;",
+    "CREATE_PROCEDURE": (
+        "CREATE PROCEDURE SP_@N()\nRETURNS VARCHAR\nLANGUAGE SQL\nAS\n$$\nBEGIN\n"
+        "    INSERT INTO T_@N SELECT * FROM S_@N;\n    RETURN 'OK';\nEND;\n$$;"
+    ),
+    "DROP_PROCEDURE": "DROP PROCEDURE IF EXISTS SP_@N(VARIANT);",
+    "ALTER_PROCEDURE": "ALTER PROCEDURE SP_@N(VARIANT) SET COMMENT = 'procedimiento @N';",
+    "CREATE_OR_REPLACE_PROCEDURE": (
+        "CREATE OR REPLACE PROCEDURE @DB.@SC.SP_@N(CONFIG VARIANT)\n"
+        "RETURNS VARIANT NOT NULL\nLANGUAGE SQL\nEXECUTE AS CALLER\nAS\n$$\n"
+        "DECLARE\n"
+        "    environment VARCHAR := CONFIG:environment::string;\n"
+        "    stmt VARCHAR := 'DELETE FROM DB_SIL_' || environment || '.@SC.T_@N WHERE ID > 0';\n"
+        "BEGIN\n"
+        "    USE SCHEMA @SC;\n"
+        "    -- carga incremental @N\n"
+        "    EXECUTE IMMEDIATE 'TRUNCATE TABLE DB_BRO_' || environment || '.RAW.T_@N';\n"
+        "    MERGE INTO T_@N T USING (SELECT * FROM S_@N) S ON T.ID = S.ID\n"
+        "    WHEN MATCHED THEN UPDATE SET T.NAME = S.NAME;\n"
+        "    EXECUTE IMMEDIATE :stmt;\n"
+        "    RETURN OBJECT_CONSTRUCT('estado', 'OK');\n"
+        "END;\n$$;"
+    ),
+    "CALL_PROCEDURE": "CALL SP_@N(OBJECT_CONSTRUCT('environment', '{{ environment }}'));",
+    "CREATE_TASK": "CREATE TASK TK_@N WAREHOUSE = WH_@N SCHEDULE = '5 MINUTE' AS CALL SP_@N();",
+    "DROP_TASK": "DROP TASK IF EXISTS TK_@N;",
+    "ALTER_TASK": "ALTER TASK TK_@N RESUME;",
+    "EXECUTE_TASK": "EXECUTE TASK TK_@N;",
+    "CREATE_OR_REPLACE_TASK": "CREATE OR REPLACE TASK TK_@N WAREHOUSE = WH_@N AS CALL SP_@N();",
+    "CREATE_RESOURCE_MONITOR": "CREATE RESOURCE MONITOR RM_@N WITH CREDIT_QUOTA = 100;",
+    "DROP_RESOURCE_MONITOR": "DROP RESOURCE MONITOR RM_@N;",
+    "ALTER_RESOURCE_MONITOR": "ALTER RESOURCE MONITOR RM_@N SET CREDIT_QUOTA = 200;",
+    "CREATE_OR_REPLACE_RESOURCE_MONITOR": "CREATE OR REPLACE RESOURCE MONITOR RM_@N WITH CREDIT_QUOTA = 100;",
+}
+
+# sentencias sin riesgo para que el script se parezca a uno real
+_RELLENO = [
+    "SELECT ID, NAME, TS FROM T_@N WHERE TS > DATEADD(DAY, -1, CURRENT_TIMESTAMP());",
+    "UPDATE T_@N SET NAME = UPPER(NAME) WHERE ID = @N;",
+    "/* bloque @N */\nSELECT COUNT(*) FROM @DB.@SC.T_@N;",
+]
+
+_UNIDADES = {"": 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    """Convierte 512KB, 10MB, 1GB o un numero de bytes en bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*", text.upper())
+    if not match:
+        raise ValueError(f"tamaño no valido: {text}")
+    return int(float(match.group(1)) * _UNIDADES[match.group(2)])
+
+
+def _bloque(rng: random.Random, n: int) -> Tuple[str, int]:
+    """Un bloque con todas las acciones de RIESGO; devuelve el texto y el numero de sentencias."""
+    db = f"DB_SIL_{n % 7}"
+    sc = f"SC_{n % 13}"
+    sentencias: List[str] = [f"USE DATABASE {db};", f"USE SCHEMA {sc};"]
+    plantillas = list(PLANTILLAS.values()) + _RELLENO
+    rng.shuffle(plantillas)
+    for i, plantilla in enumerate(plantillas):
+        contador = str(n * 1000 + i)
+        sentencias.append(plantilla.replace("@N", contador).replace("@DB", db).replace("@SC", sc))
+    return "\n\n".join(sentencias) + "\n\n", len(sentencias)
+
+
+def generar_script(path: str, size: int, seed: int = 0) -> int:
+    """
+    Escribe en path un script de al menos size bytes (completando el ultimo bloque) y
+    devuelve el numero de sentencias de primer nivel. La misma semilla da el mismo fichero.
+    """
+    rng = random.Random(seed)
+    escritos = 0
+    total = 0
+    n = 0
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        while escritos < size or n == 0:
+            texto, sentencias = _bloque(rng, n)
+            f.write(texto)
+            escritos += len(texto.encode("utf-8"))
+            total += sentencias
+            n += 1
+    return total
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Genera un script Snowflake sintetico")
+    parser.add_argument("salida", help="fichero .sql a generar")
+    parser.add_argument("--size", default="1MB", help="tamaño aproximado (p. ej. 1MB, 100MB, 1GB)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del generador")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    sentencias = generar_script(args.salida, parse_size(args.size), args.seed)
+    print(f"{args.salida}: {sentencias} sentencias")
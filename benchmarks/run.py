@@ -0,0 +1,315 @@
+"""
+Benchmarks de rendimiento del analizador sobre scripts sinteticos (ver generate.py).
+
+Mide sentencias/s, MB/s y pico de memoria (RSS) de analizar_sql, normalize_dynamic_sql y
+analizar_multiples_archivos. Cada caso se ejecuta en un proceso nuevo para que el pico de
+memoria sea solo el suyo.
+
+Las cifras absolutas dependen de la maquina, asi que cada ejecucion mide tambien una carga
+de referencia fija en Python puro que no usa el analizador. La comparacion con la linea base
+se hace en unidades de esa referencia (sentencias por segundo de referencia): si la maquina
+es el doble de lenta, la referencia tambien lo es y la comparacion sigue valiendo. La linea
+base guarda ademas el procesador y la version de Python con los que se midio.
+
+    python benchmarks/run.py --sizes 1MB,100MB
+    python benchmarks/run.py --save-baseline        # guarda benchmarks/baseline.json
+    python benchmarks/run.py --threshold 0.2        # falla si empeora mas de un 20%
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+import ci_silver_gold  # noqa: E402
+from generate import generar_script, parse_size  # noqa: E402
+from lineage import LineageProvider  # noqa: E402
+
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+TEMPLATE_VARS = {"environment": "DEV"}
+
+# umbral por defecto: se avisa si una metrica empeora mas de un 25% respecto a la linea base
+_THRESHOLD_DEFAULT = 0.25
+
+
+class _SinLinaje(LineageProvider):
+    """Proveedor sin linaje para que los benchmarks no dependan del stub aleatorio."""
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        return {obj_name: False for obj_name in objects}
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux lo da en KB y macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _bench_analizar_sql(path: str, streaming: bool, jobs: int) -> None:
+    ci_silver_gold.analizar_sql(path, TEMPLATE_VARS, streaming=streaming, lineage_provider=_SinLinaje())
+
+
+def _bench_normalize_dynamic_sql(path: str, streaming: bool, jobs: int) -> Callable[[], None]:
+    # la lectura y el troceado quedan fuera de la medida
+    template_ctx = ci_silver_gold.TemplateContext(TEMPLATE_VARS)
+    statements = list(ci_silver_gold.iter_statements(path))
+
+    def run() -> None:
+        for stmt in statements:
+            ci_silver_gold.normalize_dynamic_sql(stmt, template_ctx)
+    return run
+
+
+def _bench_analizar_multiples_archivos(path: str, streaming: bool, jobs: int) -> None:
+    archivos = sorted(str(p) for p in Path(path).glob("*.sql"))
+    ci_silver_gold.analizar_multiples_archivos(archivos, TEMPLATE_VARS, streaming=streaming, jobs=jobs,
+                                               lineage_provider=_SinLinaje(), output=os.devnull)
+
+
+# los benchmarks marcados con True preparan los datos y devuelven la funcion a medir
+BENCHMARKS = {
+    "analizar_sql": (_bench_analizar_sql, False),
+    "normalize_dynamic_sql": (_bench_normalize_dynamic_sql, True),
+    "analizar_multiples_archivos": (_bench_analizar_multiples_archivos, False),
+}
+
+
+# carga de referencia: operaciones del mismo tipo que las del analizador (regex, cadenas y
+# diccionarios), con una duracion de unas decimas de segundo
+_REFERENCE_WORDS = ["SELECT", "FROM", "DB.SCHEMA.TABLE", "WHERE", "'literal'", "{{ env }}", "JOIN", "x || y"]
+_REFERENCE_PATTERN = re.compile(r"\b(FROM|JOIN)\s+([A-Z0-9_.]+)", re.IGNORECASE)
+_REFERENCE_ROUNDS = 60_000
+
+
+def _referencia() -> float:
+    """Se ejecuta en un proceso nuevo: segundos de la carga de referencia."""
+    rng = random.Random(0)
+    lines = [" ".join(rng.choice(_REFERENCE_WORDS) for _ in range(12)) for _ in range(256)]
+    start = time.perf_counter()
+    counts: Dict[str, int] = {}
+    for i in range(_REFERENCE_ROUNDS):
+        line = lines[i % len(lines)]
+        for match in _REFERENCE_PATTERN.finditer(line):
+            name = match.group(2).upper()
+            counts[name] = counts.get(name, 0) + 1
+        line.split(" ")
+    return time.perf_counter() - start
+
+
+def medir_referencia(repeat: int = 3) -> float:
+    """Mejor tiempo de la carga de referencia en esta maquina, en segundos."""
+    ctx = multiprocessing.get_context("spawn")
+    medidas = []
+    for _ in range(max(repeat, 1)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            medidas.append(executor.submit(_referencia).result())
+    return round(min(medidas), 4)
+
+
+def _cpu() -> str:
+    """Modelo del procesador, o lo que sepa platform si no se puede leer."""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def _ejecutar_caso(name: str, path: str, streaming: bool, jobs: int) -> Dict[str, float]:
+    """Se ejecuta en un proceso nuevo: mide el tiempo y el pico de memoria de un benchmark."""
+    bench, needs_setup = BENCHMARKS[name]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if needs_setup:
+            target = bench(path, streaming, jobs)
+        else:
+            def target() -> None:
+                bench(path, streaming, jobs)
+        start = time.perf_counter()
+        target()
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "peak_rss_mb": _peak_rss_mb()}
+
+
+def _preparar_datos(work_dir: Path, size: int, seed: int, files: int) -> Dict[str, Any]:
+    """Genera (o reutiliza) el script de un tamaño y su version repartida en varios ficheros."""
+    work_dir.mkdir(parents=True, exist_ok=True)
+    script = work_dir / f"synthetic_{size}_{seed}.sql"
+    meta_path = work_dir / f"synthetic_{size}_{seed}.json"
+    multi_dir = work_dir / f"synthetic_{size}_{seed}_x{files}"
+
+    if meta_path.exists() and script.exists() and multi_dir.is_dir():
+        return json.loads(meta_path.read_text())
+
+    statements = generar_script(str(script), size, seed)
+    multi_dir.mkdir(exist_ok=True)
+    multi_statements = 0
+    for i in range(files):
+        multi_statements += generar_script(str(multi_dir / f"part_{i:03d}.sql"), max(size // files, 1), seed + i)
+
+    meta = {
+        "script": str(script),
+        "bytes": script.stat().st_size,
+        "statements": statements,
+        "multi_dir": str(multi_dir),
+        "multi_bytes": sum(p.stat().st_size for p in multi_dir.glob("*.sql")),
+        "multi_statements": multi_statements,
+    }
+    meta_path.write_text(json.dumps(meta))
+    return meta
+
+
+def run_benchmarks(sizes: List[int], seed: int = 0, files: int = 8, jobs: int = 1,
+                   streaming: bool = False, work_dir: Optional[str] = None,
+                   names: Optional[List[str]] = None, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Ejecuta los benchmarks indicados (todos por defecto) para cada tamaño, repeat veces
+    quedandose con el mejor tiempo. Devuelve un diccionario "benchmark@bytes" -> metricas.
+    """
+    work = Path(work_dir) if work_dir else Path(tempfile.gettempdir()) / "sql_risk_bench"
+    results: Dict[str, Dict[str, float]] = {}
+    ctx = multiprocessing.get_context("spawn")
+
+    for size in sizes:
+        meta = _preparar_datos(work, size, seed, files)
+        for name in names or list(BENCHMARKS):
+            if name == "analizar_multiples_archivos":
+                path, nbytes, statements = meta["multi_dir"], meta["multi_bytes"], meta["multi_statements"]
+            else:
+                path, nbytes, statements = meta["script"], meta["bytes"], meta["statements"]
+
+            medidas = []
+            for _ in range(max(repeat, 1)):
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                    medidas.append(executor.submit(_ejecutar_caso, name, path, streaming, jobs).result())
+
+            seconds = max(min(m["seconds"] for m in medidas), 1e-9)
+            peak_rss_mb = max(m["peak_rss_mb"] for m in medidas)
+            results[f"{name}@{size}"] = {
+                "bytes": nbytes,
+                "statements": statements,
+                "seconds": round(seconds, 4),
+                "statements_per_s": round(statements / seconds, 1),
+                "mb_per_s": round(nbytes / (1024 * 1024) / seconds, 3),
+                "peak_rss_mb": round(peak_rss_mb, 1),
+            }
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float, referencia_s: float, base_referencia_s: float) -> List[str]:
+    """
+    Regresiones respecto a la linea base: caida de sentencias/s o MB/s, o subida del pico
+    de memoria, por encima del umbral (0.25 = 25%). Las velocidades se comparan en unidades
+    de la carga de referencia de cada maquina (velocidad * segundos de referencia).
+    """
+    regresiones = []
+    for caso, actual in results.items():
+        base = baseline.get(caso)
+        if base is None:
+            continue
+        for metrica in ("statements_per_s", "mb_per_s"):
+            relativa = actual[metrica] * referencia_s
+            base_relativa = base[metrica] * base_referencia_s
+            if relativa < base_relativa * (1 - threshold):
+                # la linea base llevada a la velocidad de esta maquina
+                esperado = round(base_relativa / referencia_s, 3)
+                regresiones.append(f"{caso}: {metrica} {actual[metrica]} < {esperado}"
+                                   f" (linea base {base[metrica]} ajustada a esta maquina)")
+        if actual["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold):
+            regresiones.append(f"{caso}: peak_rss_mb {actual['peak_rss_mb']} > {base['peak_rss_mb']} (linea base)")
+    return regresiones
+
+
+def _print_results(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'caso':<42} {'sent/s':>12} {'MB/s':>9} {'RSS MB':>9} {'s':>9}")
+    for caso, r in results.items():
+        print(f"{caso:<42} {r['statements_per_s']:>12} {r['mb_per_s']:>9} {r['peak_rss_mb']:>9} {r['seconds']:>9}")
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks del analizador de riesgo SQL")
+    parser.add_argument("--sizes", default="1MB", help="tamaños separados por comas (de 1MB a 1GB)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del generador")
+    parser.add_argument("--files", type=int, default=8,
+                        help="ficheros en los que se reparte cada tamaño para analizar_multiples_archivos")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="procesos de analizar_multiples_archivos")
+    parser.add_argument("--stream", action="store_true", help="analiza en modo streaming")
+    parser.add_argument("--bench", action="append", choices=list(BENCHMARKS),
+                        help="benchmark a ejecutar (se puede repetir; por defecto todos)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="repeticiones de cada caso; se toma el mejor tiempo")
+    parser.add_argument("--work-dir", default=None, help="directorio de los scripts generados")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="fichero JSON de la linea base")
+    parser.add_argument("--save-baseline", action="store_true", help="guarda los resultados como linea base")
+    parser.add_argument("--threshold", type=float, default=_THRESHOLD_DEFAULT,
+                        help="empeoramiento relativo a partir del cual se considera regresion")
+    parser.add_argument("--json", default=None, help="escribe los resultados en este fichero JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    results = run_benchmarks(sizes, args.seed, args.files, args.jobs, args.stream, args.work_dir,
+                             args.bench, args.repeat)
+    referencia_s = medir_referencia(args.repeat)
+    _print_results(results)
+    print(f"\nCarga de referencia: {referencia_s} s ({_cpu()}, Python {platform.python_version()})")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        document = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu": _cpu(),
+            "cpus": os.cpu_count(),
+            "referencia_s": referencia_s,
+            "results": results,
+        }
+        baseline_path.write_text(json.dumps(document, indent=2) + "\n")
+        print(f"\nLinea base guardada en {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"\nNo hay linea base en {baseline_path}")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text())
+    if "referencia_s" not in baseline:
+        print(f"\nLa linea base de {baseline_path} no tiene carga de referencia; vuelve a guardarla con --save-baseline")
+        return 0
+    if baseline.get("python") != platform.python_version():
+        print(f"\nAviso: la linea base se midio con Python {baseline.get('python')}"
+              f" y esta ejecucion usa {platform.python_version()}")
+    regresiones = compare(results, baseline["results"], args.threshold, referencia_s, baseline["referencia_s"])
+    if regresiones:
+        print(f"\nRegresiones de mas de un {args.threshold:.0%}:")
+        for regresion in regresiones:
+            print(f"   {regresion}")
+        return 1
+    print(f"\nSin regresiones respecto a {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
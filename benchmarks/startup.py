@@ -0,0 +1,90 @@
+"""
+Presupuesto de arranque del analizador.
+
+Mide con -X importtime lo que tarda `import ci_silver_gold` y comprueba que el camino rapido
+de la linea de comandos (ningun .sql entre los argumentos, el caso mas comun en un hook) no
+carga los modulos que solo hacen falta para analizar.
+
+    python benchmarks/startup.py                    # falla si se supera el presupuesto
+    python benchmarks/startup.py --budget-ms 60
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# presupuesto por defecto del import de ci_silver_gold (acumulado, en milisegundos)
+_BUDGET_MS_DEFAULT = 100.0
+
+# modulos que se importan solo donde se usan y no deben cargarse en el camino rapido
+LAZY_MODULES = (
+    "argparse", "concurrent.futures", "hashlib", "multiprocessing", "sqlite3",
+    "sqlparse", "subprocess",
+)
+
+
+def _importtime(args: List[str]) -> Dict[str, int]:
+    """Ejecuta python -X importtime y devuelve el tiempo acumulado (us) de cada modulo importado."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT_DIR,
+                          capture_output=True, text=True)
+    tiempos = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        tiempos[name.strip()] = int(cumulative)
+    return tiempos
+
+
+def medir_import(repeat: int = 5) -> float:
+    """Mejor tiempo acumulado, en ms, de importar ci_silver_gold en un interprete nuevo."""
+    _importtime(["-c", "import ci_silver_gold"])  # calienta los .pyc
+    medidas = [_importtime(["-c", "import ci_silver_gold"])["ci_silver_gold"] for _ in range(max(repeat, 1))]
+    return min(medidas) / 1000
+
+
+def modulos_camino_rapido() -> List[str]:
+    """Modulos de LAZY_MODULES que se cargan al invocar la linea de comandos sin ficheros .sql."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        no_sql = os.path.join(tmp_dir, "README.md")
+        Path(no_sql).write_text("")
+        importados = _importtime([str(ROOT_DIR / "ci_silver_gold.py"), no_sql])
+    return [m for m in LAZY_MODULES if m in importados]
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Presupuesto de arranque del analizador de riesgo SQL")
+    parser.add_argument("--budget-ms", type=float, default=_BUDGET_MS_DEFAULT,
+                        help="tiempo maximo del import de ci_silver_gold, en ms")
+    parser.add_argument("--repeat", type=int, default=5, help="repeticiones; se toma el mejor tiempo")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+    import_ms = medir_import(args.repeat)
+    cargados = modulos_camino_rapido()
+
+    print(f"import ci_silver_gold: {import_ms:.1f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    fallos = []
+    if import_ms > args.budget_ms:
+        fallos.append(f"el import tarda {import_ms:.1f} ms, mas que el presupuesto de {args.budget_ms:.0f} ms")
+    if cargados:
+        fallos.append(f"el camino rapido importa {', '.join(cargados)}")
+
+    if fallos:
+        print("\nPresupuesto de arranque superado:")
+        for fallo in fallos:
+            print(f"   {fallo}")
+        return 1
+    print("Camino rapido sin modulos pesados")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
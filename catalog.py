@@ -0,0 +1,318 @@
+"""
+Snapshot local del catalogo de Snowflake: objetos, dependencias entre objetos y tamaño de
+los warehouses, exportados fuera del CI (CSV o JSON) e importados en una base sqlite. El
+analisis la consulta sin red: las claves son los nombres completos (DB.SCHEMA.OBJETO) y
+cada consulta es una busqueda por clave primaria, con las respuestas ya vistas en memoria.
+
+    python ci_silver_gold.py catalog [--db RUTA] EXPORT.csv [EXPORT.json ...]
+
+Se reconocen las columnas de las vistas de Snowflake (OBJECT_DEPENDENCIES de ACCOUNT_USAGE,
+TABLES/VIEWS de INFORMATION_SCHEMA, SHOW WAREHOUSES) y un JSON resumido:
+
+    {"objetos": ["DB.S.T", ...], "dependencias": [["DB.S.T", "DB.S.V"], ...],
+     "warehouses": {"WH_ETL": "X-Small", ...}}
+
+Cada importacion sustituye la base entera de forma atomica, asi que puede refrescarse
+mientras se analiza: el analisis en curso sigue con el snapshot que abrio y el siguiente
+abre el nuevo.
+"""
+import csv
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from lineage import LineageProvider, normalizar_objeto
+
+# variable de entorno y fichero por defecto del snapshot
+CATALOG_ENV_VAR = "SQL_RISK_CATALOG"
+CATALOG_PATH_DEFAULT = ".sql_risk_catalog.db"
+
+# numero maximo de parametros por consulta (limite por defecto de sqlite)
+_SQLITE_BATCH_SIZE = 900
+
+# tamaños de warehouse que se consideran XS (sin guiones ni espacios)
+_XS_SIZES = {"XS", "XSMALL"}
+
+_SCHEMA = (
+    "CREATE TABLE objects (name TEXT PRIMARY KEY, kind TEXT) WITHOUT ROWID",
+    "CREATE TABLE dependencies (object TEXT NOT NULL, dependent TEXT NOT NULL,"
+    " PRIMARY KEY (object, dependent)) WITHOUT ROWID",
+    "CREATE TABLE warehouses (name TEXT PRIMARY KEY, size TEXT) WITHOUT ROWID",
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID",
+)
+
+
+def _fqn(row: Dict[str, Any], *columns: str) -> Optional[str]:
+    """Nombre completo a partir de las columnas de base de datos, esquema y objeto de una fila."""
+    parts = [row.get(column) for column in columns]
+    if not parts[-1]:
+        return None
+    return normalizar_objeto(".".join(str(part) for part in parts if part))
+
+
+def _es_xs(size: Optional[str]) -> bool:
+    return "".join(ch for ch in (size or "").upper() if ch.isalnum()) in _XS_SIZES
+
+
+def _clasificar_fila(row: Dict[str, Any]) -> Optional[Tuple[str, Tuple]]:
+    """
+    Tabla y valores de una fila exportada, segun sus columnas: ("dependencies", (objeto,
+    dependiente)), ("warehouses", (nombre, tamaño)) u ("objects", (nombre, tipo)).
+    """
+    row = {str(k).strip().upper(): v for k, v in row.items()}
+    if "REFERENCED_OBJECT_NAME" in row and "REFERENCING_OBJECT_NAME" in row:
+        # SNOWFLAKE.ACCOUNT_USAGE.OBJECT_DEPENDENCIES
+        obj_name = _fqn(row, "REFERENCED_DATABASE", "REFERENCED_SCHEMA", "REFERENCED_OBJECT_NAME")
+        dependiente = _fqn(row, "REFERENCING_DATABASE", "REFERENCING_SCHEMA", "REFERENCING_OBJECT_NAME")
+        return ("dependencies", (obj_name, dependiente)) if obj_name and dependiente else None
+    if "OBJECT" in row and "DEPENDENT" in row:
+        obj_name, dependiente = normalizar_objeto(row["OBJECT"]), normalizar_objeto(row["DEPENDENT"])
+        return ("dependencies", (obj_name, dependiente)) if obj_name and dependiente else None
+    if "WAREHOUSE_SIZE" in row or "SIZE" in row:
+        # SHOW WAREHOUSES (name, size) o ACCOUNT_USAGE.WAREHOUSES (warehouse_name, warehouse_size)
+        name = normalizar_objeto(row.get("WAREHOUSE_NAME") or row.get("NAME"))
+        size = row.get("WAREHOUSE_SIZE") or row.get("SIZE")
+        return ("warehouses", (name, str(size).upper())) if name and size else None
+    if "TABLE_NAME" in row:
+        # INFORMATION_SCHEMA.TABLES / VIEWS
+        name = _fqn(row, "TABLE_CATALOG", "TABLE_SCHEMA", "TABLE_NAME")
+        return ("objects", (name, row.get("TABLE_TYPE"))) if name else None
+    if "NAME" in row:
+        name = normalizar_objeto(row["NAME"])
+        return ("objects", (name, row.get("KIND"))) if name else None
+    return None
+
+
+def _filas_json(data: Any) -> Iterator[Tuple[str, Tuple]]:
+    if isinstance(data, list):
+        rows: Iterable = data
+    else:
+        objetos = data.get("objetos", data.get("objects", []))
+        dependencias = data.get("dependencias", data.get("dependencies", []))
+        warehouses = data.get("warehouses", [])
+        if isinstance(warehouses, dict):
+            warehouses = [{"name": k, "size": v} for k, v in warehouses.items()]
+        rows = [
+            *({"name": o} if isinstance(o, str) else o for o in objetos),
+            *({"object": d[0], "dependent": d[1]} if isinstance(d, (list, tuple)) else d for d in dependencias),
+            *warehouses,
+        ]
+    for row in rows:
+        if isinstance(row, dict):
+            fila = _clasificar_fila(row)
+            if fila is not None:
+                yield fila
+
+
+def leer_export(path: Union[str, Path]) -> Iterator[Tuple[str, Tuple]]:
+    """Filas (tabla, valores) de un fichero exportado del catalogo, CSV o JSON."""
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        yield from _filas_json(json.loads(path.read_text(encoding="utf-8")))
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            fila = _clasificar_fila(row)
+            if fila is not None:
+                yield fila
+
+
+def importar_catalogo(sources: Iterable[Union[str, Path]],
+                      db_path: Union[str, Path] = CATALOG_PATH_DEFAULT) -> Dict[str, int]:
+    """
+    Importa los ficheros exportados en una base nueva y la pone en db_path de forma atomica.
+    Los objetos que aparecen en dependencias se dan de alta aunque no esten en el export de
+    objetos. Devuelve el numero de filas de cada tabla.
+    """
+    import sqlite3
+    import time
+
+    db_path = str(db_path)
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            inserts = {
+                "objects": "INSERT OR REPLACE INTO objects (name, kind) VALUES (?, ?)",
+                "dependencies": "INSERT OR IGNORE INTO dependencies (object, dependent) VALUES (?, ?)",
+                "warehouses": "INSERT OR REPLACE INTO warehouses (name, size) VALUES (?, ?)",
+            }
+            sources = [str(source) for source in sources]
+            for source in sources:
+                filas: Dict[str, List[Tuple]] = {table: [] for table in inserts}
+                for table, values in leer_export(source):
+                    filas[table].append(values)
+                for table, values in filas.items():
+                    conn.executemany(inserts[table], values)
+            conn.execute(
+                "INSERT OR IGNORE INTO objects (name, kind) SELECT object, NULL FROM dependencies"
+                " UNION SELECT dependent, NULL FROM dependencies"
+            )
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("importado", time.strftime("%Y-%m-%dT%H:%M:%S%z")),
+                ("fuentes", json.dumps(sources)),
+            ])
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("objects", "dependencies", "warehouses")}
+    except BaseException:
+        conn.close()
+        os.unlink(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, db_path)
+    return counts
+
+
+class CatalogSnapshot(LineageProvider):
+    """
+    Lectura del snapshot. Los warehouses se cargan enteros al abrir (son pocos); el linaje
+    de cada objeto se busca por clave primaria la primera vez y se recuerda. Un objeto tiene
+    linaje si otro objeto del catalogo depende de el.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        import sqlite3  # solo se carga si hay snapshot
+
+        self.path = str(path)
+        self.mtime_ns = os.stat(self.path).st_mtime_ns
+        # el scorer consulta el linaje desde su hilo; la conexion se comparte con un lock
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._lineage: Dict[str, bool] = {}
+        try:
+            self.warehouses: Dict[str, str] = dict(self._conn.execute("SELECT name, size FROM warehouses"))
+        except sqlite3.Error:
+            # no es una base sqlite o no tiene las tablas del snapshot
+            self._conn.close()
+            raise
+
+    def warehouse_size(self, warehouse: str) -> Optional[str]:
+        return self.warehouses.get(normalizar_objeto(warehouse))
+
+    def is_warehouse_xs(self, warehouse: str) -> Optional[bool]:
+        """Si el warehouse es XS; None si no esta en el catalogo."""
+        size = self.warehouse_size(warehouse)
+        return None if size is None else _es_xs(size)
+
+    def has_lineage(self, obj_name: str) -> bool:
+        obj_name = normalizar_objeto(obj_name)
+        found = self._lineage.get(obj_name)
+        if found is None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT 1 FROM dependencies WHERE object = ? LIMIT 1", (obj_name,)
+                ).fetchone()
+            found = self._lineage[obj_name] = row is not None
+        return found
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        result = {}
+        pendientes = []
+        for obj_name in dict.fromkeys(objects):
+            found = self._lineage.get(obj_name)
+            if found is None:
+                pendientes.append(obj_name)
+                result[obj_name] = False
+            else:
+                result[obj_name] = found
+        for start in range(0, len(pendientes), _SQLITE_BATCH_SIZE):
+            batch = pendientes[start:start + _SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT DISTINCT object FROM dependencies WHERE object IN ({placeholders})", batch
+                ).fetchall()
+            for (obj_name,) in rows:
+                result[obj_name] = True
+            for obj_name in batch:
+                self._lineage[obj_name] = result[obj_name]
+        return result
+
+    def dependents(self, obj_name: str) -> List[str]:
+        """Objetos que dependen directamente de obj_name segun el catalogo."""
+        with self._lock:
+            rows = self._conn.execute("SELECT dependent FROM dependencies WHERE object = ?",
+                                      (normalizar_objeto(obj_name),)).fetchall()
+        return [dependiente for (dependiente,) in rows]
+
+    def info(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, value FROM meta"))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+# snapshot del proceso; se vuelve a abrir si se refresca el fichero
+_CATALOG: Optional[CatalogSnapshot] = None
+# (ruta, fecha) del ultimo snapshot que no se pudo abrir, para avisar una sola vez
+_CATALOG_ERROR: Optional[Tuple[str, int]] = None
+
+
+def catalog_path() -> str:
+    return os.path.abspath(os.environ.get(CATALOG_ENV_VAR) or CATALOG_PATH_DEFAULT)
+
+
+def get_catalog() -> Optional[CatalogSnapshot]:
+    """
+    Snapshot del catalogo configurado, o None si no hay ninguno importado o no se puede
+    leer. Al cambiar el fichero se cierra la conexion del snapshot anterior; quien lo tenga
+    sigue pudiendo consultar sus warehouses, que estan en memoria.
+    """
+    global _CATALOG, _CATALOG_ERROR
+    path = catalog_path()
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        snapshot = None
+    else:
+        if _CATALOG is not None and _CATALOG.path == path and _CATALOG.mtime_ns == mtime_ns:
+            return _CATALOG
+        if _CATALOG_ERROR == (path, mtime_ns):
+            return None
+        import sqlite3
+
+        try:
+            snapshot = CatalogSnapshot(path)
+        except (OSError, sqlite3.Error) as e:
+            # snapshot corrupto o de otra herramienta: se analiza sin el
+            print(f"No se pudo leer el catalogo {path}: {e}", file=sys.stderr)
+            _CATALOG_ERROR = (path, mtime_ns)
+            snapshot = None
+    if _CATALOG is not None:
+        _CATALOG.close()
+    _CATALOG = snapshot
+    return snapshot
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    import sqlite3
+
+    parser = argparse.ArgumentParser(prog="ci_silver_gold.py catalog",
+                                     description="Importa un snapshot del catalogo de Snowflake")
+    parser.add_argument("exports", nargs="+", help="ficheros exportados (.csv o .json)")
+    parser.add_argument("--db", default=None,
+                        help=f"base sqlite a generar (por defecto ${CATALOG_ENV_VAR} o {CATALOG_PATH_DEFAULT})")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.environ.get(CATALOG_ENV_VAR) or CATALOG_PATH_DEFAULT
+    try:
+        counts = importar_catalogo(args.exports, db_path)
+    except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+        print(f"No se pudo importar el catalogo: {e}", file=sys.stderr)
+        return 1
+    print(f"Catalogo importado en {db_path}: {counts['objects']} objetos, "
+          f"{counts['dependencies']} dependencias, {counts['warehouses']} warehouses")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
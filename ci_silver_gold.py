@@ -1,10 +1,33 @@
-import sqlparse
-import random
+import time
 import re
 import sys
 import os
+import io
+import json
+import functools
+import contextlib
+import dataclasses
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional, Callable
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple, Optional, Callable, Iterator, Iterable, Union
+
+from catalog import CATALOG_ENV_VAR, CATALOG_PATH_DEFAULT, CatalogSnapshot, get_catalog
+from depgraph import (GRAPH_ENV_VAR, GRAPH_PATH_DEFAULT, DependencyGraph, Edge, Signature, file_signature,
+                      get_dependency_graph)
+from lexer import SINGLE_QUOTED_BODY, split_statements, statement_text
+from lineage import LineageProvider, CachedLineageProvider, normalizar_objeto, open_lineage_provider
+from names import SYMBOLS, qualify, resolve
+from reports import FORMATS, RIESGOS_REPORTADOS, Report, TextReport, create_report
+from gitdiff import changed_line_ranges
+from profiling import PROFILE_ENV_VAR, PROFILE_OUTPUT_DEFAULT, enable_profiling, get_profiler
+
+# los modulos pesados que solo necesitan algunos caminos (argparse, concurrent.futures,
+# hashlib, sqlparse; sqlite3 en catalog y lineage) se importan donde se usan, para que
+# arrancar sea barato
+if TYPE_CHECKING:
+    import argparse
+    from concurrent.futures import Future, ThreadPoolExecutor
 
 
 # definicion de riesgos para cada accion
@@ -104,26 +127,29 @@ RIESGO = {
     "CREATE_OR_REPLACE_RESOURCE_MONITOR": ("ALTA", "MEDIA"),
 }
 
-def set_template_variables():
+def set_template_variables(environ: Optional[Dict[str, str]] = None):
     """
-    Establece las variables de template globales.
+    Establece las variables de template globales a partir de environ (por defecto, el
+    entorno del proceso).
     """
+    if environ is None:
+        environ = os.environ
     vars_dict: Dict[str, str] = {}
 
-    for k, v in os.environ.items():
+    for k, v in environ.items():
         if isinstance(v, str) and v:
             vars_dict[k] = v
 
-    app_env = os.environ.get('APP_ENV') or os.environ.get('ENV') or os.environ.get('environment')
+    app_env = environ.get('APP_ENV') or environ.get('ENV') or environ.get('environment')
     if app_env:
         vars_dict.setdefault('APP_ENV', app_env)
         vars_dict.setdefault('env', app_env)
         vars_dict.setdefault('environment', app_env)
 
-    if 'REGION' in os.environ:
-        vars_dict.setdefault('region', os.environ.get('REGION'))
-    if 'PROJECT' in os.environ:
-        vars_dict.setdefault('project', os.environ.get('PROJECT'))
+    if 'REGION' in environ:
+        vars_dict.setdefault('region', environ.get('REGION'))
+    if 'PROJECT' in environ:
+        vars_dict.setdefault('project', environ.get('PROJECT'))
 
     if 'env' in vars_dict and isinstance(vars_dict['env'], str):
         vars_dict['env'] = vars_dict['env'].upper()
@@ -131,12 +157,15 @@ def set_template_variables():
     return vars_dict
 
 
+# placeholder de template: {{ variable }} o {variable}
+_TEMPLATE_PLACEHOLDER = re.compile(r'\{\{?\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}?\}')
+
+
 def _gather_placeholders_from_text(text: str) -> List[str]:
     """Extrae nombres de variables encontrados en texto con patrones {{ var }} o {var}.
     Retorna nombres en minúscula.
     """
-    pattern = r'\{\{?\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}?\}'
-    return [m.group(1).lower() for m in re.finditer(pattern, text)]
+    return [m.group(1).lower() for m in _TEMPLATE_PLACEHOLDER.finditer(text)]
 
 
 def gather_placeholders_from_files(paths: List[str]) -> List[str]:
@@ -151,156 +180,468 @@ def gather_placeholders_from_files(paths: List[str]) -> List[str]:
             found.add(name)
     return sorted(found)
 
+
+class TemplateContext:
+    """
+    Variables de template de una ejecucion junto con sus indices por nombre en minusculas,
+    construidos una sola vez y compartidos por todos los ficheros y sentencias analizados.
+    """
+
+    def __init__(self, variables: Optional[Dict[str, str]] = None):
+        if variables is None:
+            variables = set_template_variables()
+        self.variables = variables
+        # placeholders: si varias claves solo difieren en mayusculas gana la primera
+        self.lookup: Dict[str, Optional[str]] = {}
+        for key, value in variables.items():
+            self.lookup.setdefault(key.lower(), value)
+        # concatenaciones de normalize_dynamic_sql: gana la ultima
+        self.dynamic_lookup: Dict[str, Optional[str]] = {key.lower(): value for key, value in variables.items()}
+
+    def resolve(self, text: str, warn: bool = True) -> Tuple[str, List[str]]:
+        """
+        Sustituye todos los placeholders del texto en una unica pasada. Con warn avisa de los
+        que no tienen valor.
+        """
+        if "{" not in text:
+            # sin placeholders se devuelve el mismo texto, sin copiarlo
+            return text, []
+        detected_vars = []
+
+        def replace(match: re.Match) -> str:
+            var_name = match.group(1).lower()
+            detected_vars.append(var_name)
+            var_value = self.lookup.get(var_name)
+            if var_value is None:
+                if warn:
+                    print(f"   ADVERTENCIA: Variable '{{{{ {var_name} }}}}' no encontrada en configuración")
+                return match.group(0)
+            return str(var_value)
+
+        return _TEMPLATE_PLACEHOLDER.sub(replace, text), detected_vars
+
+
+# contexto construido a partir del entorno, compartido por todo el proceso
+_ENV_TEMPLATE_CONTEXT: Optional[TemplateContext] = None
+
+
+def get_template_context() -> TemplateContext:
+    """
+    Devuelve el contexto de variables del entorno, construyendolo solo la primera vez.
+    Si se modifica os.environ despues, hay que llamar a invalidate_template_context().
+    """
+    global _ENV_TEMPLATE_CONTEXT
+    if _ENV_TEMPLATE_CONTEXT is None:
+        _ENV_TEMPLATE_CONTEXT = TemplateContext(set_template_variables())
+    return _ENV_TEMPLATE_CONTEXT
+
+
+def invalidate_template_context() -> None:
+    """Descarta el contexto memorizado para que se vuelva a leer el entorno."""
+    global _ENV_TEMPLATE_CONTEXT
+    _ENV_TEMPLATE_CONTEXT = None
+
+
+def _template_context(template_vars) -> TemplateContext:
+    """Acepta un diccionario de variables, un TemplateContext ya construido o None (entorno)."""
+    if isinstance(template_vars, TemplateContext):
+        return template_vars
+    if template_vars is None:
+        return get_template_context()
+    return TemplateContext(template_vars)
+
+
 def resolve_template_variables(text: str, variables: Dict[str, str] = None) -> Tuple[str, List[str]]:
     """
     Detecta y reemplaza variables de template en formato {{ variable }} o {variable}
     Retorna el texto resuelto y una lista de variables encontradas.
     """
-    if variables is None:
-        variables = set_template_variables()
-    
-    detected_vars = []
-    missing_vars = []
-    resolved_text = text
-    
-    pattern = r'\{\{?\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}?\}'
-    
-    matches = re.finditer(pattern, text)
-    for match in matches:
-        var_name = match.group(1).lower()
-        detected_vars.append(var_name)
-        
-        var_value = None
-        for key, value in variables.items():
-            if key.lower() == var_name:
-                var_value = value
-                break
+    return _template_context(variables).resolve(text)
+
+# tokens de una sentencia para normalize_dynamic_sql. Las comillas son tokens sueltos
+# (no se emparejan) para que un literal sea siempre el texto entre dos comillas consecutivas
+_DYNAMIC_SQL_TOKEN = re.compile(
+    r"(?P<quote>')|(?P<concat>\|\|)|(?P<word>\w+)|(?P<dot>\.)|(?P<space>\s+)|(?P<other>[^'|\w.\s]+|\|)"
+)
+_VARIABLE_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_ASCII_WORD_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
 
-        if var_value is not None:
-            resolved_text = resolved_text.replace(match.group(0), str(var_value))
-        else:
-            missing_vars.append(var_name)
-            print(f"   ADVERTENCIA: Variable '{{{{ {var_name} }}}}' no encontrada en configuración")
-    
-    return resolved_text, detected_vars
 
 def normalize_dynamic_sql(sql_string: str, template_vars: Dict[str, str] = None) -> str:
     """
-    Normaliza sentencias sql con concatenaciones de casteos de variables
+    Normaliza sentencias sql con concatenaciones de casteos de variables.
+    Recorre los tokens una sola vez de izquierda a derecha resolviendo en cada || las formas:
+        texto.|| var ||.texto  --> texto.valor.texto
+        texto.|| var           --> texto.valor
+        var ||.texto           --> valor.texto
+        'texto' || var || 'texto' --> 'textovalortexto'
+        texto' || var || 'texto   --> textovalortexto
+        'texto' || var         --> 'textovalor'
+        var || 'texto'         --> 'valortexto'
+    Los literales resultantes se siguen concatenando con los operandos vecinos, de modo que
+    una cadena de concatenaciones de cualquier longitud queda resuelta en una unica pasada.
     """
-    if template_vars is None:
-        template_vars = set_template_variables()
-    
-    vars_lower = {k.lower(): v for k, v in template_vars.items()}
-    
-    result = sql_string
-    max_iterations = 30
-    changed = True
-    iteration = 0
-    
-    # búsqueda de distintas posibles expresiones de una variable
-    while changed and iteration < max_iterations:
-        changed = False
-        iteration += 1
-        
-        # texto.|| var ||.texto  --> texto.valor.texto
-        match = re.search(r"([A-Za-z0-9_]+)\.\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\.([A-Za-z0-9_]+)", result, re.IGNORECASE)
-        if match:
-            prefix = match.group(1)
-            var_name = match.group(2)
-            suffix = match.group(3)
-            var_value = vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
-            combined = f"{prefix}.{var_value}.{suffix}"
-            result = result[:match.start()] + combined + result[match.end():]
-            changed = True
-            continue
-        
-        # texto.|| valor --> texto.valor
-        match = re.search(r"([A-Za-z0-9_]+)\.\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\b", result, re.IGNORECASE)
-        if match:
-            prefix = match.group(1)
-            var_name = match.group(2)
-            var_value = vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
-            combined = f"{prefix}.{var_value}"
-            result = result[:match.start()] + combined + result[match.end():]
-            changed = True
-            continue
-        
-        # valor ||.texto --> valor.texto
-        match = re.search(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\.([A-Za-z0-9_]+)", result, re.IGNORECASE)
-        if match:
-            var_name = match.group(1)
-            suffix = match.group(2)
-            var_value = vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
-            combined = f"{var_value}.{suffix}"
-            result = result[:match.start()] + combined + result[match.end():]
-            changed = True
-            continue
-        
-        # 'texto' || var || 'texto' --> textovalortexto
-        match = re.search(r"'([^']*)'\s*\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\s*'([^']*)'", result, re.IGNORECASE)
-        if match:
-            prefix = match.group(1)
-            var_name = match.group(2)
-            suffix = match.group(3)
-            var_value = vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
-            combined = f"'{prefix}{var_value}{suffix}'"
-            result = result[:match.start()] + combined + result[match.end():]
-            changed = True
+    if "||" not in sql_string:
+        return sql_string
+
+    vars_lower = _template_context(template_vars).dynamic_lookup
+
+    def valor(var_name: str) -> str:
+        return str(vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}"))
+
+    tokens = [(m.lastgroup, m.group()) for m in _DYNAMIC_SQL_TOKEN.finditer(sql_string)]
+    n = len(tokens)
+
+    # indice de la siguiente comilla a partir de cada posicion (n si no hay)
+    next_quote = [n] * (n + 1)
+    for idx in range(n - 1, -1, -1):
+        next_quote[idx] = idx if tokens[idx][0] == "quote" else next_quote[idx + 1]
+
+    def skip_space(idx: int) -> int:
+        return idx + 1 if idx < n and tokens[idx][0] == "space" else idx
+
+    def is_variable(token) -> bool:
+        return token[0] == "word" and _VARIABLE_NAME.fullmatch(token[1]) is not None
+
+    def right_variable(concat_idx: int) -> Optional[int]:
+        idx = skip_space(concat_idx + 1)
+        return idx if idx < n and is_variable(tokens[idx]) else None
+
+    def next_concat(idx: int) -> Optional[int]:
+        idx = skip_space(idx + 1)
+        return idx if idx < n and tokens[idx][0] == "concat" else None
+
+    def dot_suffix(concat_idx: int) -> bool:
+        # ||.texto
+        return (concat_idx + 2 < n and tokens[concat_idx + 1][0] == "dot"
+                and tokens[concat_idx + 2][1][0] in _ASCII_WORD_CHARS)
+
+    def right_literal(concat_idx: int) -> Optional[Tuple[int, int]]:
+        # || 'texto' -> (comilla de apertura, comilla de cierre)
+        idx = skip_space(concat_idx + 1)
+        if idx < n and tokens[idx][0] == "quote" and next_quote[idx + 1] < n:
+            return idx, next_quote[idx + 1]
+        return None
+
+    def join_tokens(token_list) -> str:
+        return "".join(text for _, text in token_list)
+
+    out: List[Tuple[str, str]] = []
+    quotes: List[int] = []
+
+    def left_operand() -> int:
+        # ultimo token emitido ignorando espacios
+        last = len(out) - 1
+        if last >= 0 and out[last][0] == "space":
+            last -= 1
+        return last
+
+    def left_literal_start(last: int) -> Optional[int]:
+        # 'texto' || -> indice de la comilla de apertura
+        if last >= 0 and out[last][0] == "quote" and len(quotes) >= 2:
+            return quotes[-2]
+        return None
+
+    def truncate(idx: int) -> None:
+        del out[idx:]
+        while quotes and quotes[-1] >= idx:
+            quotes.pop()
+
+    def emit_literal(content: str) -> None:
+        quotes.append(len(out))
+        out.append(("quote", "'"))
+        out.append(("text", content))
+        quotes.append(len(out))
+        out.append(("quote", "'"))
+
+    i = 0
+    while i < n:
+        token = tokens[i]
+        if token[0] != "concat":
+            if token[0] == "quote":
+                quotes.append(len(out))
+            out.append(token)
+            i += 1
             continue
-        
-        # texto' || var || 'texto --> textovalortexto
-        match = re.search(r"([A-Za-z0-9_]+)'(\s*\|\|\s*)([A-Za-z_][A-Za-z0-9_]*)(\s*\|\|\s*)'([^']*)'", result, re.IGNORECASE)
-        if match:
-            prefix = match.group(1)  
-            var_name = match.group(3)  
-            suffix = match.group(5)
-            var_value = vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
-            combined = f"{prefix}{var_value}{suffix}"
-            result = result[:match.start()] + combined + result[match.end():]
-            changed = True
+
+        last = left_operand()
+        # texto.|| se decide sobre el texto original: el prefijo puede haberse fundido ya en un literal
+        left_dot = (i >= 2 and out and out[-1][0] == "dot" and tokens[i - 1][0] == "dot"
+                    and tokens[i - 2][1][-1] in _ASCII_WORD_CHARS)
+        var_idx = right_variable(i)
+
+        # texto.|| var ||.texto  /  texto.|| var
+        if left_dot and var_idx is not None:
+            out.append(("value", valor(tokens[var_idx][1])))
+            concat_idx = next_concat(var_idx)
+            if concat_idx is not None and dot_suffix(concat_idx):
+                i = concat_idx + 1
+            else:
+                i = var_idx + 1
             continue
 
-        # 'texto' || var --> textovalor
-        match = re.search(r"'([^']*)'\s*\|\|\s*([A-Za-z_][A-Za-z0-9_]*)\b", result, re.IGNORECASE)
-        if match:
-            prefix = match.group(1)
-            var_name = match.group(2)
-            var_value = vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
-            combined = f"'{prefix}{var_value}'"
-            result = result[:match.start()] + combined + result[match.end():]
-            changed = True
+        # var ||.texto
+        if last >= 0 and is_variable(out[last]) and dot_suffix(i):
+            var_name = out[last][1]
+            truncate(last)
+            out.append(("value", valor(var_name)))
+            i += 1
             continue
 
-        # var || 'texto' --> valortexto
-        match = re.search(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\|\|\s*'([^']*)'", result, re.IGNORECASE)
-        if match:
-            var_name = match.group(1)
-            suffix = match.group(2)
-            var_value = vars_lower.get(var_name.lower(), f"VAR_{var_name.upper()}")
-            combined = f"'{var_value}{suffix}'"
-            result = result[:match.start()] + combined + result[match.end():]
-            changed = True
+        literal_start = left_literal_start(last)
+        if var_idx is not None:
+            concat_idx = next_concat(var_idx)
+            right = right_literal(concat_idx) if concat_idx is not None else None
+
+            if right is not None:
+                suffix = join_tokens(tokens[right[0] + 1:right[1]])
+                # 'texto' || var || 'texto'
+                if literal_start is not None:
+                    prefix = join_tokens(out[literal_start + 1:last])
+                    truncate(literal_start)
+                    emit_literal(f"{prefix}{valor(tokens[var_idx][1])}{suffix}")
+                    i = right[1] + 1
+                    continue
+                # texto' || var || 'texto
+                if (last >= 1 and out[last][0] == "quote"
+                        and out[last - 1][1] and out[last - 1][1][-1] in _ASCII_WORD_CHARS):
+                    truncate(last)
+                    out.append(("value", f"{valor(tokens[var_idx][1])}{suffix}"))
+                    i = right[1] + 1
+                    continue
+
+            # 'texto' || var  (salvo var ||.texto, que tiene prioridad)
+            if literal_start is not None and not (concat_idx is not None and dot_suffix(concat_idx)):
+                prefix = join_tokens(out[literal_start + 1:last])
+                truncate(literal_start)
+                emit_literal(f"{prefix}{valor(tokens[var_idx][1])}")
+                i = var_idx + 1
+                continue
+
+        # var || 'texto'
+        right = right_literal(i)
+        if right is not None and last >= 0 and is_variable(out[last]):
+            content = f"{valor(out[last][1])}{join_tokens(tokens[right[0] + 1:right[1]])}"
+            truncate(last)
+            # var2 || var || 'texto': las variables anteriores de la cadena se incorporan al literal
+            while True:
+                concat_pos = left_operand()
+                if concat_pos < 0 or out[concat_pos][0] != "concat":
+                    break
+                prev = concat_pos - 1
+                if prev >= 0 and out[prev][0] == "space":
+                    prev -= 1
+                if prev < 0 or not is_variable(out[prev]):
+                    break
+                content = f"{valor(out[prev][1])}{content}"
+                truncate(prev)
+            emit_literal(content)
+            i = right[1] + 1
             continue
-    
-    return result
 
+        out.append(token)
+        i += 1
+
+    return join_tokens(out)
 
-# estas funciones deben cambiarse a las existentes
-def has_object_lineage():
-    return random.choice([True, False])
 
-def is_warehouse_xs():
-    return random.choice([True, False])
+def has_object_lineage(obj_name: str, graphs: Iterable[DependencyGraph] = ()) -> bool:
+    """
+    Si algun objeto depende de obj_name, segun el snapshot del catalogo (si lo hay) o los
+    grafos de dependencias indicados.
+    """
+    return StubLineageProvider(list(graphs)).has_lineage(obj_name)
 
+def is_warehouse_xs(warehouse: str) -> Optional[bool]:
+    """Si el warehouse es XS segun el snapshot del catalogo; None si no se conoce su tamaño."""
+    catalog = get_catalog()
+    return catalog.is_warehouse_xs(warehouse) if catalog is not None else None
 
-def parse_object_name(obj_name: str) -> Dict[str, Optional[str]]:
+
+class StubLineageProvider(LineageProvider):
+    """
+    Proveedor por defecto: el snapshot del catalogo (si lo hay) y los grafos de dependencias
+    de la ejecucion. Ambos se toman al crearlo, no en cada consulta.
+    """
+
+    def __init__(self, graphs: Optional[List[DependencyGraph]] = None):
+        self.catalog = get_catalog()
+        self.graphs = graphs or []
+
+    def has_lineage(self, obj_name: str) -> bool:
+        return self.lookup(normalizar_objeto(obj_name))
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        objects = list(objects)
+        result = self.catalog.lookup_many(objects) if self.catalog is not None else {}
+        for obj_name in objects:
+            if not result.get(obj_name):
+                symbol = SYMBOLS.get(obj_name)
+                result[obj_name] = any(graph.has_lineage_id(symbol) for graph in self.graphs)
+        return result
+
+
+# contextos ya creados; los hallazgos con el mismo contexto comparten la misma instancia
+_CONTEXT_POOL: Dict[Tuple[Optional[str], Optional[str], Optional[str]], "Context"] = {}
+
+
+@dataclass(frozen=True, slots=True)
+class Context:
+    """Contexto activo (USE DATABASE/SCHEMA/WAREHOUSE) cuando se ejecuta una sentencia."""
+    database: Optional[str] = None
+    schema: Optional[str] = None
+    warehouse: Optional[str] = None
+
+    @staticmethod
+    def intern(current_context: Dict[str, Optional[str]]) -> "Context":
+        """Devuelve la instancia compartida para el estado actual del contexto."""
+        key = (current_context.get("database"), current_context.get("schema"),
+               current_context.get("warehouse"))
+        ctx = _CONTEXT_POOL.get(key)
+        if ctx is None:
+            ctx = _CONTEXT_POOL.setdefault(key, Context(*key))
+        return ctx
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        result = {"database": self.database, "schema": self.schema}
+        if self.warehouse is not None:
+            result["warehouse"] = self.warehouse
+        return result
+
+
+@dataclass(frozen=True, slots=True)
+class ObjectRef:
+    """Nombre de objeto descompuesto, con el contexto en el que aparece."""
+    database: Optional[str]
+    schema: Optional[str]
+    object: Optional[str]
+    qualification_level: Optional[str] = None
+    context: Optional[Context] = None
+    inside_procedure: Optional[str] = None
+    from_variable: bool = False
+
+    @property
+    def is_qualified(self) -> bool:
+        return self.qualification_level in ("FULL", "PARTIAL")
+
+    @property
+    def fqn_id(self) -> Optional[int]:
+        """Id en SYMBOLS del nombre completo, resuelto con el contexto activo en la sentencia."""
+        if not self.object:
+            return None
+        name = ".".join(part for part in (self.database, self.schema, self.object) if part)
+        if self.context is None:
+            return resolve(name)
+        return resolve(name, self.context.database, self.context.schema)
+
+    @property
+    def fqn(self) -> Optional[str]:
+        fqn_id = self.fqn_id
+        return SYMBOLS.name(fqn_id) if fqn_id is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "database": self.database,
+            "schema": self.schema,
+            "object": self.object,
+            "is_qualified": self.is_qualified,
+        }
+        if self.qualification_level is not None:
+            result["qualification_level"] = self.qualification_level
+        if self.context is not None:
+            result["current_context"] = self.context.to_dict()
+        if self.inside_procedure:
+            result["inside_procedure"] = self.inside_procedure
+        if self.from_variable:
+            result["from_variable"] = True
+        return result
+
+
+@dataclass(frozen=True, slots=True)
+class ContextChange:
+    """Cambio de contexto de un USE DATABASE / USE SCHEMA."""
+    context: str
+    database: Optional[str]
+    schema: Optional[str] = None
+    from_variable: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.context == "database":
+            result = {"context": "database", "value": self.database}
+        else:
+            result = {"context": "schema", "database": self.database, "schema": self.schema}
+        if self.from_variable:
+            result["from_variable"] = True
+        return result
+
+
+@dataclass(frozen=True, slots=True)
+class Finding:
+    """
+    Hallazgo de una sentencia. La fase de extraccion lo crea sin riesgo; RiskScorer lo
+    sustituye por una copia con el riesgo asignado.
+    """
+    accion: str
+    objeto: Optional[str]
+    columna: Optional[str]
+    riesgo: Optional[str] = None
+    object_info: Union[ObjectRef, ContextChange, None] = None
+    template_variables: Optional[Tuple[str, ...]] = None
+    needs_lineage_check: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Vista en diccionario, con el mismo formato que se imprime y se exporta."""
+        result = {
+            "accion": self.accion,
+            "objeto": self.objeto,
+            "columna": self.columna,
+            "riesgo": self.riesgo,
+        }
+        if self.object_info is not None:
+            result["object_info"] = self.object_info.to_dict()
+        if self.template_variables:
+            result["template_variables"] = list(self.template_variables)
+        return result
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Finding":
+        """Reconstruye un hallazgo a partir de to_dict() (mas needs_lineage_check si existe)."""
+        info = data.get("object_info")
+        object_info = None
+        if info and "context" in info:
+            object_info = ContextChange(
+                info["context"],
+                info["value"] if info["context"] == "database" else info.get("database"),
+                info.get("schema"),
+                info.get("from_variable", False),
+            )
+        elif info:
+            ctx = info.get("current_context")
+            object_info = ObjectRef(
+                info.get("database"), info.get("schema"), info.get("object"),
+                info.get("qualification_level"),
+                Context.intern(ctx) if ctx is not None else None,
+                info.get("inside_procedure"),
+                info.get("from_variable", False),
+            )
+        template_variables = data.get("template_variables")
+        return Finding(
+            data["accion"], data["objeto"], data["columna"], data.get("riesgo"), object_info,
+            tuple(template_variables) if template_variables else None,
+            data.get("needs_lineage_check", False),
+        )
+
+
+def parse_object_name(obj_name: str, current_context: Optional[Dict] = None,
+                      proc_context: Optional[str] = None) -> ObjectRef:
     """
     Analiza un nombre de objeto y determina si está completamente cualificado.
-    Retorna un diccionario con database, schema, y object.
+    Retorna un ObjectRef con database, schema, y object; si se indica, con el contexto
+    activo y el procedimiento en el que aparece.
     """
+    context = Context.intern(current_context) if current_context is not None else None
     if not obj_name:
-        return {"database": None, "schema": None, "object": None, "is_qualified": False}
+        return ObjectRef(None, None, None, None, context, proc_context)
     
     # Eliminar comillas si existen
     obj_name = obj_name.strip('"').strip("'")
@@ -308,157 +649,368 @@ def parse_object_name(obj_name: str) -> Dict[str, Optional[str]]:
     parts = obj_name.split('.')
     
     if len(parts) == 3:
-        return {
-            "database": parts[0],
-            "schema": parts[1],
-            "object": parts[2],
-            "is_qualified": True,
-            "qualification_level": "FULL"
-        }
+        return ObjectRef(parts[0], parts[1], parts[2], "FULL", context, proc_context)
     elif len(parts) == 2:
-        return {
-            "database": None,
-            "schema": parts[0],
-            "object": parts[1],
-            "is_qualified": True,
-            "qualification_level": "PARTIAL"
-        }
+        return ObjectRef(None, parts[0], parts[1], "PARTIAL", context, proc_context)
     else:
-        return {
-            "database": None,
-            "schema": None,
-            "object": parts[0],
-            "is_qualified": False,
-            "qualification_level": "NONE"
-        }
+        return ObjectRef(None, None, parts[0], "NONE", context, proc_context)
 
 
-# construye y calcula el riesgo 
+# construye el hallazgo; el riesgo lo asigna despues la fase de puntuacion (RiskScorer)
 def _create_result(accion: str, objeto: Optional[str], columna: Optional[str], 
-                   needs_lineage_check: bool, object_info: Optional[Dict] = None,
-                   template_vars: Optional[List[str]] = None) -> Dict[str, Any]:
-    riesgo_base = RIESGO[accion]
-    riesgo_final = ""
-    
-    if isinstance(riesgo_base, tuple) and needs_lineage_check:
-        riesgo_con_linaje, riesgo_sin_linaje = riesgo_base
-        if has_object_lineage():
-            riesgo_final = riesgo_con_linaje  
-        else:
-            riesgo_final = riesgo_sin_linaje 
-    else:
-        riesgo_final = riesgo_base if isinstance(riesgo_base, str) else riesgo_base[0]
-    
-    result = {
-        "accion": accion,
-        "objeto": objeto,
-        "columna": columna,
-        "riesgo": riesgo_final
-    }
+                   needs_lineage_check: bool,
+                   object_info: Union[ObjectRef, ContextChange, None] = None,
+                   template_vars: Optional[List[str]] = None) -> Finding:
+    return Finding(accion, objeto, columna, None, object_info,
+                   tuple(template_vars) if template_vars else None, needs_lineage_check)
+
+_PROCEDURE_BODY_DOLLAR = re.compile(r"AS\s+\$\$", re.IGNORECASE)
+_PROCEDURE_BODY_QUOTE = re.compile(r"AS\s+'", re.IGNORECASE)
+_PROCEDURE_BODY_BLOCK = re.compile(r"\bAS\s+(?=(?:DECLARE|BEGIN)\b)", re.IGNORECASE)
+
+# tokens del cuerpo de un procedimiento; los literales sin cerrar llegan hasta el final y los
+# de comillas simples siguen la misma regla que el lexer (SINGLE_QUOTED_BODY)
+_PROCEDURE_TOKEN = re.compile(r"""
+      (?P<single>'""" + SINGLE_QUOTED_BODY + r"""(?:'|\Z))
+    | (?P<double>"(?:[^"]|"")*(?:"|\Z))
+    | (?P<dollar>\$\$.*?(?:\$\$|\Z))
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*.*?(?:\*/|\Z))
+    | (?P<semicolon>;)
+    | (?P<assign>:=)
+    | (?P<text>[^'"$;:\-/]+|.)
+""", re.DOTALL | re.VERBOSE)
+# resto de un literal entre comillas simples, como en el lexer; el grupo es la comilla que lo cierra
+_SINGLE_QUOTED_REST = re.compile(SINGLE_QUOTED_BODY + "(')?")
+# escapes de un literal entre comillas simples: '' y la barra invertida ante ' o \
+_SINGLE_QUOTE_ESCAPE = re.compile(r"''|\\(['\\])")
+_BLOCK_KEYWORDS_PREFIX = re.compile(r"^(?:(?:DECLARE|BEGIN)\b\s*)+", re.IGNORECASE)
+_EXECUTE_IMMEDIATE = re.compile(r"EXECUTE\s+IMMEDIATE\s*$", re.IGNORECASE)
 
-    if object_info:
-        result["object_info"] = object_info
-    
-    if template_vars:
-        result["template_variables"] = template_vars
-    
-    return result
 
 def extract_procedure_body(stmt_clean: str) -> Optional[str]:
     """
-    Extrae el contenido de un procedimiento almacenado, delimitado por $$ o por comillas simples.
+    Extrae el contenido de un procedimiento almacenado, delimitado por $$ o por comillas
+    simples, o sin delimitar (AS BEGIN ... END).
     """
+    match = _PROCEDURE_BODY_DOLLAR.search(stmt_clean)
+    if match:
+        # el cuerpo es lo ultimo de la sentencia: termina en su ultimo $$
+        end = stmt_clean.rfind("$$", match.end())
+        if end != -1:
+            return stmt_clean[match.end():end].strip()
+
+    match = _PROCEDURE_BODY_QUOTE.search(stmt_clean)
+    if match:
+        # el cuerpo termina en la primera comilla que no esta duplicada ni escapada
+        body = _SINGLE_QUOTED_REST.match(stmt_clean, match.end())
+        if body.group(1) is None:
+            return None
+        return _unescape_single(stmt_clean[match.end():body.start(1)])
+
+    match = _PROCEDURE_BODY_BLOCK.search(stmt_clean)
+    if match:
+        return stmt_clean[match.end():].strip()
 
-    patterns = [
-        r"AS\s+\$\$\s*(.*?)\s*\$\$",
-        r"AS\s+'(.*?)'",
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, stmt_clean, re.DOTALL | re.IGNORECASE)
-        if match:
-            return match.group(1)
-    
     return None
 
+
+def _unescape_single(content: str) -> str:
+    """Contenido de un literal entre comillas simples con sus comillas y barras escapadas resueltas."""
+    return _SINGLE_QUOTE_ESCAPE.sub(lambda m: m.group(1) or "'", content)
+
+
+def _literal_content(kind: str, token: str) -> str:
+    """Contenido de un literal '...', "..." o $$...$$ sin sus delimitadores."""
+    if kind == "dollar":
+        content = token[2:-2] if len(token) >= 4 and token.endswith("$$") else token[2:]
+        return content
+    quote = token[0]
+    content = token[1:-1] if len(token) >= 2 and token.endswith(quote) else token[1:]
+    if kind == "single":
+        return _unescape_single(content)
+    return content.replace(quote * 2, quote)
+
+
+def scan_procedure_body(proc_body: str) -> Iterator[Tuple[str, str]]:
+    """
+    Recorre el cuerpo de un procedimiento una sola vez y devuelve (tipo, texto) en el orden
+    en que aparecen:
+      - ("variable", contenido) para el literal asignado con :=
+      - ("immediate", contenido) para el literal de un EXECUTE IMMEDIATE
+      - ("statement", sentencia) para el resto de sentencias, sin comentarios
+    """
+    parts: List[str] = []
+    is_assignment = False
+    awaiting_literal = False
+    literal_seen = False
+
+    def end_statement():
+        if is_assignment:
+            return None
+        stmt = _BLOCK_KEYWORDS_PREFIX.sub("", "".join(parts).strip()).strip()
+        return stmt if stmt and stmt != ";" else None
+
+    for match in _PROCEDURE_TOKEN.finditer(proc_body):
+        kind = match.lastgroup
+        token = match.group()
+
+        if kind == "line_comment":
+            continue
+        if kind == "block_comment":
+            parts.append(" ")
+            continue
+
+        if kind in ("single", "double", "dollar"):
+            if awaiting_literal:
+                yield "variable", _literal_content(kind, token)
+            elif not literal_seen and not is_assignment:
+                prefix = _BLOCK_KEYWORDS_PREFIX.sub("", "".join(parts).strip())
+                if _EXECUTE_IMMEDIATE.match(prefix):
+                    yield "immediate", _literal_content(kind, token)
+                    # la sentencia EXECUTE IMMEDIATE en si no se analiza
+                    is_assignment = True
+            awaiting_literal = False
+            literal_seen = True
+        elif kind == "assign":
+            is_assignment = True
+            awaiting_literal = True
+        elif kind == "semicolon":
+            parts.append(token)
+            stmt = end_statement()
+            if stmt:
+                yield "statement", stmt
+            parts = []
+            is_assignment = awaiting_literal = literal_seen = False
+            continue
+        elif awaiting_literal and token.strip():
+            # := seguido de algo que no es un literal (una expresion, otra variable...)
+            awaiting_literal = False
+
+        parts.append(token)
+
+    stmt = end_statement()
+    if stmt:
+        yield "statement", stmt
+
+
+def _is_sql_literal(sql_content: str) -> bool:
+    # comprobar que el contenido de la variable contiene sentencias sql
+    return _KEYWORDS.first(sql_content, _SQL_KEYWORDS) is not None
+
+
 def extract_sql_from_variables(proc_body: str, template_vars: Dict[str, str] = None) -> List[str]:
     """
     Extrae sentencias SQL asignadas a variables en procedimientos de Snowflake
     """
+    template_vars = _template_context(template_vars)
     sql_statements = []
-    
-    # Patrones para diferentes tipos de delimitadores
-    patterns = [
-        # comillas simples
-        r"[A-Za-z_][A-Za-z0-9_]*\s*:=\s*'(.*?)'",      
-        # comillas dobles
-        r'[A-Za-z_][A-Za-z0-9_]*\s*:=\s*"(.*?)"',      
-        # $$
-        r"[A-Za-z_][A-Za-z0-9_]*\s*:=\s*\$\$(.*?)\$\$", 
-    ]
-    
-    for pattern in patterns:
-        matches = re.finditer(pattern, proc_body, re.DOTALL | re.IGNORECASE)
-        
-        for match in matches:
-            sql_content = match.group(1).strip()
-            
-            # comprobar que el contenido de la variable contiene sentencias sql
-            sql_keywords = ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 
-                           'CREATE', 'DROP', 'ALTER', 'TRUNCATE', 'GRANT', 
-                           'REVOKE', 'WITH']
-            
-            sql_upper = sql_content.upper()
-            
-            if any(keyword in sql_upper for keyword in sql_keywords):
-                normalized_sql = normalize_dynamic_sql(sql_content, template_vars)
-                sql_statements.append(normalized_sql)
-    
+    for kind, content in scan_procedure_body(proc_body):
+        if kind == "variable":
+            sql_content = content.strip()
+            if _is_sql_literal(sql_content):
+                sql_statements.append(normalize_dynamic_sql(sql_content, template_vars))
     return sql_statements
 
 
-def _handle_drop(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def iter_procedure_statements(proc_body: str, template_vars: Dict[str, str] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Sentencias a analizar de un procedimiento, en orden de aparicion:
+    las del propio cuerpo y las que contienen las variables y los EXECUTE IMMEDIATE.
+    Devuelve (origen, sentencia) con origen "statement", "variable" o "immediate".
+    """
+    template_vars = _template_context(template_vars)
+    for kind, content in scan_procedure_body(proc_body):
+        if kind == "statement":
+            yield kind, content
+            continue
+
+        sql_content = content.strip()
+        if kind == "variable" and not _is_sql_literal(sql_content):
+            continue
+        dynamic_sql = normalize_dynamic_sql(sql_content, template_vars)
+        for inner_kind, inner_stmt in scan_procedure_body(dynamic_sql):
+            if inner_kind == "statement":
+                yield kind, inner_stmt
+
+
+# patrones compilados una sola vez al importar el modulo. Ignoran mayusculas: las sentencias
+# no se copian en mayusculas, solo los nombres capturados (ver _captured)
+_OBJECT_NAME = r"([A-Z0-9_.\"]+)"
+
+# (palabra clave buscada, tipo de objeto); si aparecen varias gana la primera en la sentencia
+_DROP_OBJECT_TYPES = (
+    ("TABLE", "TABLE"), ("VIEW", "VIEW"), ("SCHEMA", "SCHEMA"), ("DATABASE", "DATABASE"),
+    ("WAREHOUSE", "WAREHOUSE"), ("SHARE", "SHARE"), ("TAG", "TAG"), ("ACCESS_POLICY", "ACCESS_POLICY"),
+    ("TASK", "TASK"), ("RESOURCE MONITOR", "RESOURCE_MONITOR"), ("PROCEDURE", "PROCEDURE"),
+)
+_CREATE_OBJECT_TYPES = (
+    ("VIEW", "VIEW"), ("TABLE", "TABLE"), ("TASK", "TASK"), ("SCHEMA", "SCHEMA"),
+    ("DATABASE", "DATABASE"), ("WAREHOUSE", "WAREHOUSE"), ("SHARE", "SHARE"), ("TAG", "TAG"),
+    ("ACCESS_POLICY", "ACCESS_POLICY"), ("RESOURCE MONITOR", "RESOURCE_MONITOR"),
+)
+_UNDROP_OBJECT_TYPES = (
+    ("TABLE", "TABLE"), ("SCHEMA", "SCHEMA"), ("DATABASE", "DATABASE"), ("TAG", "TAG"),
+)
+_ALTER_OBJECT_ACTIONS = (
+    ("VIEW", "ALTER_VIEW"),
+    ("DATABASE", "ALTER_DATABASE"),
+    ("SCHEMA", "ALTER_SCHEMA"),
+    ("WAREHOUSE", "ALTER_WAREHOUSE"),
+    ("SHARE", "ALTER_SHARE"),
+    ("TAG", "ALTER_TAG"),
+    ("ACCESS_POLICY", "ALTER_ACCESS_POLICY"),
+    ("TASK", "ALTER_TASK"),
+    ("RESOURCE MONITOR", "ALTER_RESOURCE_MONITOR"),
+    ("PROCEDURE", "ALTER_PROCEDURE"),
+)
+
+
+
+class KeywordDetector:
+    """
+    Detecta palabras clave completas (no dentro de identificadores) con una sola expresion
+    regular construida al crear el detector. Las palabras de una clave compuesta pueden ir
+    separadas por cualquier espacio, y las que son a su vez claves tambien se informan.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = tuple(dict.fromkeys(" ".join(k.upper().split()) for k in keywords))
+        # la alternativa mas larga primero: "DROP COLUMN" antes que "DROP"
+        alternatives = sorted(self.keywords, key=len, reverse=True)
+        self._pattern = re.compile(
+            r"(?<![\w$])(?:" + "|".join(r"\s+".join(map(re.escape, k.split())) for k in alternatives) + r")(?![\w$])",
+            re.IGNORECASE,
+        )
+        single_words = {k for k in self.keywords if " " not in k}
+        self._inner_keywords = {
+            k: [(i, word) for i, word in enumerate(k.split()) if word in single_words]
+            for k in self.keywords if " " in k
+        }
+
+    def iter_matches(self, text: str, start: int = 0) -> Iterator[Tuple[str, int]]:
+        """Devuelve (palabra clave, posicion) en orden de aparicion."""
+        for match in self._pattern.finditer(text, start):
+            keyword = " ".join(match.group().upper().split())
+            yield keyword, match.start()
+            inner = self._inner_keywords.get(keyword)
+            if inner:
+                words = list(re.finditer(r"\S+", match.group()))
+                for i, word in inner:
+                    yield word, match.start() + words[i].start()
+
+    def first(self, text: str, keywords, start: int = 0,
+              end: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """Primera de las palabras clave indicadas que aparece en text[start:end], con su posicion."""
+        for keyword, pos in self.iter_matches(text, start):
+            if end is not None and pos >= end:
+                break
+            if keyword in keywords:
+                return keyword, pos
+        return None
+
+
+# palabras clave que indican que el contenido de una variable es una sentencia sql
+_SQL_KEYWORDS = frozenset(['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 
+                           'CREATE', 'DROP', 'ALTER', 'TRUNCATE', 'GRANT', 
+                           'REVOKE', 'WITH'])
+_DROP_TYPE_KEYWORDS = dict(_DROP_OBJECT_TYPES)
+_CREATE_TYPE_KEYWORDS = dict(_CREATE_OBJECT_TYPES)
+_UNDROP_TYPE_KEYWORDS = dict(_UNDROP_OBJECT_TYPES)
+_ALTER_TYPE_KEYWORDS = dict((("TABLE", "ALTER_TABLE"),) + _ALTER_OBJECT_ACTIONS)
+_CREATE_MODIFIERS = frozenset(["OR REPLACE", "OR ALTER"])
+_ALTER_TABLE_OPERATIONS = frozenset(["ADD COLUMN", "DROP COLUMN", "ALTER COLUMN"])
+
+# detector compartido por todas las comprobaciones de palabras clave del analizador
+_KEYWORDS = KeywordDetector(
+    list(_SQL_KEYWORDS) + list(_DROP_TYPE_KEYWORDS) + list(_CREATE_TYPE_KEYWORDS)
+    + list(_UNDROP_TYPE_KEYWORDS) + list(_ALTER_TYPE_KEYWORDS)
+    + list(_CREATE_MODIFIERS) + list(_ALTER_TABLE_OPERATIONS) + ["TYPE"]
+)
+
+
+class _PatternTable(dict):
+    """
+    Patrones por tipo de objeto. Cada uno se compila la primera vez que se pide y queda
+    guardado, de modo que arrancar no paga la compilacion de los tipos que no aparecen.
+    """
+
+    def __init__(self, template: Callable[[str], str]):
+        super().__init__()
+        self.template = template
+
+    def __missing__(self, key: str) -> re.Pattern:
+        pattern = self[key] = re.compile(self.template(key), re.IGNORECASE)
+        return pattern
+
+
+_DROP_NAME_PATTERNS = _PatternTable(
+    lambda obj_type: fr"{obj_type.replace('_', ' ')}\s+(?:IF\s+EXISTS\s+)?{_OBJECT_NAME}")
+_CREATE_NAME_PATTERNS = _PatternTable(
+    lambda obj_type: fr"{obj_type.replace('_', ' ')}\s+(?:IF\s+NOT\s+EXISTS\s+)?{_OBJECT_NAME}")
+_UNDROP_NAME_PATTERNS = _PatternTable(
+    lambda obj_type: fr"{obj_type}\s+{_OBJECT_NAME}(?=\s*;|\s*$)")
+_ALTER_NAME_PATTERNS = _PatternTable(
+    lambda obj_keyword: fr"{obj_keyword}\s+(?:IF\s+EXISTS\s+)?{_OBJECT_NAME}")
+
+_ALTER_TABLE_NAME_PATTERN = re.compile(fr"TABLE\s+(?:IF\s+EXISTS\s+)?{_OBJECT_NAME}", re.IGNORECASE)
+_ADD_COLUMN_PATTERN = re.compile(r"ADD\s+COLUMN\s+([A-Z0-9_\"]+)", re.IGNORECASE)
+_DROP_COLUMN_PATTERN = re.compile(r"DROP\s+COLUMN\s+([A-Z0-9_\"]+)", re.IGNORECASE)
+_ALTER_COLUMN_PATTERN = re.compile(r"ALTER\s+COLUMN\s+([A-Z0-9_\"]+)", re.IGNORECASE)
+_INSERT_PATTERN = re.compile(fr"INSERT\s+INTO\s+{_OBJECT_NAME}(?=\s*[\(]|\s+VALUES)", re.IGNORECASE)
+_DELETE_PATTERN = re.compile(fr"DELETE\s+FROM\s+{_OBJECT_NAME}(?=\s+(?:WHERE|USING)|\s*;|\s*$)", re.IGNORECASE)
+_MERGE_USING_PATTERN = re.compile(fr"MERGE\s+INTO\s+{_OBJECT_NAME}(?:\s+(?:AS\s+)?[A-Z0-9_\"]+)?\s+USING", re.IGNORECASE)
+_MERGE_PATTERN = re.compile(fr"MERGE\s+INTO\s+{_OBJECT_NAME}", re.IGNORECASE)
+_TRUNCATE_PATTERN = re.compile(fr"TABLE\s+{_OBJECT_NAME}(?=\s*;|\s*$)", re.IGNORECASE)
+_GRANT_PATTERN = re.compile(fr"GRANT\s+([A-Z_,\s]+)\s+ON\s+[A-Z_]+\s+{_OBJECT_NAME}(?=\s+TO)", re.IGNORECASE)
+_REVOKE_PATTERN = re.compile(fr"REVOKE\s+([A-Z_,\s]+)\s+ON\s+[A-Z_]+\s+{_OBJECT_NAME}(?=\s+FROM)", re.IGNORECASE)
+_USE_DATABASE_PREFIX = re.compile(r"^USE\s+DATABASE\s+", re.IGNORECASE)
+_USE_DATABASE_PATTERN = re.compile(fr"^USE\s+(?:DATABASE\s+)?{_OBJECT_NAME}", re.IGNORECASE)
+_USE_SCHEMA_PREFIX = re.compile(r"^USE\s+SCHEMA\s", re.IGNORECASE)
+_USE_SCHEMA_PATTERN = re.compile(fr"^USE\s+SCHEMA\s+{_OBJECT_NAME}", re.IGNORECASE)
+_USE_WAREHOUSE_PREFIX = re.compile(r"^USE\s+WAREHOUSE\s", re.IGNORECASE)
+_USE_WAREHOUSE_PATTERN = re.compile(fr"USE\s+WAREHOUSE\s+{_OBJECT_NAME}", re.IGNORECASE)
+_USE_PREFIX = re.compile(r"^USE\s+[A-Z0-9_.\"]", re.IGNORECASE)
+_USE_PATTERN = re.compile(fr"^USE\s+{_OBJECT_NAME}", re.IGNORECASE)
+_EXECUTE_TASK_PATTERN = re.compile(fr"EXECUTE\s+TASK\s+{_OBJECT_NAME}", re.IGNORECASE)
+_EXECUTE_PROCEDURE_PATTERN = re.compile(fr"EXECUTE\s+{_OBJECT_NAME}\s*\(", re.IGNORECASE)
+_CALL_PATTERN = re.compile(fr"CALL\s+PROCEDURE\s+{_OBJECT_NAME}\s*\(?", re.IGNORECASE)
+_CREATE_PROCEDURE_PREFIX = re.compile(r"^CREATE\s+(OR\s+REPLACE\s+)?PROCEDURE", re.IGNORECASE)
+# bloque anonimo de Snowflake Scripting (BEGIN TRANSACTION no lo es)
+_ANONYMOUS_BLOCK_PREFIX = re.compile(r"^(?:DECLARE|BEGIN(?!\s+(?:TRANSACTION|WORK|NAME)\b))(?=\s)", re.IGNORECASE)
+_PROCEDURE_NAME_PATTERN = re.compile(fr"PROCEDURE\s+{_OBJECT_NAME}\s*\(", re.IGNORECASE)
+
+
+def _captured(match: Optional[re.Match], group: int = 1) -> Optional[str]:
+    """Texto capturado por un patron, en mayusculas; None si no hay coincidencia."""
+    return match.group(group).upper() if match else None
+
+
+def _detect_object_type(stmt_clean: str, object_types: Dict[str, str]) -> Tuple[str, int]:
+    """Tipo de objeto de la primera palabra clave de object_types en la sentencia, y su posicion."""
+    found = _KEYWORDS.first(stmt_clean, object_types)
+    if found is None:
+        return "", -1
+    keyword, pos = found
+    return object_types[keyword], pos
+
+
+def _handle_drop(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para sentencias DROP."""
-    obj_type = ""
-    if "TABLE" in stmt_clean: obj_type = "TABLE"
-    elif "VIEW" in stmt_clean: obj_type = "VIEW"
-    elif "SCHEMA" in stmt_clean: obj_type = "SCHEMA"
-    elif "DATABASE" in stmt_clean: obj_type = "DATABASE"
-    elif "WAREHOUSE" in stmt_clean: obj_type = "WAREHOUSE"
-    elif "SHARE" in stmt_clean: obj_type = "SHARE"
-    elif "TAG" in stmt_clean: obj_type = "TAG"
-    elif "ACCESS_POLICY" in stmt_clean: obj_type = "ACCESS_POLICY"
-    elif "TASK" in stmt_clean: obj_type = "TASK"
-    elif "RESOURCE MONITOR" in stmt_clean: obj_type = "RESOURCE_MONITOR"
-    elif "PROCEDURE" in stmt_clean: obj_type = "PROCEDURE"
+    obj_type, type_pos = _detect_object_type(stmt_clean, _DROP_TYPE_KEYWORDS)
     
     if not obj_type:
         return []
     
-    match = re.search(fr"{obj_type.replace('_', ' ')}\s+(?:IF\s+EXISTS\s+)?([A-Z0-9_.\"]+)", stmt_clean)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    match = _DROP_NAME_PATTERNS[obj_type].search(stmt_clean, type_pos)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result(f"DROP_{obj_type}", obj_name, None, True, obj_info)]
 
-def _handle_create(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_create(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para sentencias CREATE."""
-    obj_type = ""
-    if "VIEW" in stmt_clean: obj_type = "VIEW"
-    elif "TABLE" in stmt_clean: obj_type = "TABLE"
-    elif "TASK" in stmt_clean: obj_type = "TASK"
-    elif "SCHEMA" in stmt_clean: obj_type = "SCHEMA"
-    elif "DATABASE" in stmt_clean: obj_type = "DATABASE"
-    elif "WAREHOUSE" in stmt_clean: obj_type = "WAREHOUSE"
-    elif "SHARE" in stmt_clean: obj_type = "SHARE"
-    elif "TAG" in stmt_clean: obj_type = "TAG"
-    elif "ACCESS_POLICY" in stmt_clean: obj_type = "ACCESS_POLICY"
-    elif "RESOURCE MONITOR" in stmt_clean: obj_type = "RESOURCE_MONITOR"
+    obj_type, type_pos = _detect_object_type(stmt_clean, _CREATE_TYPE_KEYWORDS)
     
     if not obj_type:
         return []
@@ -466,209 +1018,145 @@ def _handle_create(stmt_clean: str, current_context: Dict, proc_context: Optiona
     accion_base = f"CREATE_{obj_type}"
     needs_lineage_check = False
     
-    if "OR REPLACE" in stmt_clean:
-        accion_base = f"CREATE_OR_REPLACE_{obj_type}"
-        needs_lineage_check = True
-    elif "OR ALTER" in stmt_clean:
-        accion_base = f"CREATE_OR_ALTER_{obj_type}"
+    # OR REPLACE / OR ALTER solo cuentan delante del tipo de objeto, no en el cuerpo
+    modifier = _KEYWORDS.first(stmt_clean, _CREATE_MODIFIERS, end=type_pos)
+    if modifier is not None:
+        accion_base = f"CREATE_{modifier[0].replace(' ', '_')}_{obj_type}"
         needs_lineage_check = True
     
-    match = re.search(fr"{obj_type.replace('_', ' ')}\s+(?:IF\s+NOT\s+EXISTS\s+)?([A-Z0-9_.\"]+)", stmt_clean)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    match = _CREATE_NAME_PATTERNS[obj_type].search(stmt_clean, type_pos)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result(accion_base, obj_name, None, needs_lineage_check, obj_info)]
 
-def _handle_alter_table(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_alter_table(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler específico para ALTER TABLE."""
-    table_match = re.search(r"TABLE\s+(?:IF\s+EXISTS\s+)?([A-Z0-9_.\"]+)", stmt_clean)
-    tabla = table_match.group(1) if table_match else None
-    obj_info = parse_object_name(tabla) if tabla else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
-    
-    if "ADD COLUMN" in stmt_clean:
-        col_match = re.search(r"ADD\s+COLUMN\s+([A-Z0-9_\"]+)", stmt_clean)
-        columna = col_match.group(1) if col_match else None
+    table_match = _ALTER_TABLE_NAME_PATTERN.search(stmt_clean)
+    tabla = _captured(table_match)
+    obj_info = parse_object_name(tabla, current_context, proc_context) if tabla else None
+    
+    operation = _KEYWORDS.first(stmt_clean, _ALTER_TABLE_OPERATIONS)
+    operation, operation_pos = operation if operation else (None, -1)
+    
+    if operation == "ADD COLUMN":
+        col_match = _ADD_COLUMN_PATTERN.search(stmt_clean, operation_pos)
+        columna = _captured(col_match)
         return [_create_result("ALTER_TABLE_ADD_COLUMN", tabla, columna, False, obj_info)]
-    elif "DROP COLUMN" in stmt_clean:
-        col_match = re.search(r"DROP\s+COLUMN\s+([A-Z0-9_\"]+)", stmt_clean)
-        columna = col_match.group(1) if col_match else None
+    elif operation == "DROP COLUMN":
+        col_match = _DROP_COLUMN_PATTERN.search(stmt_clean, operation_pos)
+        columna = _captured(col_match)
         return [_create_result("ALTER_TABLE_DROP_COLUMN", tabla, columna, True, obj_info)]
-    elif "ALTER COLUMN" in stmt_clean and "TYPE" in stmt_clean:
-        col_match = re.search(r"ALTER\s+COLUMN\s+([A-Z0-9_\"]+)", stmt_clean)
-        columna = col_match.group(1) if col_match else None
+    elif operation == "ALTER COLUMN" and _KEYWORDS.first(stmt_clean, ("TYPE",), operation_pos):
+        col_match = _ALTER_COLUMN_PATTERN.search(stmt_clean, operation_pos)
+        columna = _captured(col_match)
         return [_create_result("ALTER_TABLE_MODIFY_COLUMN_TYPE", tabla, columna, True, obj_info)]
     else:
         return [_create_result("ALTER_TABLE_NOT_COLUMNS", tabla, None, True, obj_info)]
 
-def _handle_alter(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_alter(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para sentencias ALTER."""
-    if "TABLE" in stmt_clean:
+    found = _KEYWORDS.first(stmt_clean, _ALTER_TYPE_KEYWORDS)
+    if found is None:
+        return []
+    
+    obj_keyword, type_pos = found
+    if obj_keyword == "TABLE":
         return _handle_alter_table(stmt_clean, current_context, proc_context)
     
     # Para otros tipos de ALTER
-    obj_type_map = {
-        "VIEW": "ALTER_VIEW",
-        "DATABASE": "ALTER_DATABASE",
-        "SCHEMA": "ALTER_SCHEMA",
-        "WAREHOUSE": "ALTER_WAREHOUSE",
-        "SHARE": "ALTER_SHARE",
-        "TAG": "ALTER_TAG",
-        "ACCESS_POLICY": "ALTER_ACCESS_POLICY",
-        "TASK": "ALTER_TASK",
-        "RESOURCE MONITOR": "ALTER_RESOURCE_MONITOR",
-        "PROCEDURE": "ALTER_PROCEDURE"
-    }
-    
-    for obj_keyword, action in obj_type_map.items():
-        if obj_keyword in stmt_clean:
-            match = re.search(fr"{obj_keyword}\s+(?:IF\s+EXISTS\s+)?([A-Z0-9_.\"]+)", stmt_clean)
-            obj_name = match.group(1) if match else None
-            obj_info = parse_object_name(obj_name) if obj_name else None
-            
-            if obj_info:
-                obj_info["current_context"] = current_context.copy()
-                if proc_context:
-                    obj_info["inside_procedure"] = proc_context
-            
-            return [_create_result(action, obj_name, None, True, obj_info)]
+    match = _ALTER_NAME_PATTERNS[obj_keyword].search(stmt_clean, type_pos)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
-    return []
+    return [_create_result(_ALTER_TYPE_KEYWORDS[obj_keyword], obj_name, None, True, obj_info)]
 
-def _handle_insert(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_insert(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para INSERT."""
-    match = re.search(r"INSERT\s+INTO\s+([A-Z0-9_.\"]+)(?=\s*[\(]|\s+VALUES)", stmt_clean)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    match = _INSERT_PATTERN.search(stmt_clean)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result("INSERT_VALUES", obj_name, None, True, obj_info)]
 
-def _handle_delete(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_delete(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para DELETE."""
-    match = re.search(r"DELETE\s+FROM\s+([A-Z0-9_.\"]+)(?=\s+(?:WHERE|USING)|\s*;|\s*$)", stmt_clean)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    match = _DELETE_PATTERN.search(stmt_clean)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result("DELETE_VALUES", obj_name, None, True, obj_info)]
 
-def _handle_merge(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_merge(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para MERGE."""
-    match = re.search(r"MERGE\s+INTO\s+([A-Z0-9_.\"]+)(?:\s+(?:AS\s+)?[A-Z0-9_\"]+)?\s+USING", stmt_clean, re.IGNORECASE)
+    match = _MERGE_USING_PATTERN.search(stmt_clean)
     if not match:
-        match = re.search(r"MERGE\s+INTO\s+([A-Z0-9_.\"]+)", stmt_clean, re.IGNORECASE)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+        match = _MERGE_PATTERN.search(stmt_clean)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result("MERGE_VALUES", obj_name, None, True, obj_info)]
 
-def _handle_truncate(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_truncate(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para TRUNCATE."""
-    match = re.search(r"TABLE\s+([A-Z0-9_.\"]+)(?=\s*;|\s*$)", stmt_clean)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    match = _TRUNCATE_PATTERN.search(stmt_clean)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result("TRUNCATE_TABLE", obj_name, None, True, obj_info)]
 
-def _handle_undrop(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_undrop(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para UNDROP."""
-    obj_type = ""
-    if "TABLE" in stmt_clean: obj_type = "TABLE"
-    elif "SCHEMA" in stmt_clean: obj_type = "SCHEMA"
-    elif "DATABASE" in stmt_clean: obj_type = "DATABASE"
-    elif "TAG" in stmt_clean: obj_type = "TAG"
+    obj_type, type_pos = _detect_object_type(stmt_clean, _UNDROP_TYPE_KEYWORDS)
     
     if not obj_type:
         return []
     
-    match = re.search(fr"{obj_type}\s+([A-Z0-9_.\"]+)(?=\s*;|\s*$)", stmt_clean)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    match = _UNDROP_NAME_PATTERNS[obj_type].search(stmt_clean, type_pos)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result(f"UNDROP_{obj_type}", obj_name, None, False, obj_info)]
 
-def _handle_grant(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_grant(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para GRANT."""
-    match = re.search(r"GRANT\s+([A-Z_,\s]+)\s+ON\s+[A-Z_]+\s+([A-Z0-9_.\"]+)(?=\s+TO)", stmt_clean)
+    match = _GRANT_PATTERN.search(stmt_clean)
     if not match:
         return []
     
-    obj_name = match.group(2)
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    obj_name = _captured(match, 2)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result("GRANT_PRIVILEGE", obj_name, None, True, obj_info)]
 
-def _handle_revoke(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_revoke(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para REVOKE."""
-    match = re.search(r"REVOKE\s+([A-Z_,\s]+)\s+ON\s+[A-Z_]+\s+([A-Z0-9_.\"]+)(?=\s+FROM)", stmt_clean)
+    match = _REVOKE_PATTERN.search(stmt_clean)
     if not match:
         return []
     
-    obj_name = match.group(2)
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    obj_name = _captured(match, 2)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result("REVOKE_PRIVILEGE", obj_name, None, False, obj_info)]
 
-def _handle_use(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_use(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para USE DATABASE/SCHEMA."""
     # USE DATABASE
-    if re.match(r"^USE\s+DATABASE\s+", stmt_clean):
-        match = re.search(r"^USE\s+(?:DATABASE\s+)?([A-Z0-9_.\"]+)", stmt_clean)
+    if _USE_DATABASE_PREFIX.match(stmt_clean):
+        match = _USE_DATABASE_PATTERN.search(stmt_clean)
         if match:
-            db_name = match.group(1).strip('"').strip("'")
+            db_name = match.group(1).upper().strip('"').strip("'")
             current_context["database"] = db_name
             current_context["schema"] = None
             return [_create_result("USE_DATABASE", db_name, None, False, 
-                                  {"context": "database", "value": db_name})]
+                                  ContextChange("database", db_name))]
     
     # USE SCHEMA
-    elif re.match(r"^USE\s+SCHEMA\s", stmt_clean):
-        match = re.search(r"^USE\s+SCHEMA\s+([A-Z0-9_.\"]+)", stmt_clean)
+    elif _USE_SCHEMA_PREFIX.match(stmt_clean):
+        match = _USE_SCHEMA_PATTERN.search(stmt_clean)
         if match:
-            full_name = match.group(1).strip('"').strip("'")
+            full_name = match.group(1).upper().strip('"').strip("'")
             parts = full_name.split('.')
             
             if len(parts) == 2:
@@ -678,200 +1166,1187 @@ def _handle_use(stmt_clean: str, current_context: Dict, proc_context: Optional[s
                 current_context["schema"] = parts[0]
             
             return [_create_result("USE_SCHEMA", full_name, None, False, 
-                                  {"context": "schema", 
-                                   "database": current_context["database"],
-                                   "schema": current_context["schema"]})]
+                                  ContextChange("schema", current_context["database"],
+                                                current_context["schema"]))]
     
     # USE WAREHOUSE
-    elif re.match(r"^USE\s+WAREHOUSE\s", stmt_clean):
-        match = re.search(r"USE\s+WAREHOUSE\s+([A-Z0-9_.\"]+)", stmt_clean)
+    elif _USE_WAREHOUSE_PREFIX.match(stmt_clean):
+        match = _USE_WAREHOUSE_PATTERN.search(stmt_clean)
         if match:
-            warehouse_name = match.group(1).strip('"').strip("'")
+            warehouse_name = match.group(1).upper().strip('"').strip("'")
             current_context["warehouse"] = warehouse_name
-            risk_level = "ALTA"
-            if is_warehouse_xs():
-                risk_level = "BAJA"
-
-            obj_info = parse_object_name(warehouse_name) if warehouse_name else None
-    
-            if obj_info:
-                obj_info["current_context"] = current_context.copy()
-                if proc_context:
-                    obj_info["inside_procedure"] = proc_context
+            # el riesgo depende del tamaño del warehouse, que se consulta al puntuar
+            obj_info = parse_object_name(warehouse_name, current_context, proc_context) if warehouse_name else None
             return [_create_result("USE_WAREHOUSE", warehouse_name, None, True, obj_info)]
     
     # USE (equivalente a USE DATABASE)
-    elif re.match(r"^USE\s+[A-Z0-9_.\"]", stmt_clean):
-        match = re.search(r"^USE\s+([A-Z0-9_.\"]+)", stmt_clean)
+    elif _USE_PREFIX.match(stmt_clean):
+        match = _USE_PATTERN.search(stmt_clean)
         if match:
-            db_name = match.group(1).strip('"').strip("'")
+            db_name = match.group(1).upper().strip('"').strip("'")
             current_context["database"] = db_name
             current_context["schema"] = None
             return [_create_result("USE_DATABASE", db_name, None, False, 
-                                  {"context": "database", "value": db_name})]
+                                  ContextChange("database", db_name))]
     
     return []
 
-def _handle_execute(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_execute(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para EXECUTE."""
-    match_task = re.search(r"EXECUTE\s+TASK\s+([A-Z0-9_.\"]+)", stmt_clean, re.IGNORECASE)
+    match_task = _EXECUTE_TASK_PATTERN.search(stmt_clean)
     if match_task:
-        obj_name = match_task.group(1)
-        obj_info = parse_object_name(obj_name)
-        if obj_info:
-            obj_info["current_context"] = current_context.copy()
-            if proc_context:
-                obj_info["inside_procedure"] = proc_context
+        obj_name = _captured(match_task)
+        obj_info = parse_object_name(obj_name, current_context, proc_context)
         return [_create_result("EXECUTE_TASK", obj_name, None, False, obj_info)]
     
-    match_proc = re.search(r"EXECUTE\s+([A-Z0-9_.\"]+)\s*\(", stmt_clean, re.IGNORECASE)
+    match_proc = _EXECUTE_PROCEDURE_PATTERN.search(stmt_clean)
     if match_proc:
-        obj_name = match_proc.group(1)
-        obj_info = parse_object_name(obj_name)
-        if obj_info:
-            obj_info["current_context"] = current_context.copy()
-            if proc_context:
-                obj_info["inside_procedure"] = proc_context
+        obj_name = _captured(match_proc)
+        obj_info = parse_object_name(obj_name, current_context, proc_context)
         return [_create_result("EXECUTE_PROCEDURE", obj_name, None, False, obj_info)]
     
     return []
 
-def _handle_call(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+def _handle_call(stmt_clean: str, current_context: Dict, proc_context: Optional[str] = None) -> List[Finding]:
     """Handler para CALL."""
-    match = re.search(r"CALL\s+PROCEDURE\s+([A-Z0-9_.\"]+)\s*\(?", stmt_clean)
-    obj_name = match.group(1) if match else None
-    obj_info = parse_object_name(obj_name) if obj_name else None
-    
-    if obj_info:
-        obj_info["current_context"] = current_context.copy()
-        if proc_context:
-            obj_info["inside_procedure"] = proc_context
+    match = _CALL_PATTERN.search(stmt_clean)
+    obj_name = _captured(match)
+    obj_info = parse_object_name(obj_name, current_context, proc_context) if obj_name else None
     
     return [_create_result("CALL_PROCEDURE", obj_name, None, True, obj_info)]
 
 
+# palabras clave con las que empieza cada tipo de sentencia. Entre palabras de una misma
+# entrada se exigen espacios; el booleano indica si tras la ultima palabra debe haber un espacio
 STATEMENT_HANDLERS = [
-    (r"^USE\s+", _handle_use),
-    (r"^CREATE", _handle_create),
-    (r"^ALTER", _handle_alter),
-    (r"^DROP", _handle_drop),
-    (r"^UNDROP", _handle_undrop),
-    (r"^TRUNCATE\s+TABLE", _handle_truncate),
-    (r"^INSERT\s+INTO", _handle_insert),
-    (r"^MERGE\s+INTO", _handle_merge),
-    (r"^DELETE\s+FROM", _handle_delete),
-    (r"^GRANT\s+", _handle_grant),
-    (r"^REVOKE\s+", _handle_revoke),
-    (r"^EXECUTE\s+", _handle_execute),
-    (r"^CALL\s+", _handle_call),
+    (("USE",), True, _handle_use),
+    (("CREATE",), False, _handle_create),
+    (("ALTER",), False, _handle_alter),
+    (("DROP",), False, _handle_drop),
+    (("UNDROP",), False, _handle_undrop),
+    (("TRUNCATE", "TABLE"), False, _handle_truncate),
+    (("INSERT", "INTO"), False, _handle_insert),
+    (("MERGE", "INTO"), False, _handle_merge),
+    (("DELETE", "FROM"), False, _handle_delete),
+    (("GRANT",), True, _handle_grant),
+    (("REVOKE",), True, _handle_revoke),
+    (("EXECUTE",), True, _handle_execute),
+    (("CALL",), True, _handle_call),
 ]
 
+# clave del trie que representa una secuencia de espacios y clave que guarda el handler
+_TRIE_SPACE = " "
+_TRIE_HANDLER = None
+
+
+def _build_statement_trie(handlers) -> Dict:
+    """
+    Construye un trie de caracteres con las palabras clave iniciales de cada sentencia.
+    """
+    root: Dict = {}
+    for keywords, needs_space, handler in handlers:
+        node = root
+        for i, keyword in enumerate(keywords):
+            if i:
+                node = node.setdefault(_TRIE_SPACE, {})
+            for char in keyword:
+                child = node.get(char)
+                if child is None:
+                    # mayusculas y minusculas llevan al mismo nodo
+                    child = node[char] = node[char.lower()] = {}
+                node = child
+        if needs_space:
+            node = node.setdefault(_TRIE_SPACE, {})
+        node[_TRIE_HANDLER] = handler
+    return root
+
+_STATEMENT_TRIE = _build_statement_trie(STATEMENT_HANDLERS)
+
+
+def clasificar_sentencia(stmt_clean: str) -> Optional[Callable]:
+    """
+    Recorre el prefijo de la sentencia sobre el trie de palabras clave y devuelve su handler.
+    Solo se leen los caracteres necesarios para decidir, sin evaluar ninguna regex.
+    """
+    node = _STATEMENT_TRIE
+    i = 0
+    n = len(stmt_clean)
+    while True:
+        handler = node.get(_TRIE_HANDLER)
+        if handler is not None:
+            return handler
+        if i >= n:
+            return None
+        char = stmt_clean[i]
+        if char.isspace():
+            node = node.get(_TRIE_SPACE)
+            i += 1
+            while i < n and stmt_clean[i].isspace():
+                i += 1
+        else:
+            node = node.get(char)
+            i += 1
+        if node is None:
+            return None
+
+# tamaño de los bloques leidos del fichero en modo streaming
+_STREAM_CHUNK_SIZE = 1 << 20
+
+def iter_statements(path_sql: str, chunk_size: int = _STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Lee el fichero por bloques y devuelve las sentencias de una en una, sin comentarios,
+    separadas con el lexer de Snowflake (literales, $$, comentarios y bloques BEGIN ... END).
+    La memoria queda acotada por la sentencia mas grande, no por el tamaño del fichero.
+    """
+    for _, _, stmt in iter_statement_spans(path_sql, chunk_size):
+        yield stmt
+
+
+def iter_statement_spans(path_sql: str, chunk_size: int = _STREAM_CHUNK_SIZE) -> Iterator[Tuple[int, int, str]]:
+    """
+    Como iter_statements, pero devuelve (primera linea, ultima linea, sentencia), con las
+    lineas del fichero original numeradas desde 1.
+    """
+    buf = ""
+    # numero de linea de buf[line_pos]
+    line = 1
+    with open(path_sql) as f:
+        final = False
+        while not final:
+            chunk = f.read(chunk_size)
+            final = not chunk
+            # se mantiene solo la sentencia en curso: lo ya emitido se descarta
+            buf += chunk
+            line_pos = 0
+            consumed = 0
+            for start, end, nxt, comments in split_statements(buf, 0, final):
+                line += buf.count("\n", line_pos, start)
+                line_pos = start
+                yield line, line + buf.count("\n", start, nxt - 1), statement_text(buf, start, end, comments)
+                consumed = nxt
+            line += buf.count("\n", line_pos, consumed)
+            buf = buf[consumed:]
+
+
+def _read_source(path_sql: str) -> str:
+    """
+    Texto completo del fichero, con los finales de linea \\r\\n convertidos a \\n. Las
+    sentencias se sacan despues como tramos de este texto, sin una copia por sentencia.
+    """
+    return Path(path_sql).read_text(encoding="utf-8")
+
+
+def _strip_line_comments(stmt: str) -> str:
+    """Quita las lineas de comentario --; solo hace falta con sqlparse, el lexer ya los quita."""
+    lines = stmt.strip().split('\n')
+    return '\n'.join(line for line in lines if not line.strip().startswith('--')).strip()
+
+
+def _iter_text_statements(sql_text: str, template_ctx: TemplateContext, warn: bool = True,
+                          variables: Optional[Dict[str, None]] = None) -> Iterator[str]:
+    """
+    Sentencias de un texto ya leido, con las variables de template resueltas. Cada sentencia
+    es la unica copia de su tramo del texto; la plantilla solo crea otra si tiene {{ }} o { }.
+    Si se indica variables, se añaden los nombres de las que aparecen.
+    """
+    prof = get_profiler()
+    for start, end, _, comments in prof.iter_stage("split", split_statements(sql_text)):
+        stmt = statement_text(sql_text, start, end, comments)
+        with prof.stage("plantillas"):
+            resolved_stmt, detected_vars = template_ctx.resolve(stmt, warn)
+        if variables is not None:
+            variables.update(dict.fromkeys(detected_vars))
+        yield resolved_stmt
+
+
+def _iter_resolved_statements(path_sql: str, template_ctx: TemplateContext,
+                              variables: Optional[Dict[str, None]] = None) -> Iterator[str]:
+    """Resuelve las variables de template de cada sentencia a medida que se lee."""
+    prof = get_profiler()
+    for stmt in prof.iter_stage("split", iter_statements(path_sql)):
+        with prof.stage("plantillas"):
+            resolved_stmt, detected_vars = template_ctx.resolve(stmt)
+        if variables is not None:
+            variables.update(dict.fromkeys(detected_vars))
+        yield resolved_stmt
+
+
+# sentencias que pueden cambiar el contexto aunque no esten en el diff
+_MAY_CHANGE_CONTEXT = re.compile(r"\bUSE\b", re.IGNORECASE)
+
+
+def _iter_statements_in_lines(path_sql: str, template_ctx: TemplateContext,
+                              lineas: List[Tuple[int, int]]) -> Iterator[Tuple[str, bool]]:
+    """
+    Devuelve (sentencia, tocada) indicando si la sentencia se solapa con alguno de los
+    rangos de lineas. Solo se resuelven las variables de las que hay que procesar.
+    """
+    prof = get_profiler()
+    rangos = sorted(lineas)
+    j = 0
+    for first_line, last_line, stmt in prof.iter_stage("split", iter_statement_spans(path_sql)):
+        while j < len(rangos) and rangos[j][1] < first_line:
+            j += 1
+        touched = j < len(rangos) and rangos[j][0] <= last_line
+        if not touched and not _MAY_CHANGE_CONTEXT.search(stmt):
+            prof.count("sentencias_fuera_del_diff")
+            continue
+        with prof.stage("plantillas"):
+            resolved_stmt, _ = template_ctx.resolve(stmt)
+        yield resolved_stmt, touched
+
+
+# separador de sentencias: el lexer propio o, si se pide, sqlparse.split
+SPLITTER_ENV_VAR = "SQL_RISK_SPLITTER"
+SPLITTERS = ("lexer", "sqlparse")
+
+
+def _splitter() -> str:
+    return os.environ.get(SPLITTER_ENV_VAR) or "lexer"
+
+
+# version del analizador; forma parte de la clave de la cache de resultados
+ANALYZER_VERSION = "2.0"
+
+_CACHE_DIR_DEFAULT = ".sql_risk_cache"
+_CACHE_MAX_BYTES_DEFAULT = 64 * 1024 * 1024
+
+# nombres que pueden resolverse como variables: placeholders {{ var }} / {var} e
+# identificadores junto a un || (los que sustituye normalize_dynamic_sql)
+_CACHE_VARIABLE_NAMES = re.compile(
+    r"\{\{?\s*([A-Za-z_][A-Za-z0-9_]*)"
+    r"|([A-Za-z_][A-Za-z0-9_]*)\s*\|\|"
+    r"|\|\|\s*([A-Za-z_][A-Za-z0-9_]*)"
+)
+# solapamiento entre bloques para no perder nombres partidos al leer por bloques
+_CACHE_SCAN_OVERLAP = 512
+
+
+@functools.lru_cache(maxsize=1)
+def _analyzer_fingerprint() -> str:
+    """Huella del analizador: version declarada mas el contenido de este modulo y del lexer."""
+    import hashlib
+    digest = hashlib.sha256(ANALYZER_VERSION.encode())
+    digest.update(Path(__file__).read_bytes())
+    digest.update(Path(__file__).with_name("lexer.py").read_bytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache en disco de los resultados de analizar_sql. Cada entrada es un JSON con nombre
+    igual a su clave; al leerla se actualiza su fecha de modificacion, y evict() borra las
+    menos usadas recientemente hasta quedar por debajo de max_bytes.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = _CACHE_MAX_BYTES_DEFAULT):
+        self.directory = Path(directory or os.environ.get("SQL_RISK_CACHE_DIR") or _CACHE_DIR_DEFAULT)
+        self.max_bytes = max_bytes
+
+    def key(self, path_sql: str, template_vars, streaming: bool,
+            lineas: Optional[List[Tuple[int, int]]] = None) -> str:
+        """
+        Clave de un fichero: hash de su contenido, valores de las variables de template que
+        referencia, tabla RIESGO, version del analizador y lineas analizadas en modo diff.
+        """
+        import hashlib
+
+        template_vars = _template_context(template_vars).variables
+
+        content_digest = hashlib.sha256()
+        names = set()
+        tail = ""
+        with open(path_sql, "rb") as f:
+            while True:
+                chunk = f.read(_STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                content_digest.update(chunk)
+                text = tail + chunk.decode("utf-8", errors="replace")
+                for match in _CACHE_VARIABLE_NAMES.finditer(text):
+                    names.add((match.group(1) or match.group(2) or match.group(3)).lower())
+                tail = text[-_CACHE_SCAN_OVERLAP:]
+
+        values_by_name: Dict[str, List[str]] = {}
+        for k, v in template_vars.items():
+            if k.lower() in names:
+                values_by_name.setdefault(k.lower(), []).append(str(v))
+
+        key_material = json.dumps([
+            _analyzer_fingerprint(),
+            content_digest.hexdigest(),
+            sorted(values_by_name.items()),
+            sorted((accion, riesgo) for accion, riesgo in RIESGO.items()),
+            streaming,
+            _splitter(),
+            [list(r) for r in lineas] if lineas is not None else None,
+        ])
+        return hashlib.sha256(key_material.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry_path = self._entry_path(key)
+        try:
+            entry = json.loads(entry_path.read_text())
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # escritura atomica: varios procesos del pool pueden escribir a la vez
+            tmp_path = self.directory / f".{key}.{os.getpid()}.tmp"
+            tmp_path.write_text(json.dumps(entry))
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """Elimina las entradas usadas hace mas tiempo hasta respetar max_bytes."""
+        entries = []
+        total = 0
+        try:
+            for entry_path in self.directory.glob("*.json"):
+                try:
+                    stat = entry_path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+                total += stat.st_size
+        except OSError:
+            return
+
+        entries.sort()
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                entry_path.unlink()
+            except OSError:
+                pass
+            total -= size
+
+
+# objetos pendientes de linaje a partir de los cuales se lanza una consulta en segundo plano
+_LINEAGE_BATCH_SIZE = 1000
+
+# acciones sobre objetos de cuenta, que no se cualifican con la base de datos ni el esquema
+_ACCOUNT_OBJECT_ACTIONS = ("_WAREHOUSE", "_DATABASE", "_SHARE")
+
+
+def _lineage_key(hallazgo: Finding) -> int:
+    """Id en SYMBOLS del objeto cuyo linaje decide el riesgo del hallazgo."""
+    info = hallazgo.object_info
+    if isinstance(info, ObjectRef) and info.object and not hallazgo.accion.endswith(_ACCOUNT_OBJECT_ACTIONS):
+        return info.fqn_id
+    return resolve(hallazgo.objeto)
+
+
+def _riesgo_fijo(hallazgo: Finding, catalog: Optional[CatalogSnapshot] = None) -> Optional[str]:
+    """
+    Riesgo del hallazgo si no depende del linaje; None si hay que consultarlo. catalog es el
+    snapshot de la ejecucion, del que sale el tamaño de los warehouses.
+    """
+    riesgo_base = RIESGO[hallazgo.accion]
+    if isinstance(riesgo_base, str):
+        return riesgo_base
+    if not hallazgo.needs_lineage_check:
+        return riesgo_base[0]
+    if hallazgo.accion == "USE_WAREHOUSE":
+        # decide el tamaño del catalogo, no el linaje: solo un XS confirmado es riesgo bajo;
+        # un warehouse que no esta en el catalogo (o sin catalogo) se trata como grande
+        es_xs = catalog.is_warehouse_xs(hallazgo.objeto) if catalog is not None else None
+        return riesgo_base[1] if es_xs else riesgo_base[0]
+    return None
+
+
+def _riesgo_por_linaje(hallazgo: Finding, tiene_linaje: bool) -> str:
+    riesgo_con_linaje, riesgo_sin_linaje = RIESGO[hallazgo.accion]
+    return riesgo_con_linaje if tiene_linaje else riesgo_sin_linaje
+
+
+class RiskScorer:
+    """
+    Fase de puntuacion. add() aplica RIESGO a los hallazgos de un fichero y deja en cola los
+    que dependen del linaje; cuando la cola alcanza batch_size se consulta al proveedor en un
+    hilo aparte mientras se siguen extrayendo ficheros. finish() resuelve lo que quede.
+    Si se indica on_scored, se llama con (tag, indice, hallazgo) en cuanto cada hallazgo
+    tiene su riesgo, siempre desde el hilo que llama a add() o finish().
+    """
+
+    def __init__(self, lineage_provider: Optional[LineageProvider] = None,
+                 batch_size: int = _LINEAGE_BATCH_SIZE,
+                 on_scored: Optional[Callable[[Any, int, Finding], None]] = None):
+        self.provider = lineage_provider or StubLineageProvider()
+        # el snapshot del catalogo se toma una vez: de el sale el tamaño de los warehouses
+        self.catalog = get_catalog()
+        self.batch_size = batch_size
+        self.on_scored = on_scored
+        # hallazgos del lote en preparacion (con el id de su objeto) y objetos que aun no se
+        # han pedido al proveedor; los objetos son ids de SYMBOLS
+        self._pendientes: List[Tuple[List[Finding], int, Any, int]] = []
+        self._objetos: Dict[int, None] = {}
+        self._solicitados: set = set()
+        self._lotes: List[Tuple["Future", List[Tuple[List[Finding], int, Any, int]]]] = []
+        self._linaje: Dict[int, bool] = {}
+        self._executor: Optional["ThreadPoolExecutor"] = None
+
+    def add(self, hallazgos: List[Finding], tag: Any = None) -> None:
+        for i, hallazgo in enumerate(hallazgos):
+            riesgo = _riesgo_fijo(hallazgo, self.catalog)
+            if riesgo is None:
+                objeto = _lineage_key(hallazgo)
+                self._pendientes.append((hallazgos, i, tag, objeto))
+                if objeto not in self._solicitados:
+                    self._objetos[objeto] = None
+            else:
+                hallazgos[i] = dataclasses.replace(hallazgo, riesgo=riesgo)
+                self._scored(tag, i, hallazgos[i])
+
+        if len(self._objetos) >= self.batch_size:
+            self._flush()
+        self._drain(wait=False)
+
+    def _scored(self, tag: Any, i: int, hallazgo: Finding) -> None:
+        if self.on_scored is not None:
+            self.on_scored(tag, i, hallazgo)
+
+    def _flush(self) -> None:
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        consulta = self._executor.submit(self._lookup, list(self._objetos))
+        self._lotes.append((consulta, self._pendientes))
+        self._solicitados.update(self._objetos)
+        self._pendientes = []
+        self._objetos = {}
+
+    def _lookup(self, objetos: List[int]) -> Dict[int, bool]:
+        prof = get_profiler()
+        prof.count("linaje.objetos", len(objetos))
+        with prof.stage("linaje"):
+            nombres = [SYMBOLS.name(objeto) for objeto in objetos]
+            encontrados = self.provider.lookup_many(nombres)
+            return {objeto: encontrados.get(nombre, False) for objeto, nombre in zip(objetos, nombres)}
+
+    def _drain(self, wait: bool) -> None:
+        """Completa los lotes ya respondidos (o todos si wait), en el orden en que se pidieron."""
+        while self._lotes and (wait or self._lotes[0][0].done()):
+            consulta, pendientes = self._lotes.pop(0)
+            self._linaje.update(consulta.result())
+            self._resolve(pendientes)
+
+    def _resolve(self, pendientes: List[Tuple[List[Finding], int, Any, int]]) -> None:
+        for hallazgos, i, tag, objeto in pendientes:
+            hallazgo = hallazgos[i]
+            riesgo = _riesgo_por_linaje(hallazgo, self._linaje.get(objeto, False))
+            hallazgos[i] = dataclasses.replace(hallazgo, riesgo=riesgo)
+            self._scored(tag, i, hallazgos[i])
+
+    def finish(self) -> None:
+        """Espera a las consultas de linaje y completa el riesgo de los hallazgos en cola."""
+        try:
+            self._drain(wait=True)
+            if self._objetos:
+                # el ultimo lote se consulta directamente, sin pasar por el hilo
+                self._linaje.update(self._lookup(list(self._objetos)))
+        finally:
+            self.close()
+
+        pendientes = self._pendientes
+        self._pendientes = []
+        self._objetos = {}
+        self._resolve(pendientes)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def puntuar_hallazgos(listas_hallazgos: Iterable[List[Finding]],
+                      lineage_provider: Optional[LineageProvider] = None) -> None:
+    """Asigna el riesgo a los hallazgos de varias listas con una sola consulta de linaje."""
+    scorer = RiskScorer(lineage_provider, batch_size=sys.maxsize)
+    try:
+        for hallazgos in listas_hallazgos:
+            scorer.add(hallazgos)
+        scorer.finish()
+    finally:
+        scorer.close()
+
+
+def _hay_riesgo(resultados: List[Finding]) -> bool:
+    return any(r.riesgo in ["MEDIA", "ALTA"] for r in resultados)
+
+
+class Hallazgos(list):
+    """
+    Hallazgos de un fichero tal como salen de la extraccion, con lo que el grafo de
+    dependencias necesita de esa misma pasada: las aristas del fichero (None si no se han
+    recorrido todas sus sentencias, como en modo diff), las variables de template que usa y
+    la firma del fichero antes de leerlo.
+    """
+
+    def __init__(self, hallazgos: Iterable[Finding] = (), dependencias: Optional[List[Edge]] = None,
+                 variables: Iterable[str] = (), firma: Optional[Signature] = None):
+        super().__init__(hallazgos)
+        self.dependencias = dependencias
+        self.variables = list(variables)
+        self.firma = firma
+
+
 # funcion principal para analizar todo el script 
-def analizar_sql(path_sql: str, template_vars: Dict[str, str] = None):
-    sql_text = Path(path_sql).read_text()
-    sql_text = re.sub(r'/\*.*?\*/', '', sql_text, flags=re.DOTALL)
-    resolved_sql, all_detected_vars = resolve_template_variables(sql_text, template_vars)
-    
-    statements = sqlparse.split(resolved_sql)
+def analizar_sql(path_sql: str, template_vars: Dict[str, str] = None, streaming: bool = False,
+                 cache: Optional[ResultCache] = None,
+                 lineage_provider: Optional[LineageProvider] = None,
+                 lineas: Optional[List[Tuple[int, int]]] = None):
+    resultados = _extraer_hallazgos_cacheado(path_sql, template_vars, streaming, cache, lineas)
+    if lineage_provider is None:
+        # el linaje por defecto sale del propio fichero (y del catalogo, si lo hay)
+        lineage_provider = StubLineageProvider(
+            _grafos_de_linaje({os.path.abspath(path_sql): resultados}, template_vars))
+    puntuar_hallazgos([resultados], lineage_provider)
+    return _hay_riesgo(resultados), resultados
+
+
+def _extraer_hallazgos_cacheado(path_sql: str, template_vars, streaming: bool,
+                                cache: Optional[ResultCache],
+                                lineas: Optional[List[Tuple[int, int]]] = None) -> Hallazgos:
+    """
+    Fase de extraccion de un fichero, pasando por la cache. Los hallazgos aun no tienen
+    riesgo, de modo que el linaje se consulta siempre al momento.
+    """
+    prof = get_profiler()
+    start = time.perf_counter()
+    try:
+        return _extraer_hallazgos_con_cache(path_sql, template_vars, streaming, cache, lineas)
+    finally:
+        prof.record_file(path_sql, time.perf_counter() - start)
+
+
+def _extraer_hallazgos_con_cache(path_sql: str, template_vars, streaming: bool,
+                                 cache: Optional[ResultCache],
+                                 lineas: Optional[List[Tuple[int, int]]]) -> Hallazgos:
+    # la firma se toma antes de leer: si el fichero cambia despues, no coincidira
+    firma = file_signature(path_sql)
+    if cache is None:
+        resultados = extraer_hallazgos(path_sql, template_vars, streaming, lineas)
+        resultados.firma = firma
+        return resultados
+
+    prof = get_profiler()
+    with prof.stage("cache"):
+        key = cache.key(path_sql, template_vars, streaming, lineas)
+        entry = cache.get(key)
+    if entry is not None:
+        prof.count("cache.aciertos")
+        # se repiten las advertencias que se imprimieron al analizar el fichero
+        print(entry["salida"], end="")
+        dependencias = entry["dependencias"]
+        return Hallazgos((Finding.from_dict(r) for r in entry["resultados"]),
+                         [tuple(edge) for edge in dependencias] if dependencias is not None else None,
+                         entry["variables"], firma)
+
+    prof.count("cache.fallos")
+    salida = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(salida):
+            resultados = extraer_hallazgos(path_sql, template_vars, streaming, lineas)
+    finally:
+        print(salida.getvalue(), end="")
+
+    cache.put(key, {
+        "salida": salida.getvalue(),
+        "resultados": [dict(r.to_dict(), needs_lineage_check=r.needs_lineage_check) for r in resultados],
+        "dependencias": resultados.dependencias,
+        "variables": resultados.variables,
+    })
+    resultados.firma = firma
+    return resultados
+
+
+def extraer_hallazgos(path_sql: str, template_vars: Dict[str, str] = None,
+                      streaming: bool = False,
+                      lineas: Optional[List[Tuple[int, int]]] = None) -> Hallazgos:
+    """
+    Fase de extraccion: recorre las sentencias del fichero y devuelve los hallazgos con
+    accion, objeto, columna y contexto, sin riesgo asignado, junto con las dependencias entre
+    objetos del fichero. Si se indican lineas (modo diff) solo se analizan las sentencias que
+    las tocan; del resto solo se aplican los USE, y no se devuelven dependencias.
+    """
+    template_ctx = _template_context(template_vars)
+    prof = get_profiler()
+    variables: Dict[str, None] = {}
+    memo = _STATEMENT_MEMO
+    memo_stats = (memo.hits, memo.misses) if memo is not None else None
+
+    if lineas is not None:
+        statements = _iter_statements_in_lines(path_sql, template_ctx, lineas)
+    elif streaming:
+        statements = ((stmt, True) for stmt in _iter_resolved_statements(path_sql, template_ctx, variables))
+    elif _splitter() == "lexer":
+        with prof.stage("lectura"):
+            sql_text = _read_source(path_sql)
+        statements = ((stmt, True) for stmt in _iter_text_statements(sql_text, template_ctx, variables=variables))
+    else:
+        try:
+            import sqlparse
+        except ImportError:
+            raise RuntimeError("sqlparse no esta instalado; usa --splitter lexer") from None
+        with prof.stage("lectura"):
+            sql_text = Path(path_sql).read_text()
+        with prof.stage("comentarios"):
+            sql_text = re.sub(r'/\*.*?\*/', '', sql_text, flags=re.DOTALL)
+        with prof.stage("plantillas"):
+            resolved_sql, all_detected_vars = template_ctx.resolve(sql_text)
+        variables.update(dict.fromkeys(all_detected_vars))
+        
+        with prof.stage("split"):
+            statements = ((_strip_line_comments(stmt), True) for stmt in sqlparse.split(resolved_sql))
 
     current_context = {
         "database": None,
         "schema": None
     } 
 
+    # las dependencias se recogen en la misma pasada que los hallazgos
+    dependencias = _DependencyCollector() if lineas is None else None
+
     # pasa por todas las sentencias
     resultados = []
-    for stmt in statements:
-        # se eliminan los comentarios de las sentencias para evitar que se interpreten comentarios como parte de la sentencia
-        lines = stmt.strip().split('\n')
-        cleaned_lines = [line for line in lines if not line.strip().startswith('--')]
-        stmt_uncommented = '\n'.join(cleaned_lines).strip()
-        stmt_normalized = normalize_dynamic_sql(stmt_uncommented, template_vars)
-        stmt_clean = '\n'.join(cleaned_lines).strip().upper()
-        stmt_clean = stmt_normalized.upper()
+    for stmt, touched in statements:
+        prof.count("sentencias")
+        # las sentencias llegan sin comentarios; sin || ni espacios alrededor no se crea otra cadena
+        with prof.stage("normalizar"):
+            stmt_clean = normalize_dynamic_sql(stmt.strip(), template_ctx)
         
         if not stmt_clean:
             continue
         
-        
+        if not touched:
+            # sentencia fuera del diff: solo se mantiene el contexto
+            _replay_context(stmt_clean, current_context, template_ctx)
+            continue
 
-        if re.match(r"^CREATE\s+(OR\s+REPLACE\s+)?PROCEDURE", stmt_clean):
-            match = re.search(r"PROCEDURE\s+([A-Z0-9_.\"]+)\s*\(", stmt_clean)
-            proc_name = match.group(1) if match else None
+        proc_match = _CREATE_PROCEDURE_PREFIX.match(stmt_clean)
+        if proc_match:
+            match = _PROCEDURE_NAME_PATTERN.search(stmt_clean)
+            proc_name = _captured(match)
             
             # extrae las sentencias del procedimiento 
-            proc_body = extract_procedure_body(stmt_clean)
+            prof.count("procedimientos")
+            with prof.stage("procedimientos"):
+                proc_body = extract_procedure_body(stmt_clean)
             if proc_body:
-                
-                # pasa por todas las variables de texto por si tienen sentencias guardadas
-                variable_sqls = extract_sql_from_variables(proc_body, template_vars)
-                for var_sql in variable_sqls:
-                    # analiza cada sentencia que tenga la variable
-                    var_sql_statements = sqlparse.split(var_sql)
-                    
-                    for var_stmt in var_sql_statements:
-                        var_lines = var_stmt.strip().split('\n')
-                        var_cleaned = [l for l in var_lines if not l.strip().startswith('--')]
-                        var_stmt_clean = '\n'.join(var_cleaned).strip().upper()
-                        
-                        if var_stmt_clean:
-                            var_results = procesar_sentencia(var_stmt_clean, current_context, proc_name)
-                            
-                            # marcar cada resultado como que viene de una variable
-                            for result in var_results:
-                                if result.get('object_info'):
-                                    result['object_info']['from_variable'] = True
-                            
-                            resultados.extend(var_results)
-
-
-                inner_statements = sqlparse.split(proc_body)
-                
-                for inner_stmt in inner_statements:
-                    inner_lines = inner_stmt.strip().split('\n')
-                    inner_cleaned = [l for l in inner_lines if not l.strip().startswith('--')]
-                    inner_stmt_clean = '\n'.join(inner_cleaned).strip().upper()
-                    
-                    if inner_stmt_clean:
-                        # pasar por todas las sentencias del procedure que no hayan sido procesadas en las variables
-                        if not re.match(r"[A-Z_][A-Z0-9_]*\s*:=\s*'", inner_stmt_clean):
-                            inner_results = procesar_sentencia(inner_stmt_clean, current_context, proc_name)
-                            resultados.extend(inner_results)
+                _procesar_bloque(proc_body, current_context, proc_name, template_ctx, resultados, dependencias)
             
             accion_procedure = "CREATE_PROCEDURE"
             needs_lineage = False
             
-            if "OR REPLACE" in stmt_clean:
+            if proc_match.group(1):
                 accion_procedure = "CREATE_OR_REPLACE_PROCEDURE"
                 needs_lineage = True
             
             # registrar la creación del procedure
-            obj_info = parse_object_name(proc_name) if proc_name else None
-            if obj_info:
-                obj_info["current_context"] = current_context.copy()
+            obj_info = parse_object_name(proc_name, current_context) if proc_name else None
             
             resultados.append(_create_result(accion_procedure, proc_name, None, needs_lineage, obj_info))
+        elif _ANONYMOUS_BLOCK_PREFIX.match(stmt_clean):
+            # bloque DECLARE/BEGIN ... END: se analiza como el cuerpo de un procedimiento
+            prof.count("bloques")
+            _procesar_bloque(stmt_clean, current_context, None, template_ctx, resultados, dependencias)
         else:
             # procesamiento de sentencia normal
+            if dependencias is not None:
+                dependencias.add(stmt_clean, current_context)
             stmt_results = procesar_sentencia(stmt_clean, current_context)
             resultados.extend(stmt_results)
-    
-    hay_riesgo = any(r["riesgo"] in ["MEDIA", "ALTA"] for r in resultados)
-    return hay_riesgo, resultados
+
+    if prof.enabled and memo_stats is not None:
+        # aciertos y fallos de la memoria de sentencias en este fichero
+        prof.count("sentencias.memo_aciertos", memo.hits - memo_stats[0])
+        prof.count("sentencias.memo_fallos", memo.misses - memo_stats[1])
+    return Hallazgos(resultados, dependencias.edges() if dependencias is not None else None, variables)
+
+def _procesar_bloque(body: str, current_context: Dict, proc_name: Optional[str],
+                     template_ctx: TemplateContext, resultados: List[Finding],
+                     dependencias: Optional["_DependencyCollector"] = None) -> None:
+    """Analiza el cuerpo de un procedimiento o de un bloque anonimo y añade sus hallazgos."""
+    prof = get_profiler()
+    # lo que usa el cuerpo depende del procedimiento, con el nombre cualificado como en su CREATE
+    dependiente = _qualify(proc_name, current_context) if proc_name and dependencias is not None else None
+    # una sola pasada por el cuerpo: sentencias, variables de texto y EXECUTE IMMEDIATE
+    block_statements = prof.iter_stage("procedimientos", iter_procedure_statements(body, template_ctx))
+    for origen, block_stmt in block_statements:
+        if dependencias is not None:
+            dependencias.add(block_stmt, current_context, dependiente)
+        block_results = procesar_sentencia(block_stmt, current_context, proc_name)
+
+        if origen != "variable":
+            resultados.extend(block_results)
+            continue
+
+        # marcar cada resultado como que viene de una variable
+        for result in block_results:
+            if result.object_info is not None:
+                result = dataclasses.replace(
+                    result, object_info=dataclasses.replace(result.object_info, from_variable=True))
+            resultados.append(result)
+
+def _replay_context(stmt_clean: str, current_context: Dict, template_ctx: TemplateContext) -> None:
+    """Aplica los USE de una sentencia (o del cuerpo de un procedimiento o bloque) descartando los hallazgos."""
+    if _CREATE_PROCEDURE_PREFIX.match(stmt_clean):
+        body = extract_procedure_body(stmt_clean)
+    elif _ANONYMOUS_BLOCK_PREFIX.match(stmt_clean):
+        body = stmt_clean
+    else:
+        if clasificar_sentencia(stmt_clean) is _handle_use:
+            _handle_use(stmt_clean, current_context)
+        return
+    if body:
+        for _, block_stmt in iter_procedure_statements(body, template_ctx):
+            if clasificar_sentencia(block_stmt) is _handle_use:
+                _handle_use(block_stmt, current_context)
+
+# caracteres de sentencia que se recuerdan en total, entre ficheros y peticiones
+_STATEMENT_MEMO_TOTAL_CHARS = 8 * 1024 * 1024
+# solo se recuerdan las sentencias cortas (USE, GRANT, literales de procedimientos...), que
+# son las que se repiten; en las largas, hashear y guardar la clave costaria mas que procesarlas
+_STATEMENT_MEMO_MAX_CHARS = 1024
+
+# sentencias vistas una vez que se recuerdan (por su hash) para guardarlas la segunda
+_STATEMENT_MEMO_SEEN_MAX = 1 << 16
+
+# (sentencia normalizada, database, schema, warehouse, procedimiento)
+_StatementKey = Tuple[str, Optional[str], Optional[str], Optional[str], Optional[str]]
+# (hallazgos, (database, schema, warehouse) despues de la sentencia)
+_StatementEntry = Tuple[Tuple[Finding, ...], Tuple[Optional[str], Optional[str], Optional[str]]]
+
+
+class StatementMemo:
+    """
+    Cache LRU de procesar_sentencia: (sentencia normalizada, contexto activo, procedimiento)
+    -> (hallazgos, contexto despues de la sentencia), porque los USE cambian el contexto.
+    Los hallazgos son inmutables y se comparten entre las apariciones de la sentencia. El
+    tamaño se limita por el total de caracteres de las sentencias guardadas. Con
+    admit_all=False una sentencia solo se guarda la segunda vez que se ve: en un lote casi
+    todas son unicas y guardarlas costaria mas que lo que ahorran las repetidas.
+    """
+
+    def __init__(self, max_chars: int = _STATEMENT_MEMO_TOTAL_CHARS, admit_all: bool = False):
+        self.max_chars = max_chars
+        self.admit_all = admit_all
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[_StatementKey, _StatementEntry]" = OrderedDict()
+        self._seen: set = set()
+
+    def get(self, key: _StatementKey) -> Optional[_StatementEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def first_sight(self, stmt_clean: str) -> bool:
+        """
+        Anota la sentencia y devuelve True si es la primera vez que se ve: no puede estar
+        guardada y no se guarda. Solo cuesta el hash de la cadena, sin construir la clave.
+        """
+        if self.admit_all:
+            return False
+        seen = self._seen
+        h = hash(stmt_clean)
+        if h in seen:
+            return False
+        if len(seen) >= _STATEMENT_MEMO_SEEN_MAX:
+            seen.clear()
+        seen.add(h)
+        self.misses += 1
+        return True
+
+    def put(self, key: _StatementKey, entry: _StatementEntry) -> None:
+        if key not in self._entries:
+            self.chars += len(key[0])
+        self._entries[key] = entry
+        while self.chars > self.max_chars:
+            old_key, _ = self._entries.popitem(last=False)
+            self.chars -= len(old_key[0])
+
+    def stats(self) -> Dict[str, int]:
+        return {"entradas": len(self._entries), "caracteres": self.chars,
+                "aciertos": self.hits, "fallos": self.misses}
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._seen.clear()
+        self.chars = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# memoria del proceso (y de cada proceso del pool): un preludio de USE, un bloque de GRANT o
+# un literal de procedimiento que se repite se procesa una sola vez
+_STATEMENT_MEMO: Optional[StatementMemo] = StatementMemo()
+
+
+def enable_statement_memo(max_chars: int = _STATEMENT_MEMO_TOTAL_CHARS,
+                          admit_all: bool = False) -> StatementMemo:
+    """Sustituye la memoria del proceso por una vacia de max_chars caracteres."""
+    global _STATEMENT_MEMO
+    _STATEMENT_MEMO = StatementMemo(max_chars, admit_all)
+    return _STATEMENT_MEMO
+
+
+def disable_statement_memo() -> None:
+    global _STATEMENT_MEMO
+    _STATEMENT_MEMO = None
+
+
+def get_statement_memo() -> Optional[StatementMemo]:
+    return _STATEMENT_MEMO
+
 
 def procesar_sentencia(stmt_clean: str, current_context: Dict, 
-                      proc_context: Optional[str] = None) -> List[Dict[str, Any]]:
+                      proc_context: Optional[str] = None) -> List[Finding]:
     """
-    Procesa una sentencia SQL llamando a cada una de las posibles sentencias a ejecutar
+    Procesa una sentencia SQL llamando a cada una de las posibles sentencias a ejecutar.
+    Una sentencia corta ya vista en el mismo contexto se resuelve con la memoria de sentencias.
     """
-    for pattern, handler in STATEMENT_HANDLERS:
-        if re.match(pattern, stmt_clean):
-            return handler(stmt_clean, current_context, proc_context)
-    
-    return []
+    memo = _STATEMENT_MEMO
+    if memo is None or len(stmt_clean) > _STATEMENT_MEMO_MAX_CHARS or memo.first_sight(stmt_clean):
+        return _procesar_sentencia(stmt_clean, current_context, proc_context)
+
+    get = current_context.get
+    key = (stmt_clean, get("database"), get("schema"), get("warehouse"), proc_context)
+    entry = memo.get(key)
+    if entry is None:
+        resultados = _procesar_sentencia(stmt_clean, current_context, proc_context)
+        memo.put(key, (tuple(resultados), (get("database"), get("schema"), get("warehouse"))))
+        return resultados
+
+    resultados, (database, schema, warehouse) = entry
+    if database is not key[1] or schema is not key[2] or warehouse is not key[3]:
+        # la sentencia cambia el contexto (USE)
+        current_context["database"] = database
+        current_context["schema"] = schema
+        current_context["warehouse"] = warehouse
+    return list(resultados)
+
+
+def _procesar_sentencia(stmt_clean: str, current_context: Dict,
+                        proc_context: Optional[str] = None) -> List[Finding]:
+    prof = get_profiler()
+    if not prof.enabled:
+        handler = clasificar_sentencia(stmt_clean)
+        if handler is None:
+            return []
+        return handler(stmt_clean, current_context, proc_context)
+
+    with prof.stage("handlers"):
+        handler = clasificar_sentencia(stmt_clean)
+        if handler is None:
+            prof.count("handler.ninguno")
+            return []
+        prof.count(f"handler.{handler.__name__[len('_handle_'):]}")
+        return handler(stmt_clean, current_context, proc_context)
+
+
+# grafo de dependencias: sentencias que definen o cargan un objeto a partir de otros
+_DEPENDENCY_TARGET = re.compile(
+    r"^(?:CREATE\s+(?:OR\s+REPLACE\s+)?(?:SECURE\s+)?(?:RECURSIVE\s+)?(?:MATERIALIZED\s+)?VIEW"
+    r"|CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:LOCAL|GLOBAL)\s+)?(?:(?:TEMP|TEMPORARY|VOLATILE|TRANSIENT)\s+)?TABLE"
+    r"|INSERT\s+(?:OVERWRITE\s+)?INTO|MERGE\s+INTO|UPDATE)"
+    fr"\s+(?:IF\s+NOT\s+EXISTS\s+)?{_OBJECT_NAME}",
+    re.IGNORECASE,
+)
+# objetos leidos; lo que va seguido de ( es una funcion de tabla, no un objeto
+_DEPENDENCY_SOURCE = re.compile(fr"\b(?:FROM|JOIN|USING|CLONE)\s+{_OBJECT_NAME}(?!\s*\()", re.IGNORECASE)
+_CTE_NAME = re.compile(r"(?:\bWITH|,)\s*(?:RECURSIVE\s+)?([A-Z_][A-Z0-9_$]*)\s+AS\s*\(", re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+# funciones con FROM en sus argumentos (EXTRACT(YEAR FROM x)...), que no leen ningun objeto
+_FUNCTION_WITH_FROM = re.compile(r"\b(?:EXTRACT|TRIM|SUBSTRING|POSITION|OVERLAY)\s*\([^()]*\)", re.IGNORECASE)
+
+
+def _qualify(obj_name: str, current_context: Dict) -> str:
+    """Nombre completo de un objeto con el contexto activo, igual que ObjectRef.fqn."""
+    return qualify(obj_name, current_context.get("database"), current_context.get("schema"))
+
+
+def _statement_dependencies(stmt: str, current_context: Dict) -> Tuple[Optional[str], List[str]]:
+    """Objeto que define o carga la sentencia (si lo hay) y objetos que lee, cualificados."""
+    text = _FUNCTION_WITH_FROM.sub(" ", _STRING_LITERAL.sub("''", stmt))
+    target_match = _DEPENDENCY_TARGET.match(text)
+    target = _qualify(target_match.group(1), current_context) if target_match else None
+    ctes = {m.group(1).upper() for m in _CTE_NAME.finditer(text)}
+    sources = dict.fromkeys(
+        _qualify(m.group(1), current_context)
+        for m in _DEPENDENCY_SOURCE.finditer(text) if m.group(1).upper() not in ctes
+    )
+    sources.pop(target, None)
+    return target, list(sources)
+
+
+class _DependencyCollector:
+    """Aristas (objeto, objeto que depende de el) de un fichero, sentencia a sentencia."""
+
+    def __init__(self):
+        self._edges: Dict[Edge, None] = {}
+
+    def add(self, stmt: str, current_context: Dict, proc_name: Optional[str] = None) -> None:
+        """Añade las aristas de una sentencia; proc_name es el procedimiento (cualificado) que la contiene."""
+        if proc_name is None and not _DEPENDENCY_TARGET.match(stmt):
+            # sin objeto definido ni procedimiento, la sentencia no aporta aristas
+            return
+        target, sources = _statement_dependencies(stmt, current_context)
+        if target is not None:
+            for source in sources:
+                self._edges[(source, target)] = None
+        if proc_name is not None:
+            for obj_name in sources + ([target] if target is not None else []):
+                self._edges[(obj_name, proc_name)] = None
+
+    def edges(self) -> List[Edge]:
+        return list(self._edges)
+
+
+def extraer_dependencias(sql_text: str, template_vars: Dict[str, str] = None,
+                         variables: Optional[Dict[str, None]] = None) -> List[Edge]:
+    """
+    Aristas (objeto, objeto que depende de el) de un script: vistas y tablas creadas con
+    SELECT, INSERT ... SELECT, MERGE ... USING y UPDATE ... FROM, y los objetos que usa
+    cada procedimiento en su cuerpo. Los nombres se cualifican con los USE anteriores.
+    Es la parte de extraer_hallazgos que necesita el grafo, para los ficheros que no se
+    analizan; si se indica variables, se añaden las de template que usa el script.
+    """
+    template_ctx = _template_context(template_vars)
+    current_context = {"database": None, "schema": None}
+    dependencias = _DependencyCollector()
+
+    def add(stmt: str, proc_name: Optional[str]) -> None:
+        if clasificar_sentencia(stmt) is _handle_use:
+            _handle_use(stmt, current_context)
+            return
+        dependencias.add(stmt, current_context, proc_name)
+
+    for stmt in _iter_text_statements(sql_text, template_ctx, warn=False, variables=variables):
+        stmt = normalize_dynamic_sql(stmt.strip(), template_ctx)
+        if _CREATE_PROCEDURE_PREFIX.match(stmt):
+            proc_name = _captured(_PROCEDURE_NAME_PATTERN.search(stmt))
+            proc_name = _qualify(proc_name, current_context) if proc_name else None
+            body = extract_procedure_body(stmt)
+        elif _ANONYMOUS_BLOCK_PREFIX.match(stmt):
+            proc_name, body = None, stmt
+        else:
+            add(stmt, None)
+            continue
+        if body:
+            for _, block_stmt in iter_procedure_statements(body, template_ctx):
+                add(block_stmt, proc_name)
+    return dependencias.edges()
+
+
+def actualizar_grafo(graph: DependencyGraph, sql_files: Iterable[str], template_vars: Dict[str, str] = None,
+                     extraidos: Optional[Dict[str, Hallazgos]] = None) -> int:
+    """
+    Deja en el grafo exactamente los ficheros indicados: se olvidan los que ya no estan
+    (borrados o fuera de la lista) y solo se vuelven a leer las dependencias de los que han
+    cambiado (firma, o valor de las variables de template que usan). De los que ya se han
+    analizado en esta ejecucion (extraidos, por ruta absoluta) se toman las dependencias
+    que devolvio la extraccion, sin leerlos otra vez. Devuelve el numero de ficheros
+    reindexados.
+    """
+    template_ctx = _template_context(template_vars)
+    extraidos = extraidos or {}
+    vistos = set()
+    reindexados = 0
+    for sql_file in sql_files:
+        key = os.path.abspath(sql_file)
+        firma = file_signature(key)
+        if firma is None:
+            continue
+        vistos.add(key)
+        entry = graph.file_entry(key)
+        if (entry is not None and entry["firma"] == firma
+                and all(template_ctx.lookup.get(name) == value for name, value in entry["variables"].items())):
+            continue
+        extraido = extraidos.get(key)
+        if extraido is not None and extraido.dependencias is not None and extraido.firma is not None:
+            firma, edges, variables = extraido.firma, extraido.dependencias, extraido.variables
+        else:
+            nombres: Dict[str, None] = {}
+            try:
+                edges = extraer_dependencias(_read_source(key), template_ctx, nombres)
+            except (OSError, UnicodeDecodeError):
+                vistos.discard(key)
+                continue
+            variables = list(nombres)
+        graph.set_file(key, firma, {name: template_ctx.lookup.get(name) for name in sorted(variables)}, edges)
+        reindexados += 1
+
+    for key in graph.files():
+        if key not in vistos:
+            graph.remove_file(key)
+    return reindexados
+
+
+def _iter_sql_files(root: str) -> Iterator[str]:
+    """Ficheros .sql bajo root, sin entrar en directorios ocultos."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if filename.endswith('.sql'):
+                yield os.path.join(dirpath, filename)
+
+
+def _grafos_de_linaje(extraidos: Dict[str, Hallazgos], template_vars,
+                      graph_root: Optional[str] = None) -> List[DependencyGraph]:
+    """
+    Grafos que consulta el linaje por defecto en una ejecucion. Con graph_root, el guardado
+    de los .sql bajo ese directorio, puesto al dia y guardado de nuevo si ha cambiado. Los
+    ficheros analizados que no estan bajo graph_root (sueltos, temporales de la entrada
+    estandar...) van a un grafo en memoria que no se guarda: el linaje no depende de lo
+    que analizaran ejecuciones anteriores.
+    """
+    graphs = []
+    with get_profiler().stage("grafo"):
+        fuera = extraidos
+        if graph_root is not None:
+            root = os.path.abspath(graph_root)
+            sql_files = [os.path.abspath(f) for f in _iter_sql_files(root)]
+            graph = get_dependency_graph(root)
+            actualizar_grafo(graph, sql_files, template_vars, extraidos)
+            if graph.dirty:
+                try:
+                    graph.save()
+                except OSError as e:
+                    print(f"No se pudo guardar el grafo de dependencias: {e}", file=sys.stderr)
+            graphs.append(graph)
+            indexados = set(sql_files)
+            fuera = {f: h for f, h in extraidos.items() if f not in indexados}
+        if fuera:
+            overlay = DependencyGraph()
+            actualizar_grafo(overlay, fuera, template_vars, fuera)
+            graphs.append(overlay)
+    return graphs
+
+
+def _analizar_archivo_aislado(sql_file: str, template_vars: TemplateContext,
+                              streaming: bool, cache: Optional[ResultCache],
+                              lineas: Optional[List[Tuple[int, int]]] = None
+                              ) -> Tuple[str, Optional[List[Finding]], Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Analiza un fichero dentro de un proceso del pool. Captura lo que se imprime para que el
+    proceso principal lo muestre en el orden de entrada, y devuelve las medidas del
+    perfilador (si esta activo) para sumarlas en el proceso principal.
+    """
+    prof = get_profiler()
+    prof.reset()
+    salida = io.StringIO()
+    resultado = None
+    error = None
+    with contextlib.redirect_stdout(salida):
+        try:
+            resultado = _extraer_hallazgos_cacheado(sql_file, template_vars, streaming, cache, lineas)
+        except Exception as e:
+            error = str(e)
+    return salida.getvalue(), resultado, error, prof.snapshot()
+
+
+def _iter_resultados_archivos(sql_files: List[str], template_vars: TemplateContext,
+                              streaming: bool, jobs: int, cache: Optional[ResultCache],
+                              cambios: Optional[Dict[str, List[Tuple[int, int]]]] = None):
+    """
+    Devuelve (fichero, resultados, error) para cada fichero en el orden de entrada, repartiendo
+    el trabajo en un pool de procesos cuando jobs > 1. Solo se ejecuta la fase de extraccion:
+    los hallazgos se devuelven sin riesgo.
+    """
+    lineas = [_lineas_cambiadas(cambios, f) for f in sql_files]
+    if jobs <= 1 or len(sql_files) <= 1:
+        for sql_file, lineas_archivo in zip(sql_files, lineas):
+            try:
+                yield sql_file, _extraer_hallazgos_cacheado(sql_file, template_vars, streaming, cache, lineas_archivo), None
+            except Exception as e:
+                yield sql_file, None, str(e)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=min(jobs, len(sql_files)))
+    try:
+        n = len(sql_files)
+        tareas = executor.map(_analizar_archivo_aislado, sql_files,
+                              [template_vars] * n, [streaming] * n, [cache] * n, lineas)
+        prof = get_profiler()
+        for sql_file, (salida, resultado, error, medidas) in zip(sql_files, tareas):
+            print(salida, end="")
+            if medidas is not None:
+                prof.merge(medidas)
+            yield sql_file, resultado, error
+    finally:
+        # si se corta la iteracion por un error no se espera al resto de ficheros pendientes
+        executor.shutdown(cancel_futures=True)
+
+
+def _lineas_cambiadas(cambios: Optional[Dict[str, List[Tuple[int, int]]]],
+                      sql_file: str) -> Optional[List[Tuple[int, int]]]:
+    """Rangos modificados de un fichero en modo diff; None si se analiza entero."""
+    if cambios is None:
+        return None
+    return cambios.get(os.path.normpath(sql_file), [])
+
 
 def analizar_multiples_archivos(archivos_sql: List[str] = None, 
-                                template_vars: Dict[str, str] = None) -> int:
+                                template_vars: Dict[str, str] = None,
+                                streaming: bool = False,
+                                jobs: Optional[int] = None,
+                                cache: Optional[ResultCache] = None,
+                                lineage_provider: Optional[LineageProvider] = None,
+                                output_format: str = "text",
+                                output: Optional[str] = None,
+                                cambios: Optional[Dict[str, List[Tuple[int, int]]]] = None,
+                                graph_root: Optional[str] = None) -> int:
+    """
+    Analiza varios ficheros y escribe el informe en el formato indicado (text, json, ndjson
+    o sarif) en output o, si no se indica, en la salida estandar. En los formatos para
+    maquinas los avisos del analisis se escriben en stderr para no mezclarse con el informe.
+    Con cambios (fichero -> rangos de lineas de un git diff) solo se analizan esas lineas.
+    Sin proveedor de linaje, con graph_root el linaje incluye los .sql de ese directorio.
+    Si el perfilado esta activo (--profile o SQL_RISK_PROFILE) se escribe su JSON al final.
+    """
+    if cambios is not None and archivos_sql is None:
+        archivos_sql = [f for f in cambios if f.endswith('.sql') and os.path.isfile(f)]
+
+    stream = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        report = create_report(output_format, stream, ANALYZER_VERSION)
+        if output_format == "text":
+            return _analizar_archivos(archivos_sql, template_vars, streaming, jobs, cache,
+                                      lineage_provider, report, cambios, graph_root)
+        with contextlib.redirect_stdout(sys.stderr):
+            return _analizar_archivos(archivos_sql, template_vars, streaming, jobs, cache,
+                                      lineage_provider, report, cambios, graph_root)
+    finally:
+        if output:
+            stream.close()
+        prof = get_profiler()
+        if prof.enabled:
+            print(f"Perfil de la ejecucion escrito en {prof.dump()}", file=sys.stderr)
+
+
+def _analizar_archivos(archivos_sql: Optional[List[str]], template_vars, streaming: bool,
+                       jobs: Optional[int], cache: Optional[ResultCache],
+                       lineage_provider: Optional[LineageProvider], report: Report,
+                       cambios: Optional[Dict[str, List[Tuple[int, int]]]] = None,
+                       graph_root: Optional[str] = None) -> int:
     if archivos_sql is None:
         # si no se 
         sql_files = []
@@ -886,80 +2361,182 @@ def analizar_multiples_archivos(archivos_sql: List[str] = None,
     
     if not sql_files:
         print("No se encontraron archivos SQL para analizar")
+        if not isinstance(report, TextReport):
+            report.close([])
         return 0
     
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    
+    # el indice de variables se construye una vez y se reutiliza en todos los ficheros
+    template_vars = _template_context(template_vars)
+    
     total_risk = False
-    risky_files = []
     
-    for sql_file in sql_files:
+    def on_scored(sql_file: str, index: int, hallazgo: Finding) -> None:
+        nonlocal total_risk
+        if hallazgo.riesgo in RIESGOS_REPORTADOS:
+            total_risk = True
+        report.add_finding(sql_file, index, hallazgo)
+    
+    # la extraccion avanza mientras el scorer consulta el linaje por lotes en segundo plano;
+    # cada hallazgo llega al informe en cuanto tiene riesgo. El linaje por defecto sale de
+    # las dependencias de todos los ficheros: se consulta al final, con el grafo completo
+    extraidos: Optional[Dict[str, Hallazgos]] = {} if lineage_provider is None else None
+    scorer = RiskScorer(lineage_provider, on_scored=on_scored,
+                        batch_size=_LINEAGE_BATCH_SIZE if extraidos is None else sys.maxsize)
+    try:
+        for sql_file, resultados, error in _iter_resultados_archivos(sql_files, template_vars, streaming, jobs, cache, cambios):
+            if error is None:
+                try:
+                    scorer.add(resultados, sql_file)
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                report.add_error(sql_file, error)
+                report.close(sql_files)
+                return 1
+            if extraidos is not None:
+                extraidos[os.path.abspath(sql_file)] = resultados
+        
         try:
-            riesgo, resultados = analizar_sql(sql_file, template_vars)
-            
-            if resultados:
-                if riesgo:
-                    total_risk = True
-                    risky_sentences = [r for r in resultados if r["riesgo"] in ["MEDIA", "ALTA"]]
-                    risky_files.append({
-                        'file': sql_file,
-                        'sentences': risky_sentences
-                    })
-                
+            if extraidos is not None:
+                scorer.provider = StubLineageProvider(_grafos_de_linaje(extraidos, template_vars, graph_root))
+            scorer.finish()
         except Exception as e:
-            print(f"Error analizando {sql_file}: {str(e)}\n")
+            report.add_error(None, str(e))
+            report.close(sql_files)
             return 1
-    
-    if total_risk:
-        print("\nSe han detectado operaciones con riesgo")
+    finally:
+        scorer.close()
+        if cache is not None:
+            cache.evict()
+    
+    report.close(sql_files)
+    return 1 if total_risk else 0
+
+
+def _parse_args(argv: List[str]) -> "argparse.Namespace":
+    import argparse
+    parser = argparse.ArgumentParser(description="Analiza el riesgo de scripts SQL de Snowflake")
+    parser.add_argument("archivos", nargs="*", help="ficheros .sql a analizar")
+    parser.add_argument("--stream", action="store_true",
+                        help="lee cada fichero por bloques en lugar de cargarlo entero en memoria")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="numero de procesos en paralelo (por defecto, numero de CPUs)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="analiza todos los ficheros sin consultar ni guardar la cache de resultados")
+    parser.add_argument("--cache-dir", default=None,
+                        help=f"directorio de la cache (por defecto $SQL_RISK_CACHE_DIR o {_CACHE_DIR_DEFAULT})")
+    parser.add_argument("--cache-max-mb", type=int, default=_CACHE_MAX_BYTES_DEFAULT // (1024 * 1024),
+                        help="tamaño maximo de la cache en MB; se expulsan las entradas menos usadas")
+    parser.add_argument("--lineage", default=None,
+                        help="fichero local de linaje (.json o base sqlite); por defecto se usa el stub")
+    parser.add_argument("--lineage-ttl", type=float, default=300.0,
+                        help="segundos que se guarda en memoria cada respuesta del proveedor de linaje")
+    parser.add_argument("--graph", default=None,
+                        help="fichero donde se guarda el grafo de dependencias de --graph-root"
+                             f" (por defecto ${GRAPH_ENV_VAR} o {GRAPH_PATH_DEFAULT})")
+    parser.add_argument("--catalog", default=None,
+                        help="snapshot del catalogo importado con 'catalog' (linaje y tamaño de warehouses;"
+                             f" por defecto ${CATALOG_ENV_VAR} o {CATALOG_PATH_DEFAULT} si existe)")
+    parser.add_argument("--graph-root", default=None, metavar="DIR",
+                        help="sin --lineage, el linaje incluye todos los .sql bajo DIR: se guardan en el grafo"
+                             " y solo se releen los que han cambiado. Sin el, sale solo de los ficheros analizados")
+    parser.add_argument("--format", choices=FORMATS, default="text",
+                        help="formato del informe; ndjson escribe cada hallazgo en cuanto se conoce su riesgo")
+    parser.add_argument("--output", "-o", default=None,
+                        help="fichero donde escribir el informe (por defecto, la salida estandar)")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_OUTPUT_DEFAULT, default=None, metavar="JSON",
+                        help=f"mide el tiempo de cada etapa y lo escribe en JSON (por defecto {PROFILE_OUTPUT_DEFAULT});"
+                             f" tambien se activa con {PROFILE_ENV_VAR}")
+    parser.add_argument("--splitter", choices=SPLITTERS, default=None,
+                        help="separador de sentencias: el lexer propio (por defecto) o sqlparse.split;"
+                             f" tambien se elige con {SPLITTER_ENV_VAR}")
+    parser.add_argument("--diff", default=None, metavar="BASE..HEAD",
+                        help="analiza solo las sentencias que tocan las lineas cambiadas en ese rango de git")
+    return parser.parse_args(argv)
+
+
+def ejecutar_cli(args: "argparse.Namespace", template_ctx: TemplateContext,
+                 cache: Optional[ResultCache] = None,
+                 lineage_provider: Optional[LineageProvider] = None) -> int:
+    """
+    Ejecuta el analisis pedido en la linea de comandos con las caches y el proveedor de
+    linaje indicados, y devuelve el codigo de salida. Lo usan main() y el servidor (serve).
+    """
+    archivos = args.archivos
+    cambios = None
+    if args.diff:
+        try:
+            cambios = changed_line_ranges(args.diff)
+        except (OSError, RuntimeError) as e:
+            print(f"No se pudo obtener el diff de git: {e}", file=sys.stderr)
+            return 2
+
+    if archivos and not (len(archivos) == 1 and os.path.isdir(archivos[0])):
+        sql_files = [f for f in archivos if f.endswith('.sql') and os.path.isfile(f)]
+        if cambios is not None:
+            # en modo diff se ignoran los ficheros sin cambios
+            sql_files = [f for f in sql_files if os.path.normpath(f) in cambios]
         
-        for archivo_info in risky_files:
-            print(f"\nArchivo: {archivo_info['file']}")
-            print(f"   Total de operaciones con riesgo: {len(archivo_info['sentences'])}\n")
-            
-            for i, sentence_info in enumerate(archivo_info['sentences'], 1):
-                print(f"\n Operación {i} - Riesgo: {sentence_info['riesgo']}")
-                print(f"   Acción: {sentence_info['accion']}")
-                if sentence_info['objeto']:
-                    print(f"   Objeto: {sentence_info['objeto']}")
-                if sentence_info['columna']:
-                    print(f"   Columna: {sentence_info['columna']}")
-                
-                if 'object_info' in sentence_info and sentence_info['object_info']:
-                    obj_info = sentence_info['object_info']
-                    print(f"   Nivel de cualificación: {obj_info.get('qualification_level', 'N/A')}")
-                    if obj_info.get('database'):
-                        print(f"   Database explícita: {obj_info['database']}")
-                    if obj_info.get('schema'):
-                        print(f"   Schema explícito: {obj_info['schema']}")
-                    if obj_info.get('inside_procedure'):
-                        print(f"   Dentro del procedimiento: {obj_info['inside_procedure']}")
-                    if obj_info.get('from_variable'):
-                        print(f"   Origen: Asignación de variable")
-                    ctx = obj_info.get('current_context', {})
-                    if ctx.get('database') or ctx.get('schema'):
-                        print(f"   Contexto activo -> Database: {ctx.get('database', 'N/A')}, Schema: {ctx.get('schema', 'N/A')}")
-                
-        return 1
+        if not sql_files:
+            print("No se proporcionaron archivos SQL válidos")
+            return 0
     else:
-        print("   No se detectaron operaciones de alto riesgo")
+        sql_files = None
+
+    return analizar_multiples_archivos(sql_files, template_ctx, streaming=args.stream, jobs=args.jobs, cache=cache,
+                                       lineage_provider=lineage_provider,
+                                       output_format=args.format, output=args.output, cambios=cambios,
+                                       graph_root=args.graph_root)
+
+
+def _sin_sql(argv: List[str]) -> bool:
+    """
+    Solo hay ficheros y ninguno es un .sql (ni un directorio a recorrer): el caso mas comun
+    en un hook, que se resuelve sin cargar argparse ni preparar el analisis.
+    """
+    if not argv or any(arg.startswith("-") for arg in argv):
+        return False
+    if len(argv) == 1 and os.path.isdir(argv[0]):
+        return False
+    return not any(arg.endswith('.sql') and os.path.isfile(arg) for arg in argv)
+
+
+def main(argv: List[str]) -> int:
+    if argv[:1] == ["serve"]:
+        # servidor con el analizador en memoria (ver server.py)
+        from server import main as serve_main
+        return serve_main(argv[1:])
+    if argv[:1] == ["catalog"]:
+        # importacion del snapshot del catalogo (ver catalog.py)
+        from catalog import main as catalog_main
+        return catalog_main(argv[1:])
+    if _sin_sql(argv):
+        print("No se proporcionaron archivos SQL válidos")
         return 0
 
+    args = _parse_args(argv)
+    if args.profile:
+        enable_profiling(args.profile)
+    if args.splitter:
+        # por el entorno para que lo vean tambien los procesos del pool
+        os.environ[SPLITTER_ENV_VAR] = args.splitter
+    if args.graph:
+        os.environ[GRAPH_ENV_VAR] = args.graph
+    if args.catalog:
+        os.environ[CATALOG_ENV_VAR] = args.catalog
+    cache = None if args.no_cache else ResultCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    lineage_provider = None
+    if args.lineage:
+        try:
+            lineage_provider = CachedLineageProvider(open_lineage_provider(args.lineage), ttl=args.lineage_ttl)
+        except (OSError, ValueError) as e:
+            print(f"No se pudo abrir el proveedor de linaje: {e}", file=sys.stderr)
+            return 2
+    return ejecutar_cli(args, get_template_context(), cache, lineage_provider)
+
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        archivos = sys.argv[1:]
-        
-        if len(archivos) == 1 and os.path.isdir(archivos[0]):
-            exit_code = analizar_multiples_archivos(None)
-            sys.exit(exit_code)
-        else:
-            sql_files = [f for f in archivos if f.endswith('.sql') and os.path.isfile(f)]
-            
-            if not sql_files:
-                print("No se proporcionaron archivos SQL válidos")
-                sys.exit(0)
-            
-            exit_code = analizar_multiples_archivos(sql_files)
-            sys.exit(exit_code)
-    else:
-        exit_code = analizar_multiples_archivos(None)
-        sys.exit(exit_code)
+    sys.exit(main(sys.argv[1:]))
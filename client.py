@@ -0,0 +1,141 @@
+"""
+Cliente ligero del servidor de analisis (python ci_silver_gold.py serve). Acepta los mismos
+argumentos que ci_silver_gold.py y los envia al servidor por su socket Unix, de modo que un
+hook de pre-commit no paga el arranque del analizador. Si no hay servidor, analiza en este
+mismo proceso (o lo arranca en segundo plano con --spawn).
+
+    python client.py [--socket RUTA] [--spawn] [--stdin NOMBRE] [argumentos de ci_silver_gold.py]
+
+Para arrancar rapido solo importa json y socket; el analizador se importa si hace falta.
+"""
+import json
+import os
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# variable de entorno con la ruta del socket del servidor
+SOCKET_ENV_VAR = "SQL_RISK_SOCKET"
+
+# segundos que se espera a que arranque un servidor lanzado con --spawn
+_SPAWN_TIMEOUT = 10.0
+
+
+def default_socket_path() -> str:
+    """Socket por defecto: $SQL_RISK_SOCKET, o uno por usuario en $XDG_RUNTIME_DIR o /tmp."""
+    path = os.environ.get(SOCKET_ENV_VAR)
+    if path:
+        return path
+    directory = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(directory, f"sql-risk-{os.getuid()}.sock")
+
+
+def send_request(request: Dict[str, Any], socket_path: Optional[str] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Envia una peticion (una linea JSON) y devuelve la respuesta del servidor. Lanza OSError
+    si no hay servidor escuchando en el socket.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    if not chunks:
+        raise ConnectionError("el servidor cerro la conexion sin responder")
+    return json.loads(b"".join(chunks))
+
+
+def ping(socket_path: Optional[str] = None, timeout: float = 1.0) -> bool:
+    try:
+        return bool(send_request({"comando": "ping"}, socket_path, timeout).get("ok"))
+    except (OSError, ValueError):
+        return False
+
+
+def spawn_server(socket_path: Optional[str] = None, idle_timeout: Optional[float] = None) -> bool:
+    """Arranca el servidor en segundo plano y espera a que responda. Devuelve si lo hizo."""
+    import subprocess
+
+    socket_path = socket_path or default_socket_path()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ci_silver_gold.py")
+    command = [sys.executable, script, "serve", "--socket", socket_path]
+    if idle_timeout is not None:
+        command += ["--idle-timeout", str(idle_timeout)]
+    subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+
+    deadline = time.monotonic() + _SPAWN_TIMEOUT
+    while time.monotonic() < deadline:
+        if ping(socket_path):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _analizar_en_proceso(argv: List[str], texto: Optional[str], nombre: Optional[str]) -> int:
+    """Sin servidor: se ejecuta el analizador completo en este proceso."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import ci_silver_gold
+
+    if texto is None:
+        return ci_silver_gold.main(argv)
+
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, os.path.basename(nombre))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(texto)
+        return ci_silver_gold.main(argv + [path])
+
+
+def main(argv: List[str]) -> int:
+    socket_path = None
+    spawn = False
+    nombre = None
+    # opciones propias del cliente, delante de las del analizador
+    while argv and argv[0] in ("--socket", "--spawn", "--stdin"):
+        option = argv.pop(0)
+        if option == "--spawn":
+            spawn = True
+        elif not argv:
+            print(f"{option} necesita un valor", file=sys.stderr)
+            return 2
+        elif option == "--socket":
+            socket_path = argv.pop(0)
+        else:
+            nombre = argv.pop(0)
+            if not nombre.endswith(".sql"):
+                nombre += ".sql"
+
+    texto = sys.stdin.read() if nombre is not None else None
+    request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+    if texto is not None:
+        request["texto"] = texto
+        request["nombre"] = nombre
+
+    for attempt in range(2):
+        try:
+            response = send_request(request, socket_path)
+        except (OSError, ValueError):
+            if attempt == 0 and spawn and spawn_server(socket_path):
+                continue
+            return _analizar_en_proceso(argv, texto, nombre)
+        if "error" in response:
+            # p. ej. el codigo del analizador ha cambiado desde que arranco el servidor
+            print(f"Servidor de analisis: {response['error']}", file=sys.stderr)
+            return _analizar_en_proceso(argv, texto, nombre)
+        sys.stdout.write(response["stdout"])
+        sys.stderr.write(response["stderr"])
+        return response["codigo"]
+    return _analizar_en_proceso(argv, texto, nombre)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,190 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from lineage import LineageProvider, normalizar_objeto
+from names import SYMBOLS
+
+# variable de entorno y fichero por defecto del grafo de dependencias
+GRAPH_ENV_VAR = "SQL_RISK_GRAPH"
+GRAPH_PATH_DEFAULT = ".sql_risk_graph.json"
+
+# version del formato del fichero; si cambia se descarta el grafo guardado
+_GRAPH_FORMAT = 3
+
+# arista: (objeto, objeto que depende de el), con los nombres completos
+Edge = Tuple[str, str]
+# firma de un fichero: (tamaño, fecha de modificacion en ns)
+Signature = Tuple[int, int]
+
+
+def file_signature(path: str) -> Optional[Signature]:
+    """Firma del fichero; None si no existe o no se puede leer."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class DependencyGraph(LineageProvider):
+    """
+    Grafo de dependencias entre objetos (objeto -> objetos que dependen de el) extraido de
+    los scripts. Guarda las aristas de cada fichero, con su firma (tamaño y fecha) y las
+    variables de template que usa, para actualizarlo fichero a fichero. Un objeto tiene
+    linaje si algun otro depende de el. En memoria los objetos son ids de names.SYMBOLS:
+    la consulta es un acceso a un diccionario por entero. Un grafo guardado solo contiene
+    ficheros bajo su directorio raiz (root), con rutas absolutas.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, root: Optional[str] = None):
+        self.path = str(path) if path is not None else None
+        self.root = root
+        self.mtime_ns: Optional[int] = None
+        self.dirty = False
+        # generacion de SYMBOLS de la que son los ids en memoria
+        self.generation = SYMBOLS.generation
+        # fichero -> {"firma": [...], "variables": {...}, "aristas": [(objeto, dependiente), ...]}
+        self._files: Dict[str, Dict] = {}
+        # numero de ficheros en los que aparece cada arista
+        self._edges: Dict[Tuple[int, int], int] = {}
+        self._dependents: Dict[int, Dict[int, None]] = {}
+
+    @classmethod
+    def load(cls, path: Union[str, Path], root: str) -> "DependencyGraph":
+        """
+        Lee el grafo de root guardado en path; si no existe, no es valido o es de otro
+        directorio raiz, devuelve uno vacio.
+        """
+        graph = cls(path, root)
+        try:
+            graph.mtime_ns = os.stat(path).st_mtime_ns
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return graph
+        if not isinstance(data, dict) or data.get("formato") != _GRAPH_FORMAT or data.get("raiz") != root:
+            return graph
+
+        # los indices del fichero se traducen una sola vez a ids de la tabla de simbolos
+        objetos = [SYMBOLS.intern(obj_name) for obj_name in data["objetos"]]
+        for sql_file, entry in data["ficheros"].items():
+            edges = [(objetos[i], objetos[j]) for i, j in entry["aristas"]]
+            graph._add_file(sql_file, tuple(entry["firma"]), entry["variables"], edges)
+        return graph
+
+    def save(self, path: Optional[Union[str, Path]] = None) -> None:
+        """Escribe el grafo con los nombres de objeto internados: cada arista son dos indices."""
+        path = str(path or self.path or GRAPH_PATH_DEFAULT)
+        objetos: Dict[str, int] = {}
+
+        def index(symbol: int) -> int:
+            return objetos.setdefault(SYMBOLS.name(symbol), len(objetos))
+
+        ficheros = {
+            sql_file: {
+                "firma": list(entry["firma"]),
+                "variables": entry["variables"],
+                "aristas": [[index(obj), index(dependiente)] for obj, dependiente in entry["aristas"]],
+            }
+            for sql_file, entry in sorted(self._files.items())
+        }
+        document = {"formato": _GRAPH_FORMAT, "raiz": self.root, "objetos": list(objetos), "ficheros": ficheros}
+
+        # escritura atomica: puede haber otro proceso leyendolo
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        self.path = path
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        self.dirty = False
+
+    def file_entry(self, sql_file: str) -> Optional[Dict]:
+        return self._files.get(sql_file)
+
+    def files(self) -> List[str]:
+        return list(self._files)
+
+    def set_file(self, sql_file: str, signature: Signature, variables: Dict[str, Optional[str]],
+                 edges: Iterable[Edge]) -> None:
+        """Sustituye las aristas de un fichero por las de su contenido actual."""
+        self.remove_file(sql_file)
+        edges = [(SYMBOLS.intern(obj_name), SYMBOLS.intern(dependiente)) for obj_name, dependiente in edges]
+        self._add_file(sql_file, signature, variables, edges)
+        self.dirty = True
+
+    def remove_file(self, sql_file: str) -> None:
+        entry = self._files.pop(sql_file, None)
+        if entry is None:
+            return
+        for edge in entry["aristas"]:
+            count = self._edges[edge] - 1
+            if count:
+                self._edges[edge] = count
+                continue
+            del self._edges[edge]
+            obj_name, dependiente = edge
+            dependents = self._dependents[obj_name]
+            del dependents[dependiente]
+            if not dependents:
+                del self._dependents[obj_name]
+        self.dirty = True
+
+    def _add_file(self, sql_file: str, signature: Signature, variables: Dict[str, Optional[str]],
+                  edges: Iterable[Tuple[int, int]]) -> None:
+        edges = list(dict.fromkeys(edges))
+        self._files[sql_file] = {"firma": signature, "variables": variables, "aristas": edges}
+        for edge in edges:
+            count = self._edges.get(edge, 0)
+            self._edges[edge] = count + 1
+            if count:
+                continue
+            obj_name, dependiente = edge
+            self._dependents.setdefault(obj_name, {})[dependiente] = None
+
+    def dependents(self, obj_name: str) -> List[str]:
+        """Objetos que dependen directamente de obj_name (nombre completo)."""
+        symbol = SYMBOLS.get(normalizar_objeto(obj_name))
+        return [SYMBOLS.name(dependiente) for dependiente in self._dependents.get(symbol, ())]
+
+    def has_lineage_id(self, symbol: int) -> bool:
+        return symbol in self._dependents
+
+    def has_lineage(self, obj_name: str) -> bool:
+        return SYMBOLS.get(normalizar_objeto(obj_name)) in self._dependents
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        dependents = self._dependents
+        return {obj_name: SYMBOLS.get(obj_name) in dependents for obj_name in objects}
+
+
+# grafo guardado, leido del disco la primera vez y de nuevo si otro proceso lo cambia
+_GRAPH: Optional[DependencyGraph] = None
+
+
+def graph_path() -> str:
+    """Ruta absoluta del grafo: el servidor atiende peticiones desde varios directorios."""
+    return os.path.abspath(os.environ.get(GRAPH_ENV_VAR) or GRAPH_PATH_DEFAULT)
+
+
+def get_dependency_graph(root: str) -> DependencyGraph:
+    """
+    Grafo guardado de los scripts bajo root (ruta absoluta). Se llama una vez por ejecucion:
+    las consultas de linaje van despues al grafo en memoria, sin mirar el fichero. Si se ha
+    vaciado names.SYMBOLS desde que se leyo, se vuelve a leer con los ids nuevos.
+    """
+    global _GRAPH
+    path = graph_path()
+    if (_GRAPH is None or _GRAPH.path != path or _GRAPH.root != root
+            or _GRAPH.generation != SYMBOLS.generation
+            or (not _GRAPH.dirty and _GRAPH.mtime_ns != _mtime_ns(path))):
+        _GRAPH = DependencyGraph.load(path, root)
+    return _GRAPH
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,68 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+# cabecera de un hunk: @@ -inicio[,n] +inicio[,n] @@
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def parse_unified_diff(diff_text: str) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Rangos de lineas (primera, ultima) modificados en la version nueva de cada fichero de
+    un diff con --unified=0 --no-prefix. Un borrado marca las lineas que lo rodean.
+    """
+    changes: Dict[str, List[Tuple[int, int]]] = {}
+    current: Optional[List[Tuple[int, int]]] = None
+
+    for line in diff_text.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:].rstrip("\t")
+            if path == "/dev/null":
+                current = None
+            else:
+                if path.startswith('"') and path.endswith('"'):
+                    path = path[1:-1]
+                current = changes.setdefault(os.path.normpath(path), [])
+            continue
+
+        match = _HUNK_HEADER.match(line)
+        if match and current is not None:
+            first = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            if count == 0:
+                # lineas borradas despues de la linea "first"
+                current.append((max(first, 1), first + 1))
+            else:
+                current.append((first, first + count - 1))
+
+    return {path: _merge_ranges(ranges) for path, ranges in changes.items() if ranges}
+
+
+def changed_line_ranges(rev_range: str, pathspec: str = "*.sql",
+                        cwd: Optional[str] = None) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Ejecuta git diff sobre rev_range (BASE..HEAD, o BASE para comparar con el arbol de
+    trabajo) y devuelve los rangos de lineas modificados por fichero, con rutas relativas
+    al directorio actual. Los ficheros borrados no aparecen.
+    """
+    cmd = [
+        "git", "-c", "core.quotePath=false", "diff", "--unified=0", "--no-color", "--no-ext-diff",
+        "--no-prefix", "--relative", "--diff-filter=d", rev_range, "--", pathspec,
+    ]
+    import subprocess  # solo se carga en modo diff
+
+    proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or f"git diff {rev_range} ha fallado")
+    return parse_unified_diff(proc.stdout)
@@ -0,0 +1,189 @@
+import re
+from typing import Iterator, List, Tuple
+
+# (inicio, fin) de un tramo del texto
+Span = Tuple[int, int]
+
+# caracteres que pueden cambiar el estado del lexer fuera de literales y comentarios
+_TOKENS = re.compile(r"[;'\"$/\-]")
+# en los bloques de Snowflake Scripting tambien cuentan las palabras que abren y cierran bloques
+_BLOCK_TOKENS = re.compile(r"[;'\"$/\-]|(?<![\w$])(?:BEGIN|CASE|END|DECLARE)(?![\w$])", re.IGNORECASE)
+# contenido de un literal entre comillas simples: la barra invertida escapa el caracter
+# siguiente y '' es una comilla dentro del literal (tambien lo usa el cuerpo de procedimientos)
+SINGLE_QUOTED_BODY = r"[^'\\]*(?:(?:\\[\s\S]?|'')[^'\\]*)*"
+# resto del literal tras la comilla que lo abre; el grupo es la comilla que lo cierra
+_SINGLE_QUOTED_REST = re.compile(SINGLE_QUOTED_BODY + "(')?")
+
+# espacios y comentarios antes de una sentencia
+_LEADING = re.compile(r"(?:\s+|--[^\n]*|//[^\n]*|/\*.*?\*/)*", re.DOTALL)
+# sentencias cuyo ';' interno no las termina: bloques anonimos (no BEGIN TRANSACTION) y
+# procedimientos, funciones y tasks, cuyo cuerpo puede ir sin delimitar (AS BEGIN ... END)
+_BLOCK_START = re.compile(
+    r"(?:DECLARE|BEGIN(?!\s+(?:TRANSACTION|WORK|NAME)(?![\w$]))(?!\s*;)"
+    r"|CREATE\s+(?:OR\s+(?:REPLACE|ALTER)\s+)?(?:TEMP(?:ORARY)?\s+)?(?:SECURE\s+)?"
+    r"(?:PROCEDURE|FUNCTION|TASK))(?![\w$])",
+    re.IGNORECASE,
+)
+_NEXT_WORD = re.compile(r"\s*([A-Za-z_]+)")
+# END IF, END LOOP... cierran construcciones que no abren bloque
+_END_OF_STATEMENT_BLOCK = frozenset(["IF", "LOOP", "FOR", "WHILE", "REPEAT"])
+_NOT_BLOCK_BEGIN = frozenset(["TRANSACTION", "WORK", "NAME"])
+
+
+class _Incomplete(Exception):
+    """La sentencia en curso puede continuar en el siguiente bloque del fichero."""
+
+
+def _rstrip_end(text: str, start: int, end: int) -> int:
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return end
+
+
+def _scan_statement(text: str, start: int, final: bool) -> Tuple[int, int, List[Span]]:
+    """
+    Recorre una sentencia que empieza en start y devuelve (posicion del ';' o len(text),
+    posicion tras el ';', comentarios). Lanza _Incomplete si no es el ultimo bloque y la
+    sentencia (o un literal o comentario) no termina en text.
+    """
+    n = len(text)
+    block = _BLOCK_START.match(text, start) is not None
+    tokens = _BLOCK_TOKENS if block else _TOKENS
+    depth = 0
+    declaring = False
+    comments: List[Span] = []
+    pos = start
+
+    while True:
+        match = tokens.search(text, pos)
+        if match is None:
+            if not final:
+                raise _Incomplete
+            return n, n, comments
+
+        i = match.start()
+        char = text[i]
+        nxt = text[i + 1:i + 2]
+        if not nxt and not final and char in "$-/":
+            # token de dos caracteres partido entre bloques
+            raise _Incomplete
+        pos = i + 1
+
+        if char == ";":
+            if depth == 0 and not declaring:
+                return i, i + 1, comments
+        elif char == "'":
+            end = _SINGLE_QUOTED_REST.match(text, pos)
+            if end.group(1) is None:
+                if not final:
+                    raise _Incomplete
+                return n, n, comments
+            pos = end.end()
+        elif char == '"':
+            end = text.find('"', pos)
+            if end == -1:
+                if not final:
+                    raise _Incomplete
+                return n, n, comments
+            pos = end + 1
+        elif char == "$":
+            if nxt == "$":
+                end = text.find("$$", i + 2)
+                if end == -1:
+                    if not final:
+                        raise _Incomplete
+                    return n, n, comments
+                pos = end + 2
+        elif char in "-/" and nxt == char:
+            end = text.find("\n", i)
+            if end == -1:
+                if not final:
+                    raise _Incomplete
+                end = n
+            comments.append((i, end))
+            pos = end
+        elif char == "/" and nxt == "*":
+            end = text.find("*/", i + 2)
+            if end == -1:
+                if not final:
+                    raise _Incomplete
+                comments.append((i, n))
+                return n, n, comments
+            comments.append((i, end + 2))
+            pos = end + 2
+        elif char.isalpha():
+            if not final and match.end() == n:
+                raise _Incomplete
+            pos = match.end()
+            word = match.group().upper()
+            following = _NEXT_WORD.match(text, pos)
+            if not final and following is not None and following.end() == n:
+                raise _Incomplete
+            following_word = following.group(1).upper() if following else None
+            if word == "DECLARE":
+                if depth == 0:
+                    declaring = True
+            elif word == "BEGIN":
+                if following_word not in _NOT_BLOCK_BEGIN:
+                    depth += 1
+                    declaring = False
+            elif word == "CASE":
+                depth += 1
+            elif following_word in _END_OF_STATEMENT_BLOCK:
+                pos = following.end()
+            else:
+                if following_word == "CASE":
+                    pos = following.end()
+                depth = max(depth - 1, 0)
+
+
+def split_statements(text: str, pos: int = 0, final: bool = True) -> Iterator[Tuple[int, int, int, List[Span]]]:
+    """
+    Divide text en sentencias de Snowflake sin copiar el texto. Devuelve (inicio, fin,
+    siguiente, comentarios): la sentencia es text[inicio:fin] sin espacios ni comentarios
+    al principio ni el ';' final, siguiente es la posicion tras el ';' y comentarios los
+    tramos de comentarios que contiene. Respeta literales '...' y "...", cuerpos $$,
+    comentarios --, // y /* */, y bloques DECLARE/BEGIN ... END. Si final es False, la
+    ultima sentencia sin terminar no se devuelve porque puede seguir en el siguiente bloque.
+    """
+    n = len(text)
+    while pos < n:
+        start = _LEADING.match(text, pos).end()
+        if start >= n:
+            return
+        if not final and text.startswith("/*", start):
+            # comentario inicial sin cerrar en este bloque
+            return
+        try:
+            end, pos, comments = _scan_statement(text, start, final)
+        except _Incomplete:
+            return
+        terminated = end < n
+        end = _rstrip_end(text, start, end)
+        if not terminated:
+            # ultima sentencia sin ';': termina en su ultimo caracter
+            if end > start:
+                yield start, end, end, comments
+            return
+        if end > start:
+            yield start, end, pos, comments
+
+
+def statement_text(text: str, start: int, end: int, comments: List[Span]) -> str:
+    """Texto de una sentencia devuelta por split_statements, sin sus comentarios."""
+    if not comments:
+        return text[start:end]
+    parts = []
+    for comment_start, comment_end in comments:
+        if comment_start >= end:
+            break
+        parts.append(text[start:comment_start])
+        start = comment_end
+    if start < end:
+        parts.append(text[start:end])
+    return "".join(parts).strip()
+
+
+def split(text: str) -> List[str]:
+    """Sentencias de text sin comentarios, como una lista de cadenas."""
+    return [statement_text(text, start, end, comments) for start, end, _, comments in split_statements(text)]
@@ -0,0 +1,165 @@
+import contextlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+
+# numero maximo de parametros por consulta (limite por defecto de sqlite)
+_SQLITE_BATCH_SIZE = 900
+
+
+def normalizar_objeto(obj_name: Optional[str]) -> str:
+    """Clave de busqueda de un objeto: sin comillas y en mayusculas."""
+    if not obj_name:
+        return ""
+    return ".".join(part.strip('"').strip("'") for part in obj_name.split(".")).upper()
+
+
+class LineageProvider:
+    """
+    Interfaz de un proveedor de linaje. lookup_many recibe los nombres de objeto ya
+    normalizados y devuelve, para cada uno, si tiene linaje.
+    """
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        raise NotImplementedError
+
+    def lookup(self, obj_name: str) -> bool:
+        return self.lookup_many([obj_name])[obj_name]
+
+
+class CachedLineageProvider(LineageProvider):
+    """
+    Cache LRU con caducidad delante de otro proveedor. Las claves que no estan en cache
+    (o han caducado) se piden al proveedor en una sola llamada.
+    """
+
+    def __init__(self, provider: LineageProvider, ttl: float = 300.0, max_entries: int = 100_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, bool]]" = OrderedDict()
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        now = self.clock()
+        result = {}
+        pendientes: Dict[str, None] = {}
+        for obj_name in objects:
+            if obj_name in result:
+                continue
+            entry = self._entries.get(obj_name)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(obj_name)
+                result[obj_name] = entry[1]
+                self.hits += 1
+            else:
+                pendientes[obj_name] = None
+
+        if pendientes:
+            self.misses += len(pendientes)
+            encontrados = self.provider.lookup_many(list(pendientes))
+            expires = now + self.ttl
+            for obj_name in pendientes:
+                has_lineage = bool(encontrados.get(obj_name, False))
+                result[obj_name] = has_lineage
+                self._entries[obj_name] = (expires, has_lineage)
+                self._entries.move_to_end(obj_name)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return result
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class FileLineageProvider(LineageProvider):
+    """
+    Proveedor local a partir de un JSON: un objeto {"DB.SCHEMA.TABLA": true, ...} o una
+    lista con los objetos que tienen linaje. Lo que no aparece se considera sin linaje.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        data = json.loads(self.path.read_text())
+        if isinstance(data, dict):
+            self._lineage = {normalizar_objeto(k): bool(v) for k, v in data.items()}
+        else:
+            self._lineage = {normalizar_objeto(k): True for k in data}
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        return {obj_name: self._lineage.get(obj_name, False) for obj_name in objects}
+
+
+class SQLiteLineageProvider(LineageProvider):
+    """
+    Proveedor local sobre una base sqlite con la tabla lineage(object, has_lineage), creada
+    con create(). Cada lookup_many resuelve todos los objetos con consultas IN por lotes.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        import sqlite3  # solo se carga si se usa una base sqlite
+
+        self.path = str(path)
+        try:
+            # mode=rw: una ruta equivocada falla en lugar de crear una base vacia
+            conn = sqlite3.connect(f"file:{self.path}?mode=rw", uri=True, check_same_thread=False)
+        except sqlite3.Error as e:
+            raise OSError(f"no se pudo abrir la base de linaje {self.path}: {e}") from e
+        try:
+            conn.execute("SELECT object, has_lineage FROM lineage LIMIT 1").fetchall()
+        except sqlite3.Error as e:
+            conn.close()
+            raise OSError(f"{self.path} no es una base de linaje: {e}") from e
+        # el scorer consulta desde su hilo; la conexion se comparte con un lock
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path: Union[str, Path]) -> "SQLiteLineageProvider":
+        """Crea la base (si no existe) con la tabla lineage y la abre."""
+        import sqlite3
+
+        with contextlib.closing(sqlite3.connect(str(path))) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS lineage (object TEXT PRIMARY KEY, has_lineage INTEGER NOT NULL)")
+        return cls(path)
+
+    def store(self, lineage: Dict[str, bool]) -> None:
+        """Inserta o actualiza el linaje de varios objetos."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO lineage (object, has_lineage) VALUES (?, ?)",
+                [(normalizar_objeto(k), int(bool(v))) for k, v in lineage.items()],
+            )
+
+    def lookup_many(self, objects: Iterable[str]) -> Dict[str, bool]:
+        objects = list(dict.fromkeys(objects))
+        result = {obj_name: False for obj_name in objects}
+        for start in range(0, len(objects), _SQLITE_BATCH_SIZE):
+            batch = objects[start:start + _SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT object, has_lineage FROM lineage WHERE object IN ({placeholders})", batch
+                ).fetchall()
+            for obj_name, has_lineage in rows:
+                result[obj_name] = bool(has_lineage)
+        return result
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def open_lineage_provider(path: Union[str, Path]) -> LineageProvider:
+    """Abre un proveedor local segun la extension: .json o base sqlite."""
+    if str(path).lower().endswith(".json"):
+        return FileLineageProvider(path)
+    return SQLiteLineageProvider(path)
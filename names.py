@@ -0,0 +1,94 @@
+"""
+Resolucion de nombres de objeto: cada nombre se completa con la base de datos y el esquema
+activos (USE DATABASE / USE SCHEMA) y el nombre completo se interna en una tabla de simbolos
+compartida, de modo que el linaje, la deduplicacion y la agregacion entre ficheros trabajan
+con enteros en lugar de volver a partir y normalizar cadenas.
+"""
+import functools
+import threading
+from typing import Dict, List, Optional
+
+from lineage import normalizar_objeto
+
+# esquema que queda activo tras USE DATABASE si no se indica otro
+DEFAULT_SCHEMA = "PUBLIC"
+# nombres internados a partir de los cuales un proceso de larga duracion (el servidor) vacia la tabla
+SYMBOLS_MAX_DEFAULT = 200_000
+
+
+def qualify(obj_name: Optional[str], database: Optional[str] = None, schema: Optional[str] = None) -> str:
+    """
+    Nombre completo y normalizado de un objeto: las partes que faltan se toman del contexto
+    (con USE DATABASE y sin USE SCHEMA, el esquema es PUBLIC). Sin contexto se deja como esta.
+    """
+    parts = normalizar_objeto(obj_name).split(".")
+    if len(parts) == 1 and parts[0]:
+        if schema:
+            parts.insert(0, schema)
+        elif database:
+            parts.insert(0, DEFAULT_SCHEMA)
+    if len(parts) == 2 and database:
+        parts.insert(0, database)
+    return ".".join(parts)
+
+
+class SymbolTable:
+    """
+    Tabla de nombres internados: cada nombre distinto recibe un id entero, estable hasta que
+    se vacia la tabla. generation cambia al vaciarla: los ids de una generacion no valen en otra.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def intern(self, name: str) -> int:
+        symbol = self._ids.get(name)
+        if symbol is None:
+            with self._lock:
+                symbol = self._ids.get(name)
+                if symbol is None:
+                    symbol = self._ids[name] = len(self._names)
+                    self._names.append(name)
+        return symbol
+
+    def get(self, name: str) -> Optional[int]:
+        """Id de un nombre ya internado, o None; no da de alta el nombre."""
+        return self._ids.get(name)
+
+    def name(self, symbol: int) -> str:
+        return self._names[symbol]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids = {}
+            self._names = []
+            self.generation += 1
+
+
+# tabla del proceso; los ids no se guardan ni se envian a otros procesos, solo los nombres
+SYMBOLS = SymbolTable()
+
+
+@functools.lru_cache(maxsize=65536)
+def resolve(obj_name: Optional[str], database: Optional[str] = None, schema: Optional[str] = None) -> int:
+    """Id en SYMBOLS del nombre completo de obj_name en el contexto indicado."""
+    return SYMBOLS.intern(qualify(obj_name, database, schema))
+
+
+def reset_symbols(max_symbols: int = 0) -> bool:
+    """
+    Vacia SYMBOLS y la cache de resolve si la tabla tiene mas de max_symbols nombres. Solo
+    puede llamarse entre ejecuciones, cuando nadie guarda ids: el grafo de depgraph ve el
+    cambio de generacion y se vuelve a leer.
+    """
+    if len(SYMBOLS) <= max_symbols:
+        return False
+    resolve.cache_clear()
+    SYMBOLS.clear()
+    return True
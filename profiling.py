@@ -0,0 +1,195 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# variable de entorno que activa el perfilado: "1" o la ruta del JSON a escribir
+PROFILE_ENV_VAR = "SQL_RISK_PROFILE"
+PROFILE_OUTPUT_DEFAULT = "sql_risk_profile.json"
+
+# numero de ficheros mas lentos que se guardan en el resumen
+_SLOWEST_FILES = 10
+
+
+class _Stage:
+    """Context manager que suma el tiempo de pared de una etapa al salir."""
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    Tiempos de pared y numero de llamadas por etapa, contadores y tiempo de cada fichero.
+    Las etapas pueden anidarse: cada una mide su tiempo inclusivo. Es seguro usarlo desde
+    varios hilos (el linaje se consulta en segundo plano).
+    """
+
+    enabled = True
+
+    def __init__(self, output: Optional[str] = None):
+        self.output = output
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.files: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def iter_stage(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """Recorre iterable sumando a la etapa el tiempo de producir cada elemento."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [seconds, calls]
+            else:
+                stage[0] += seconds
+                stage[1] += calls
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_file(self, path: str, seconds: float) -> None:
+        with self._lock:
+            self.files[path] = self.files.get(path, 0.0) + seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado en bruto, para enviarlo desde un proceso del pool y sumarlo con merge()."""
+        with self._lock:
+            return {
+                "stages": {k: list(v) for k, v in self.stages.items()},
+                "counters": dict(self.counters),
+                "files": dict(self.files),
+            }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        for name, (seconds, calls) in snapshot["stages"].items():
+            self.add_time(name, seconds, calls)
+        for name, n in snapshot["counters"].items():
+            self.count(name, n)
+        for path, seconds in snapshot["files"].items():
+            self.record_file(path, seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.perf_counter()
+            self.stages.clear()
+            self.counters.clear()
+            self.files.clear()
+
+    def to_dict(self, slowest: int = _SLOWEST_FILES) -> Dict[str, Any]:
+        data = self.snapshot()
+        ficheros = sorted(data["files"].items(), key=lambda item: item[1], reverse=True)[:slowest]
+        return {
+            "segundos_totales": round(time.perf_counter() - self.started, 6),
+            "etapas": {
+                name: {"segundos": round(seconds, 6), "llamadas": int(calls)}
+                for name, (seconds, calls) in sorted(data["stages"].items(), key=lambda item: -item[1][0])
+            },
+            "contadores": dict(sorted(data["counters"].items())),
+            "ficheros_mas_lentos": [{"archivo": path, "segundos": round(seconds, 6)} for path, seconds in ficheros],
+        }
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """Escribe el resumen en JSON y devuelve la ruta usada."""
+        path = path or self.output or PROFILE_OUTPUT_DEFAULT
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        return path
+
+
+class _NullProfiler:
+    """Perfilador desactivado: todas las operaciones son no-ops."""
+
+    enabled = False
+    output = None
+
+    _NULL_STAGE = contextlib.nullcontext()
+
+    def stage(self, name: str):
+        return self._NULL_STAGE
+
+    def iter_stage(self, name: str, iterable: Iterable[T]) -> Iterable[T]:
+        return iterable
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        pass
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def record_file(self, path: str, seconds: float) -> None:
+        pass
+
+    def snapshot(self) -> None:
+        return None
+
+    def merge(self, snapshot) -> None:
+        pass
+
+    def reset(self) -> None:
+        pass
+
+
+_NULL_PROFILER = _NullProfiler()
+_profiler = _NULL_PROFILER
+
+
+def get_profiler():
+    """Perfilador activo, o uno que no hace nada si el perfilado esta desactivado."""
+    return _profiler
+
+
+def enable_profiling(output: Optional[str] = None) -> Profiler:
+    """
+    Activa el perfilado en este proceso y en los procesos del pool que se creen despues
+    (a traves de la variable de entorno). output es la ruta del JSON que se escribira.
+    """
+    global _profiler
+    _profiler = Profiler(output)
+    os.environ[PROFILE_ENV_VAR] = output or "1"
+    return _profiler
+
+
+def disable_profiling() -> None:
+    global _profiler
+    _profiler = _NULL_PROFILER
+    os.environ.pop(PROFILE_ENV_VAR, None)
+
+
+def _enable_from_env() -> None:
+    value = os.environ.get(PROFILE_ENV_VAR, "")
+    if value and value != "0":
+        enable_profiling(None if value == "1" else value)
+
+
+_enable_from_env()
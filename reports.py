@@ -0,0 +1,212 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+
+# riesgos que se consideran operaciones con riesgo en el informe
+RIESGOS_REPORTADOS = ("MEDIA", "ALTA")
+
+_SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+_SARIF_LEVELS = {"ALTA": "error", "MEDIA": "warning"}
+
+
+class Report:
+    """
+    Interfaz de un informe. add_finding recibe cada hallazgo en cuanto tiene riesgo (no
+    necesariamente en orden), add_error los fallos y close escribe lo que quede pendiente.
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.errors: List[Tuple[Optional[str], str]] = []
+
+    def add_finding(self, sql_file: str, index: int, finding) -> None:
+        raise NotImplementedError
+
+    def add_error(self, sql_file: Optional[str], error: str) -> None:
+        self.errors.append((sql_file, error))
+
+    def close(self, sql_files: List[str]) -> None:
+        pass
+
+
+class _BufferedReport(Report):
+    """Informe que guarda los hallazgos y los escribe al final, ordenados por fichero."""
+
+    def __init__(self, stream: TextIO, only_risky: bool):
+        super().__init__(stream)
+        self.only_risky = only_risky
+        self._by_file: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+
+    def add_finding(self, sql_file: str, index: int, finding) -> None:
+        if self.only_risky and finding.riesgo not in RIESGOS_REPORTADOS:
+            return
+        self._by_file.setdefault(sql_file, []).append((index, finding.to_dict()))
+
+    def findings_by_file(self, sql_files: List[str]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        result = []
+        for sql_file in sql_files:
+            findings = self._by_file.get(sql_file)
+            if findings:
+                result.append((sql_file, [f for _, f in sorted(findings, key=lambda item: item[0])]))
+        return result
+
+
+class TextReport(_BufferedReport):
+    """Informe en texto para la consola del CI."""
+
+    def __init__(self, stream: TextIO):
+        super().__init__(stream, only_risky=True)
+
+    def add_error(self, sql_file: Optional[str], error: str) -> None:
+        super().add_error(sql_file, error)
+        if sql_file is None:
+            self._print(f"Error consultando el linaje: {error}\n")
+        else:
+            self._print(f"Error analizando {sql_file}: {error}\n")
+
+    def _print(self, *args) -> None:
+        print(*args, file=self.stream)
+
+    def close(self, sql_files: List[str]) -> None:
+        if self.errors:
+            return
+        risky_files = self.findings_by_file(sql_files)
+        if not risky_files:
+            self._print("   No se detectaron operaciones de alto riesgo")
+            return
+
+        self._print("\nSe han detectado operaciones con riesgo")
+
+        for sql_file, sentences in risky_files:
+            self._print(f"\nArchivo: {sql_file}")
+            self._print(f"   Total de operaciones con riesgo: {len(sentences)}\n")
+
+            for i, sentence_info in enumerate(sentences, 1):
+                self._print(f"\n Operación {i} - Riesgo: {sentence_info['riesgo']}")
+                self._print(f"   Acción: {sentence_info['accion']}")
+                if sentence_info['objeto']:
+                    self._print(f"   Objeto: {sentence_info['objeto']}")
+                if sentence_info['columna']:
+                    self._print(f"   Columna: {sentence_info['columna']}")
+
+                if 'object_info' in sentence_info and sentence_info['object_info']:
+                    obj_info = sentence_info['object_info']
+                    self._print(f"   Nivel de cualificación: {obj_info.get('qualification_level', 'N/A')}")
+                    if obj_info.get('database'):
+                        self._print(f"   Database explícita: {obj_info['database']}")
+                    if obj_info.get('schema'):
+                        self._print(f"   Schema explícito: {obj_info['schema']}")
+                    if obj_info.get('inside_procedure'):
+                        self._print(f"   Dentro del procedimiento: {obj_info['inside_procedure']}")
+                    if obj_info.get('from_variable'):
+                        self._print(f"   Origen: Asignación de variable")
+                    ctx = obj_info.get('current_context', {})
+                    if ctx.get('database') or ctx.get('schema'):
+                        self._print(f"   Contexto activo -> Database: {ctx.get('database', 'N/A')}, Schema: {ctx.get('schema', 'N/A')}")
+
+
+class JsonReport(_BufferedReport):
+    """Un unico documento JSON con todos los hallazgos agrupados por fichero."""
+
+    def __init__(self, stream: TextIO):
+        super().__init__(stream, only_risky=False)
+
+    def close(self, sql_files: List[str]) -> None:
+        archivos = [
+            {
+                "archivo": sql_file,
+                "hay_riesgo": any(f["riesgo"] in RIESGOS_REPORTADOS for f in findings),
+                "hallazgos": findings,
+            }
+            for sql_file, findings in self.findings_by_file(sql_files)
+        ]
+        document = {
+            "hay_riesgo": any(a["hay_riesgo"] for a in archivos),
+            "archivos": archivos,
+            "errores": [{"archivo": sql_file, "error": error} for sql_file, error in self.errors],
+        }
+        json.dump(document, self.stream, ensure_ascii=False, indent=2)
+        self.stream.write("\n")
+
+
+class NdjsonReport(Report):
+    """Una linea JSON por hallazgo, escrita en cuanto el hallazgo tiene riesgo."""
+
+    def add_finding(self, sql_file: str, index: int, finding) -> None:
+        record = {"archivo": sql_file, "indice": index}
+        record.update(finding.to_dict())
+        self._write(record)
+
+    def add_error(self, sql_file: Optional[str], error: str) -> None:
+        super().add_error(sql_file, error)
+        self._write({"archivo": sql_file, "error": error})
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self.stream.write(json.dumps(record, ensure_ascii=False))
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+class SarifReport(_BufferedReport):
+    """Informe SARIF 2.1.0 con las operaciones de riesgo MEDIA y ALTA."""
+
+    def __init__(self, stream: TextIO, tool_version: str):
+        super().__init__(stream, only_risky=True)
+        self.tool_version = tool_version
+
+    def close(self, sql_files: List[str]) -> None:
+        rules: Dict[str, Dict[str, Any]] = {}
+        results = []
+        for sql_file, findings in self.findings_by_file(sql_files):
+            uri = Path(sql_file).as_posix()
+            if uri.startswith("./"):
+                uri = uri[2:]
+            for finding in findings:
+                accion = finding["accion"]
+                rules.setdefault(accion, {"id": accion, "shortDescription": {"text": accion}})
+                objeto = f" sobre {finding['objeto']}" if finding["objeto"] else ""
+                results.append({
+                    "ruleId": accion,
+                    "level": _SARIF_LEVELS[finding["riesgo"]],
+                    "message": {"text": f"{accion}{objeto} (riesgo {finding['riesgo']})"},
+                    "locations": [{"physicalLocation": {"artifactLocation": {"uri": uri}}}],
+                    "properties": finding,
+                })
+
+        document = {
+            "$schema": _SARIF_SCHEMA,
+            "version": "2.1.0",
+            "runs": [{
+                "tool": {"driver": {
+                    "name": "sql-script-risk-detector",
+                    "version": self.tool_version,
+                    "rules": list(rules.values()),
+                }},
+                "invocations": [{
+                    "executionSuccessful": not self.errors,
+                    "toolExecutionNotifications": [
+                        {"level": "error", "message": {"text": f"{sql_file or 'linaje'}: {error}"}}
+                        for sql_file, error in self.errors
+                    ],
+                }],
+                "results": results,
+            }],
+        }
+        json.dump(document, self.stream, ensure_ascii=False, indent=2)
+        self.stream.write("\n")
+
+
+FORMATS = ("text", "json", "ndjson", "sarif")
+
+
+def create_report(output_format: str, stream: TextIO, tool_version: str) -> Report:
+    if output_format == "text":
+        return TextReport(stream)
+    if output_format == "json":
+        return JsonReport(stream)
+    if output_format == "ndjson":
+        return NdjsonReport(stream)
+    if output_format == "sarif":
+        return SarifReport(stream, tool_version)
+    raise ValueError(f"formato de informe desconocido: {output_format}")
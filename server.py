@@ -0,0 +1,324 @@
+"""
+Servidor de analisis para pre-commit y editores: un proceso que mantiene el analizador
+importado, una cache de resultados en memoria (delante de la de disco) y los proveedores de
+linaje ya abiertos, y atiende peticiones por un socket Unix local. Las peticiones llevan los
+mismos argumentos que ci_silver_gold.py y las envia client.py.
+
+    python ci_silver_gold.py serve [--socket RUTA] [--idle-timeout SEGUNDOS]
+
+Protocolo: una linea JSON por conexion y una linea JSON de respuesta.
+    {"argv": [...], "cwd": "...", "env": {...}, "texto": "...", "nombre": "x.sql"}
+        -> {"codigo": 0, "stdout": "...", "stderr": "..."}
+    {"comando": "ping" | "stats" | "stop"}
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import ci_silver_gold
+from ci_silver_gold import (SPLITTER_ENV_VAR, ResultCache, TemplateContext, _parse_args, ejecutar_cli,
+                            enable_statement_memo, set_template_variables)
+from catalog import CATALOG_ENV_VAR
+from client import default_socket_path
+from depgraph import GRAPH_ENV_VAR
+from lineage import CachedLineageProvider, LineageProvider, open_lineage_provider
+from names import SYMBOLS, SYMBOLS_MAX_DEFAULT, reset_symbols
+from profiling import disable_profiling, enable_profiling
+
+# entradas de la cache de resultados en memoria
+_MEMORY_CACHE_ENTRIES_DEFAULT = 10_000
+# tamaño maximo de una peticion
+_MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+class MemoryResultCache(ResultCache):
+    """
+    Cache LRU de resultados en memoria, con las mismas claves que ResultCache. Si se indica
+    disk, se consulta cuando la entrada no esta en memoria y se escribe tambien en ella.
+    """
+
+    def __init__(self, max_entries: int = _MEMORY_CACHE_ENTRIES_DEFAULT,
+                 disk: Optional[ResultCache] = None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self.disk.get(key) if self.disk is not None else None
+        if entry is not None:
+            self._store(key, entry)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self._store(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, entry)
+
+    def _store(self, key: str, entry: Dict[str, Any]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def evict(self) -> None:
+        if self.disk is not None:
+            self.disk.evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _source_mtimes() -> Tuple[Tuple[str, int], ...]:
+    """
+    Nombre y fecha de modificacion de cada modulo .py del analizador, para detectar cambios
+    de codigo; un modulo nuevo o borrado tambien cuenta como cambio.
+    """
+    directory = Path(ci_silver_gold.__file__).resolve().parent
+    mtimes = []
+    for path in sorted(directory.glob("*.py")):
+        try:
+            mtimes.append((path.name, path.stat().st_mtime_ns))
+        except OSError:
+            # borrado entre el listado y el stat
+            continue
+    return tuple(mtimes)
+
+
+@contextlib.contextmanager
+def _env_var(name: str, value: Optional[str]) -> Iterator[None]:
+    """Fija una variable de entorno durante una peticion y deja el entorno como estaba."""
+    previous = os.environ.get(name)
+    if value:
+        os.environ[name] = value
+    else:
+        os.environ.pop(name, None)
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = previous
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        line = self.rfile.readline(_MAX_REQUEST_BYTES)
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("la peticion debe ser un objeto JSON")
+        except ValueError as e:
+            response: Dict[str, Any] = {"error": f"peticion no valida: {e}"}
+        else:
+            response = self.server.dispatch(request)
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class AnalysisServer(socketserver.UnixStreamServer):
+    """
+    Atiende las peticiones de una en una: el analisis usa el directorio de trabajo y la salida
+    estandar del proceso. Si pasan idle_timeout segundos sin peticiones, o se cambia el codigo
+    del analizador, el servidor termina.
+    """
+
+    def __init__(self, socket_path: str, idle_timeout: Optional[float] = None,
+                 cache_entries: int = _MEMORY_CACHE_ENTRIES_DEFAULT, max_symbols: int = SYMBOLS_MAX_DEFAULT):
+        self.socket_path = socket_path
+        self.timeout = idle_timeout
+        self.cache = MemoryResultCache(cache_entries)
+        # nombres de objeto internados que se mantienen entre peticiones
+        self.max_symbols = max_symbols
+        # un fichero editado vuelve con casi todas sus sentencias iguales: se guardan todas
+        # desde la primera vez, para que el siguiente analisis ya acierte
+        self.statement_memo = enable_statement_memo(admit_all=True)
+        # proveedores de linaje abiertos: (ruta, fecha del fichero, ttl) -> proveedor con cache
+        self.lineage_providers: Dict[Tuple[str, int, float], CachedLineageProvider] = {}
+        self.requests = 0
+        self.started = time.monotonic()
+        self._mtimes = _source_mtimes()
+        self._stop = False
+        super().__init__(socket_path, _RequestHandler)
+
+    def server_bind(self) -> None:
+        _remove_stale_socket(self.socket_path)
+        # el socket solo es accesible para el usuario que arranca el servidor
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+    def serve(self) -> None:
+        try:
+            while not self._stop:
+                self.handle_request()
+        finally:
+            self.server_close()
+            with contextlib.suppress(OSError):
+                os.unlink(self.socket_path)
+
+    def handle_timeout(self) -> None:
+        self._stop = True
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        comando = request.get("comando", "analizar")
+        if comando == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if comando == "stats":
+            return self.stats()
+        if comando == "stop":
+            self._stop = True
+            return {"ok": True}
+        if comando != "analizar":
+            return {"error": f"comando desconocido: {comando}"}
+
+        if _source_mtimes() != self._mtimes:
+            # el codigo en memoria ya no es el del disco: el cliente analiza por su cuenta
+            self._stop = True
+            return {"error": "el codigo del analizador ha cambiado; el servidor se detiene"}
+        self.requests += 1
+        try:
+            return self.analyze(request)
+        finally:
+            # entre peticiones nadie guarda ids de SYMBOLS: si la tabla ha crecido se vacia
+            reset_symbols(self.max_symbols)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "peticiones": self.requests,
+            "segundos_activo": round(time.monotonic() - self.started, 3),
+            "cache": {"entradas": len(self.cache), "aciertos": self.cache.hits, "fallos": self.cache.misses},
+            "sentencias": self.statement_memo.stats(),
+            "simbolos": len(SYMBOLS),
+            "linaje": [
+                {"fichero": path, "aciertos": provider.hits, "fallos": provider.misses}
+                for (path, _, _), provider in self.lineage_providers.items()
+            ],
+        }
+
+    def _lineage_provider(self, path: Optional[str], ttl: float) -> Optional[LineageProvider]:
+        if not path:
+            return None
+        path = os.path.abspath(path)
+        key = (path, os.stat(path).st_mtime_ns, ttl)
+        provider = self.lineage_providers.get(key)
+        if provider is None:
+            # si el fichero ha cambiado se descarta el proveedor anterior
+            for old_key in [k for k in self.lineage_providers if k[0] == path]:
+                del self.lineage_providers[old_key]
+            provider = CachedLineageProvider(open_lineage_provider(path), ttl=ttl)
+            self.lineage_providers[key] = provider
+        return provider
+
+    def analyze(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        codigo = 2
+        texto = request.get("texto")
+        nombre = os.path.basename(request.get("nombre") or "stdin.sql")
+        tmp_path = None
+        with contextlib.ExitStack() as stack, \
+                contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                args = _parse_args(list(request.get("argv", [])))
+                stack.enter_context(contextlib.chdir(request.get("cwd") or os.getcwd()))
+                if texto is not None:
+                    tmp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+                    tmp_path = os.path.join(tmp_dir, nombre)
+                    Path(tmp_path).write_text(texto, encoding="utf-8")
+                    args.archivos = list(args.archivos) + [tmp_path]
+                # los procesos del pool no verian la cache en memoria
+                args.jobs = 1
+                if args.profile:
+                    enable_profiling(args.profile)
+                    stack.callback(disable_profiling)
+
+                env = request.get("env")
+                stack.enter_context(_env_var(SPLITTER_ENV_VAR,
+                                             args.splitter or (env or os.environ).get(SPLITTER_ENV_VAR)))
+                stack.enter_context(_env_var(GRAPH_ENV_VAR, args.graph or (env or os.environ).get(GRAPH_ENV_VAR)))
+                stack.enter_context(_env_var(CATALOG_ENV_VAR,
+                                             args.catalog or (env or os.environ).get(CATALOG_ENV_VAR)))
+                template_ctx = TemplateContext(set_template_variables(env))
+                self.cache.disk = None if args.no_cache else ResultCache(args.cache_dir,
+                                                                         args.cache_max_mb * 1024 * 1024)
+                cache = None if args.no_cache else self.cache
+                lineage_provider = self._lineage_provider(args.lineage, args.lineage_ttl)
+                codigo = ejecutar_cli(args, template_ctx, cache, lineage_provider)
+            except SystemExit as e:
+                # argparse termina con SystemExit ante argumentos no validos
+                codigo = e.code if isinstance(e.code, int) else 2
+            except Exception as e:
+                print(f"Error en el servidor de analisis: {e}", file=sys.stderr)
+                codigo = 2
+
+        salida, errores = stdout.getvalue(), stderr.getvalue()
+        if tmp_path is not None:
+            # el informe muestra el nombre que envio el cliente, no el del fichero temporal
+            salida = salida.replace(tmp_path, nombre)
+            errores = errores.replace(tmp_path, nombre)
+        return {"codigo": codigo, "stdout": salida, "stderr": errores}
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    """Borra el socket de un servidor que ya no existe; falla si hay uno escuchando."""
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+            return
+    raise OSError(f"ya hay un servidor escuchando en {socket_path}")
+
+
+def _parse_serve_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="ci_silver_gold.py serve",
+                                     description="Servidor de analisis con las caches en memoria")
+    parser.add_argument("--socket", default=None,
+                        help="ruta del socket Unix (por defecto $SQL_RISK_SOCKET o uno por usuario)")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="segundos sin peticiones tras los que el servidor termina")
+    parser.add_argument("--cache-entries", type=int, default=_MEMORY_CACHE_ENTRIES_DEFAULT,
+                        help="ficheros analizados que se guardan en la cache en memoria")
+    parser.add_argument("--max-symbols", type=int, default=SYMBOLS_MAX_DEFAULT,
+                        help="nombres de objeto internados a partir de los cuales se vacia la tabla")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_serve_args(argv)
+    socket_path = args.socket or default_socket_path()
+    try:
+        server = AnalysisServer(socket_path, args.idle_timeout, args.cache_entries, args.max_symbols)
+    except OSError as e:
+        print(f"No se pudo arrancar el servidor: {e}", file=sys.stderr)
+        return 1
+    print(f"Servidor de analisis escuchando en {socket_path}", file=sys.stderr)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    return 0
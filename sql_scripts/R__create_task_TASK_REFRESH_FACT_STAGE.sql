@@ -0,0 +1,19 @@
+CREATE OR REPLACE TASK db_example.gold.task_scripting
+  WAREHOUSE = wh_compute
+  SCHEDULE = 'USING CRON 0 2 * * * UTC'
+AS
+BEGIN
+  TRUNCATE TABLE db_example.gold.fact_stage;
+  INSERT INTO db_example.gold.fact_stage SELECT * FROM db_example.silver.fact_raw;
+END;
+
+CREATE OR REPLACE FUNCTION db_example.gold.fn_limpia_stage()
+  RETURNS VARCHAR
+  LANGUAGE SQL
+AS
+BEGIN
+  DELETE FROM db_example.gold.fact_stage WHERE fecha < CURRENT_DATE - 30;
+  RETURN 'ok';
+END;
+
+DROP TABLE db_example.gold.fact_old;